@@ -0,0 +1,49 @@
+"""
+Benchmark of the accompaniment search engines: the evolutionary algorithm against the exact dynamic programming
+solver on the sample melodies. Wall time and achieved fitness (as calculated by the evolutionary algorithm)
+are printed for every file.
+Run from the repository root: python -m benchmarks.engines [--generations N] [--population N] [--rests]
+"""
+import argparse
+import glob
+import time
+
+from core.generator import *
+
+
+def run_engine(melody: Melody, engine: str, arguments):
+    """
+    Function to find the best accompaniment with one engine and measure the time
+    :param melody: the melody to accompany
+    :param engine: 'ea' or 'dp'
+    :param arguments: parsed command line arguments with the parameters of evolutionary algorithm
+    :return: wall time in seconds and fitness of the found accompaniment
+    """
+    generator = GeneratorOfAccompaniment(melody, arguments.generations, arguments.population,
+                                         arguments.percentage, engine=engine, seed=arguments.seed)
+    start = time.perf_counter()
+    accompaniment = generator.get_best_accompaniment()
+    elapsed = time.perf_counter() - start
+    return elapsed, generator.ea.calculate_fitness(accompaniment)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the evolutionary algorithm and dynamic programming engines')
+    parser.add_argument('files', nargs='*', default=sorted(glob.glob('samples/*.mid')), help='input .mid files')
+    parser.add_argument('--generations', type=int, default=100, help='number of generations of the EA')
+    parser.add_argument('--population', type=int, default=1000, help='population size of the EA')
+    parser.add_argument('--percentage', type=int, default=30, help='new members percentage of the EA')
+    parser.add_argument('--rests', action='store_true', help='allow rest chords')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the EA')
+    arguments = parser.parse_args()
+    print('{:<24} {:>6} {:>6} {:>10} {:>12}'.format('file', 'bars', 'engine', 'time, s', 'fitness'))
+    for input_file in arguments.files:
+        melody = load_melody(input_file, arguments.rests)
+        for engine in (EVOLUTIONARY_ENGINE, DYNAMIC_PROGRAMMING_ENGINE):
+            elapsed, fitness = run_engine(melody, engine, arguments)
+            print('{:<24} {:>6} {:>6} {:>10.3f} {:>12.2f}'.format(input_file, melody.size_in_bars, engine,
+                                                                  elapsed, fitness))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark of the start-up (import) time: every module is imported in a fresh interpreter several times,
+the median wall time and whether music21 was loaded by the import are printed.
+Run from the repository root: python -m benchmarks.startup [--repeats N]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = ['core.music_units', 'core.fitness', 'core.evolutionary_algorithm', 'core.dynamic_programming',
+           'core.generator', 'core.midi_io', 'core.interface', 'music21']
+PROBE = ('import sys, time; start = time.perf_counter(); import {module}; '
+         'print(time.perf_counter() - start, "music21" in sys.modules)')
+
+
+def measure_import(module: str):
+    """
+    Function to import the module in a fresh interpreter
+    :param module: full name of the module
+    :return: import time in seconds and whether music21 was imported
+    """
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], capture_output=True, text=True,
+                            check=True).stdout.split()
+    return float(output[0]), output[1] == 'True'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the modules')
+    parser.add_argument('--repeats', type=int, default=5, help='number of imports of every module')
+    arguments = parser.parse_args()
+    print('{:<30} {:>12} {:>16}'.format('module', 'import, s', 'loads music21'))
+    for module in MODULES:
+        results = [measure_import(module) for r in range(arguments.repeats)]
+        print('{:<30} {:>12.3f} {:>16}'.format(module, statistics.median(result[0] for result in results),
+                                               str(results[0][1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark suite on synthetic melodies: for every length (in bars), key and rests permission the melody is generated
+in that key, written to the MIDI file and processed stage by stage. The time of every stage (reading the file,
+the duration matrix, determine_key and Key.get_chords of the Melody, evolution and rendering; the stages do not
+overlap), evaluations and generations per second, peak memory of the evolution and the fitness reached are saved
+as JSON, so the runs can be compared across versions.
+Everything is seeded, the same arguments give the same melodies and the same fitness.
+Run from the repository root: python -m benchmarks.suite [--bars N ...] [--keys K ...] [--output FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from core.generator import *
+
+BARS = [8, 64, 512, 5000]
+KEYS = ['C', 'Am', 'F#', 'D#m', 'A#', 'Gm']
+# Durations (in quarters) of the synthetic notes and the probability of the rest instead of the note:
+DURATIONS = [0.5, 0.5, 1.0, 1.0, 1.0, 2.0]
+REST_PROBABILITY = 0.15
+
+
+def synthetic_notes(key_name: str, size_in_bars: int, rests: bool, seed: int):
+    """
+    Function to generate the melody in the key: random scale notes (the tonic comes first and last)
+    of random durations, with the rests between them if allowed
+    :param key_name: name of the key (e.g. C#m or F)
+    :param size_in_bars: length of the melody in quarters
+    :param rests: put the rests into the melody or not
+    :param seed: random seed of the melody
+    :return: list of MIDI notes (starting tick, ending tick, MIDI pitch, velocity)
+    """
+    generator = random.Random(seed)
+    key = Key(key_name)
+    pitches = [60 + NOTE_NAMES.index(pitch) for pitch in key.cyclic_pitches]
+    notes = []
+    current_time = 0.0
+    while current_time < size_in_bars:
+        duration = min(generator.choice(DURATIONS), size_in_bars - current_time)
+        is_last = current_time + duration >= size_in_bars
+        if rests and notes and not is_last and generator.random() < REST_PROBABILITY:
+            current_time += duration
+            continue
+        pitch = pitches[0] if not notes or is_last else generator.choice(pitches) + 12 * generator.randint(-1, 1)
+        notes.append((round(current_time * TICKS_PER_QUARTER), round((current_time + duration) * TICKS_PER_QUARTER),
+                      pitch, generator.randint(60, 100)))
+        current_time += duration
+    return notes
+
+
+def write_melody_file(file_name: str, notes: list):
+    """
+    Function to write the MIDI file with the melody only (conductor track and one melody track)
+    :param file_name: name of the output .mid file
+    :param notes: list of MIDI notes (starting tick, ending tick, MIDI pitch, velocity)
+    :return: None
+    """
+    with open(file_name, 'wb') as midi_file:
+        midi_file.write(b'MThd' + struct.pack('>IHHH', 6, 1, 2, TICKS_PER_QUARTER))
+        write_track(midi_file, CONDUCTOR_EVENTS + write_variable_length(TICKS_PER_QUARTER) + b'\xff\x2f\x00')
+        write_track(midi_file, track_events(MELODY_INSTRUMENTS[0], 0, notes))
+
+
+def timed(function, *arguments):
+    """
+    :param function: function to call
+    :param arguments: its arguments
+    :return: result of the call and its wall time in seconds
+    """
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
+
+
+def run_case(directory: str, key_name: str, size_in_bars: int, rests: bool, arguments):
+    """
+    Function to generate one synthetic melody and measure all the stages of its processing
+    :param directory: directory for the temporary MIDI files
+    :param key_name: key of the synthetic melody
+    :param size_in_bars: length of the melody
+    :param rests: rests in the melody and rest chords in the accompaniment
+    :param arguments: parsed command line arguments
+    :return: dictionary with the results
+    """
+    input_file = os.path.join(directory, 'melody-{}-{}-{}.mid'.format(key_name, size_in_bars, int(rests)))
+    output_file = os.path.join(directory, 'output.mid')
+    write_melody_file(input_file, synthetic_notes(key_name, size_in_bars, rests, arguments.seed))
+    seconds = dict()
+    (notes, size), seconds['read'] = timed(read_midi_notes, input_file)
+    # the Melody constructor runs all the next stages, so it is not timed itself
+    melody = Melody(generate_rests=rests, notes=notes, size_in_bars=size)
+    _, seconds['duration_matrix'] = timed(melody.calculate_duration_matrix)
+    _, seconds['determine_key'] = timed(melody.determine_key)
+    Key.vocabularies.pop((melody.key.name, rests), None)
+    chords, seconds['get_chords'] = timed(melody.key.get_chords, rests)
+    generator = GeneratorOfAccompaniment(melody, arguments.generations, arguments.population, arguments.percentage,
+                                         compact_population_ea=arguments.compact, seed=arguments.seed)
+    accompaniment, seconds['evolve'] = timed(generator.get_best_accompaniment)
+    _, seconds['render'] = timed(generator.generate_midi_accompaniment, output_file, 0, accompaniment)
+    evaluations = sum(generator.ea.evaluations_per_generation)
+    generations = len(generator.ea.evaluations_per_generation) - 1
+    result = {'key': key_name, 'determined_key': melody.key.name, 'bars': melody.size_in_bars, 'rests': rests,
+              'notes': len(melody.notes), 'chords': len(chords), 'seconds': seconds,
+              'evaluations': evaluations, 'generations': generations,
+              'evaluations_per_second': evaluations / seconds['evolve'],
+              'generations_per_second': generations / seconds['evolve'],
+              'fitness': generator.ea.calculate_fitness(accompaniment)}
+    if arguments.memory:
+        # the search is repeated with the same seed under tracemalloc, which slows it down
+        generator = GeneratorOfAccompaniment(melody, arguments.generations, arguments.population,
+                                             arguments.percentage, compact_population_ea=arguments.compact,
+                                             seed=arguments.seed)
+        tracemalloc.start()
+        generator.get_best_accompaniment()
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def environment():
+    """
+    :return: dictionary describing the versions of the interpreter, numpy and the code
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+            'commit': commit}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark all the stages on synthetic melodies')
+    parser.add_argument('--bars', type=int, nargs='+', default=BARS, help='lengths of the melodies')
+    parser.add_argument('--keys', nargs='+', default=KEYS, help='keys of the melodies')
+    parser.add_argument('--generations', type=int, default=20, help='number of generations of the EA')
+    parser.add_argument('--population', type=int, default=200, help='population size of the EA')
+    parser.add_argument('--percentage', type=int, default=30, help='new members percentage of the EA')
+    parser.add_argument('--compact', action='store_true', help='use the compact population')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the melodies and the EA')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not measure the peak memory (it needs one more search per melody)')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file for the results')
+    arguments = parser.parse_args()
+    Key.prepare_all_vocabularies()
+    results = []
+    print('{:>6} {:>4} {:>6} {:>6} {:>9} {:>9} {:>9} {:>10} {:>12}'.format(
+        'bars', 'key', 'rests', 'found', 'read, s', 'evolve, s', 'render, s', 'evals/s', 'fitness'))
+    with tempfile.TemporaryDirectory() as directory:
+        for size_in_bars in arguments.bars:
+            for key_name in arguments.keys:
+                for rests in (False, True):
+                    result = run_case(directory, key_name, size_in_bars, rests, arguments)
+                    results.append(result)
+                    print('{:>6} {:>4} {:>6} {:>6} {:>9.4f} {:>9.3f} {:>9.4f} {:>10.0f} {:>12.2f}'.format(
+                        result['bars'], key_name, str(rests), result['determined_key'], result['seconds']['read'],
+                        result['seconds']['evolve'], result['seconds']['render'],
+                        result['evaluations_per_second'], result['fitness']))
+    parameters = {name: value for name, value in vars(arguments).items() if name != 'output'}
+    with open(arguments.output, 'w') as output:
+        json.dump({'environment': environment(), 'parameters': parameters, 'results': results}, output, indent=1)
+    print('Results are saved to', arguments.output)
+
+
+if __name__ == '__main__':
+    main()
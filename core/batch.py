@@ -0,0 +1,223 @@
+from core.generator import *
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
+import os
+import time
+
+# Statuses of the files in the batch manifest:
+DONE = 'done'
+FAILED = 'error'
+# Files read by one worker process at a time in the key analysis of the corpus:
+KEY_DETECTION_CHUNK_SIZE = 64
+
+
+def find_input_files(sources: list):
+    """
+    Function to find all the .mid files given as directories, glob patterns or file names
+    :param sources: list of directories, glob patterns or file names
+    :return: sorted list of distinct file names
+    """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            files.update(glob.glob(os.path.join(source, '**', '*.mid'), recursive=True))
+        else:
+            files.update(glob.glob(source, recursive=True))
+    return sorted(files)
+
+
+def read_manifest(manifest_path: str):
+    """
+    Function to read the JSONL manifest of the previous runs. Broken lines (e.g. the last line written
+    during the crash) are skipped
+    :param manifest_path: path of the manifest file
+    :return: dictionary of the latest record for every input file
+    """
+    records = dict()
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+                records[record['file']] = record
+            except (ValueError, KeyError, TypeError):
+                continue
+    return records
+
+
+def output_file_name(input_file: str, output_directory: str, key_name: str, style: int = None):
+    """
+    :param input_file: name of the input file
+    :param output_directory: directory for the output files
+    :param key_name: the key of the melody
+    :param style: style number to add its name to the file name (None for no style name)
+    :return: name of the output file for the input file
+    """
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    suffix = '' if style is None else '-' + STYLE_NAMES[style]
+    return os.path.join(output_directory, 'output-' + stem + '-' + key_name + suffix + '.mid')
+
+
+def process_file(input_file: str, output_directory: str, style, rests: bool, generator_parameters: dict,
+                 native_reader: bool = True, renderer: str = NATIVE_RENDERER, record_statistics: bool = False,
+                 time_limit: float = None):
+    """
+    Function for generating the accompaniment for one file (run in the worker process)
+    :param input_file: name of the input .mid file
+    :param output_directory: directory for the output file
+    :param style: style number (0 to 5) or list of style numbers, the accompaniment is searched for once
+            and rendered in every style (then the style names are added to the output file names)
+    :param rests: are rest chords allowed or not
+    :param generator_parameters: keyword arguments for GeneratorOfAccompaniment
+    :param native_reader: read the file with the native MIDI reader when possible (see load_melody)
+    :param renderer: MIDI rendering backend, 'native' or 'music21'
+    :param record_statistics: record the statistics of the generations of evolutionary algorithm
+            (labelled with the file) into the record, to pass them to the observers of the parent process
+    :param time_limit: external time limit (in seconds) for the evolution (see get_best_accompaniment)
+    :return: manifest record: file, status, key, fitness, output file name (or list of names for several styles),
+            whether the accompaniment was taken from the result cache and timings in seconds (or the error),
+            and the statistics of the generations if recorded
+    """
+    record = {'file': input_file}
+    started = time.perf_counter()
+    try:
+        melody = load_melody(input_file, rests, native_reader)
+        record['key'] = melody.key.name
+        record['bars'] = melody.size_in_bars
+        parsed = time.perf_counter()
+        recorder = StatisticsRecorder() if record_statistics else None
+        if recorder is not None:
+            generator_parameters = dict(generator_parameters,
+                                        observers_ea=generator_parameters.get('observers_ea', []) + [recorder])
+        generator = GeneratorOfAccompaniment(melody, **generator_parameters)
+        generator.ea.labels['file'] = input_file
+        try:
+            accompaniment = generator.get_best_accompaniment(time_limit=time_limit)
+        finally:
+            if recorder is not None:
+                record['statistics'] = recorder.statistics
+        searched = time.perf_counter()
+        record['fitness'] = generator.ea.calculate_fitness(accompaniment)
+        if generator.cached:
+            record['cached'] = True
+        if type(style) == list:
+            output_file_names = {s: output_file_name(input_file, output_directory, melody.key.name, s) for s in style}
+            record['output'] = list(output_file_names.values())
+        else:
+            output_file_names = {style: output_file_name(input_file, output_directory, melody.key.name)}
+            record['output'] = output_file_names[style]
+        generator.generate_midi_accompaniments(output_file_names, accompaniment, renderer)
+        finished = time.perf_counter()
+        record['status'] = DONE
+        record['seconds'] = {'parse': parsed - started, 'search': searched - parsed, 'render': finished - searched,
+                             'total': finished - started}
+    except Exception as error:
+        record['status'] = FAILED
+        record['error'] = type(error).__name__ + ': ' + str(error)
+        record['seconds'] = {'total': time.perf_counter() - started}
+    return record
+
+
+def process_corpus(sources: list, output_directory: str, manifest_path: str, style=0, rests: bool = False,
+                   workers: int = None, generator_parameters: dict = None, retry_failed: bool = False,
+                   native_reader: bool = True, renderer: str = NATIVE_RENDERER, observers: list = None):
+    """
+    Function for generating accompaniments for many files in the pool of worker processes.
+    Every finished file is appended to the JSONL manifest at once, and the files already done
+    (according to the manifest) are skipped, so the interrupted run can be resumed
+    :param sources: list of directories, glob patterns or names of the .mid files
+    :param output_directory: directory for the output files
+    :param manifest_path: path of the JSONL manifest
+    :param style: style number (0 to 5) or list of style numbers (see process_file)
+    :param rests: are rest chords allowed or not
+    :param workers: number of worker processes (by default, as many as processors)
+    :param generator_parameters: keyword arguments for GeneratorOfAccompaniment
+    :param retry_failed: process the files which failed in the previous runs again
+    :param native_reader: read the files with the native MIDI reader when possible (see load_melody)
+    :param renderer: MIDI rendering backend, 'native' or 'music21'
+    :param observers: list of GenerationObservers of evolutionary algorithm living in this process: the statistics
+            of every file (labelled with the file) are recorded by the worker and passed to them when the file is done
+    :return: list of manifest records of the processed files
+    """
+    done = read_manifest(manifest_path)
+    skipped = {DONE, FAILED} if not retry_failed else {DONE}
+    files = [input_file for input_file in find_input_files(sources)
+             if done.get(input_file, {}).get('status') not in skipped]
+    os.makedirs(output_directory, exist_ok=True)
+    records = []
+    with ProcessPoolExecutor(workers) as pool, open(manifest_path, 'a') as manifest:
+        futures = [pool.submit(process_file, input_file, output_directory, style, rests, generator_parameters or {},
+                               native_reader, renderer, bool(observers)) for input_file in files]
+        for future in as_completed(futures):
+            record = future.result()
+            replay(record.pop('statistics', []), observers or [])
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            records.append(record)
+    return records
+
+
+def read_notes(input_file: str, native_reader: bool = True):
+    """
+    Function to read only the notes of the melody (the Melody is built only if music21 has to parse the file)
+    :param input_file: name of the .mid file
+    :param native_reader: read the file with the native MIDI reader when possible (see load_melody)
+    :return: list of Notes and Rests
+    """
+    if native_reader:
+        try:
+            return read_midi_notes(input_file)[0]
+        except (UnsupportedMidiError, IndexError, struct.error):
+            pass
+    return load_melody(input_file, native=False).notes
+
+
+def detect_keys_of_files(input_files: list, native_reader: bool = True):
+    """
+    Function to determine the keys of the melodies of several files at once (run in the worker process),
+    see Melody.detect_keys
+    :param input_files: names of the .mid files
+    :param native_reader: read the files with the native MIDI reader when possible (see load_melody)
+    :return: list of records: file, status and key (or the error)
+    """
+    records = []
+    melodies_notes = []
+    for input_file in input_files:
+        try:
+            melodies_notes.append(read_notes(input_file, native_reader))
+            records.append({'file': input_file, 'status': DONE})
+        except Exception as error:
+            records.append({'file': input_file, 'status': FAILED, 'error': type(error).__name__ + ': ' + str(error)})
+    key_names = iter(Melody.detect_keys(melodies_notes))
+    for record in records:
+        if record['status'] == DONE:
+            key_name = next(key_names)
+            if key_name is not None:
+                record['key'] = key_name
+            else:
+                record['status'] = FAILED
+                record['error'] = 'No key contains all the notes of the melody'
+    return records
+
+
+def detect_corpus_keys(sources: list, workers: int = None, native_reader: bool = True,
+                       chunk_size: int = KEY_DETECTION_CHUNK_SIZE):
+    """
+    Function for the key analysis of many files without generating the accompaniments:
+    the files are split into chunks, and the keys of every chunk are determined at once in the pool of worker processes
+    :param sources: list of directories, glob patterns or names of the .mid files
+    :param workers: number of worker processes (by default, as many as processors)
+    :param native_reader: read the files with the native MIDI reader when possible (see load_melody)
+    :param chunk_size: number of files in the chunk
+    :return: list of records (see detect_keys_of_files) in the order of the file names
+    """
+    files = find_input_files(sources)
+    records = []
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(detect_keys_of_files, files[i:i + chunk_size], native_reader)
+                   for i in range(0, len(files), chunk_size)]
+        for future in futures:
+            records += future.result()
+    return records
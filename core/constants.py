@@ -1,24 +1,80 @@
-# Constant tables and names used in the program below:
-
-# The table of note names:
-NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-# Constant names for chord types:
-MINOR = 'm'
-MAJOR = ''
-DIMINISHED = 'DIM'
-SUS2 = 'sus2'
-SUS4 = 'sus4'
-REST = 'rest'
-# Scale steps for Major and minor keys:
-MAJOR_SCALE_STEPS = [2, 2, 1, 2, 2, 2, 1]
-MINOR_SCALE_STEPS = [2, 1, 2, 2, 1, 2, 2]
-# Triad types according to the scale steps:
-MAJOR_KEY_SCALES = [MAJOR, MINOR, MINOR, MAJOR, MAJOR, MINOR, DIMINISHED]
-MINOR_KEY_SCALES = [MINOR, DIMINISHED, MAJOR, MINOR, MINOR, MAJOR, MAJOR]
-# Chord note offsets:
-CHORD_NOTE_OFFSETS = {MAJOR: [0, 4, 7], MINOR: [0, 3, 7], SUS2: [0, 2, 7], SUS4: [0, 5, 7], DIMINISHED: [0, 3, 6]}
-# Allowed positions for sus2 and sus4 chords (can be calculated from scale steps):
-MAJOR_SUS2_ALLOWED = [MAJOR_SCALE_STEPS[i] != 1 for i in range(7)]
-MINOR_SUS2_ALLOWED = [MINOR_SCALE_STEPS[i] != 1 for i in range(7)]
-MAJOR_SUS4_ALLOWED = [i not in [4 - 1, 7 - 1] for i in range(7)]
-MINOR_SUS4_ALLOWED = [i not in [2 - 1, 6 - 1] for i in range(7)]
+# Constant tables and names used in the program below:
+
+# The table of note names:
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Pitch class (index in the table) of every note name:
+PITCH_CLASSES = {name: i for i, name in enumerate(NOTE_NAMES)}
+# Constant names for chord types:
+MINOR = 'm'
+MAJOR = ''
+DIMINISHED = 'DIM'
+SUS2 = 'sus2'
+SUS4 = 'sus4'
+REST = 'rest'
+# Scale steps for Major and minor keys:
+MAJOR_SCALE_STEPS = [2, 2, 1, 2, 2, 2, 1]
+MINOR_SCALE_STEPS = [2, 1, 2, 2, 1, 2, 2]
+# Multipliers of the key probability when the last, the first or the most used note of the melody is
+# the tonic, dominant, mediant or subdominant of the key (in this order):
+LAST_NOTE_KEY_WEIGHTS = [3, 2.5, 2.25, 1.5]
+FIRST_NOTE_KEY_WEIGHTS = [2, 1.75, 1.75, 1.25]
+MOST_USED_NOTE_KEY_WEIGHTS = [2.5, 2, 1.75, 1.5]
+# Triad types according to the scale steps:
+MAJOR_KEY_SCALES = [MAJOR, MINOR, MINOR, MAJOR, MAJOR, MINOR, DIMINISHED]
+MINOR_KEY_SCALES = [MINOR, DIMINISHED, MAJOR, MINOR, MINOR, MAJOR, MAJOR]
+# Chord note offsets:
+CHORD_NOTE_OFFSETS = {MAJOR: [0, 4, 7], MINOR: [0, 3, 7], SUS2: [0, 2, 7], SUS4: [0, 5, 7], DIMINISHED: [0, 3, 6]}
+# Allowed positions for sus2 and sus4 chords (can be calculated from scale steps):
+MAJOR_SUS2_ALLOWED = [MAJOR_SCALE_STEPS[i] != 1 for i in range(7)]
+MINOR_SUS2_ALLOWED = [MINOR_SCALE_STEPS[i] != 1 for i in range(7)]
+MAJOR_SUS4_ALLOWED = [i not in [4 - 1, 7 - 1] for i in range(7)]
+MINOR_SUS4_ALLOWED = [i not in [2 - 1, 6 - 1] for i in range(7)]
+# Consonance weights of the interval (in semitones, 0 to 11) between a melody note and a chord note.
+# First three intervals (0, 7, 5) are the most consonant, then next four (4, 3, 9, 8) are considered as
+# mild consonance, next two (2, 10) are mildly dissonant, last three (11, 1, 6) result in sharp dissonance
+INTERVAL_CONSONANCE_WEIGHTS = [15, 0, 0.1, 1, 1, 5, 0, 10, 1, 1, 0.1, 0]
+# Penalty for every melody note sounding during the rest chord and bonus for the melody rest during the rest chord:
+REST_CHORD_NOTE_PENALTY = -10
+REST_CHORD_REST_BONUS = 1
+# Index of the rest column in the melody duration matrix and chord interval weights (after 12 pitch classes):
+REST_COLUMN = 12
+# Fitness coefficients for consonance, chord repetition and chord progressions:
+CONSONANCE_COEFFICIENT = 1
+REPETITION_COEFFICIENT = 25
+PROGRESSION_COEFFICIENT = 5
+# Popular chord progressions (as scale steps down from the tonic triad) and the bonus for each one found:
+MAIN_PROGRESSIONS = [[0, 0, 0, 0], [0, 3, 4, 4], [0, 0, 3, 4], [0, 3, 0, 4], [0, 3, 4, 3], [0, 3, 4, 0],
+                     [0, 5, 1, 4], [3, 3, 0, 0], [4, 4, 0, 0], [5, 3, 0, 4], [0, 5, 3, 4]]
+PROGRESSION_BONUS = 100
+PROGRESSION_LENGTH = 4
+# Names of the parents' selection strategies and the default number of members in one tournament:
+ROULETTE_SELECTION = 'roulette'
+RANK_SELECTION = 'rank'
+TOURNAMENT_SELECTION = 'tournament'
+TOURNAMENT_SIZE = 3
+# Probability for the child to inherit the gene from the father (uniform crossover) and to mutate every gene:
+FATHER_GENE_PROBABILITY = 0.5
+MUTATION_PROBABILITY = 0.13
+# Policies for the children repeating the members of the population or each other (keep them, reject them
+# before the evaluation or mutate them again, up to REMUTATION_ATTEMPTS times, rejecting the rest):
+KEEP_DUPLICATES = 'keep'
+REJECT_DUPLICATES = 'reject'
+REMUTATE_DUPLICATES = 'remutate'
+REMUTATION_ATTEMPTS = 5
+# Names of the accompaniment search engines: evolutionary algorithm and exact dynamic programming:
+EVOLUTIONARY_ENGINE = 'ea'
+DYNAMIC_PROGRAMMING_ENGINE = 'dp'
+# Reasons for the evolution to stop: all generations performed, time limit reached, best fitness stalled:
+STOPPED_GENERATIONS = 'generations'
+STOPPED_TIME_LIMIT = 'time limit'
+STOPPED_STALL = 'stall'
+# Names of the MIDI rendering backends: the direct MIDI writer and music21:
+NATIVE_RENDERER = 'native'
+MUSIC21_RENDERER = 'music21'
+# Short names of the styles (used in the output file names when several styles are rendered):
+STYLE_NAMES = ['piano', 'guitar', 'orchestra', 'koto', 'xylophone', 'choir']
+# Instruments (track name and MIDI program) of the melody and the chords for every style:
+MELODY_INSTRUMENTS = [('Electric Piano', 2), ('Acoustic Guitar', 24), ('Violin', 40), ('Koto', 107),
+                      ('Xylophone', 13), ('Church Bells', 14)]
+CHORDS_INSTRUMENTS = [('Electric Piano', 2), ('Acoustic Guitar', 24), ('Violoncello', 42), ('Flute', 73),
+                      ('Xylophone', 13), ('Choir', 52)]
@@ -0,0 +1,81 @@
+from core.fitness import *
+
+
+class DynamicProgrammingSolver:
+    """
+    Exact solver for the accompaniment: fitness of the evolutionary algorithm consists of per-bar consonance,
+    repetitions of the adjacent chords and progressions of PROGRESSION_LENGTH chords, so the best sequence can be
+    found by dynamic programming (Viterbi algorithm) over the last three chosen chords in time linear in bars.
+    Chords with equal note names and scale step (e.g. inverses of one triad) are interchangeable for repetitions
+    and progressions, so in every bar only the most consonant chord of each such group takes part in the search.
+    The only non-local part of the fitness, clamping of the consonance to be at least 1, is not taken into account
+    """
+    def __init__(self, melody: Melody, key: Key):
+        """
+        Constructor of the solver
+        :param melody: the initial melody (needed for fitness calculation)
+        :param key: the key of the melody
+        """
+        self.melody = melody
+        self.key = key
+        self.chords = melody.chords
+        self.evaluator = FitnessEvaluator(melody, key)
+        self.best_fitness = None
+
+    def group_chords(self):
+        """
+        Method to split the vocabulary into groups of interchangeable chords (equal note names, step and silence)
+        :return: array of group indices of the chords and number of groups
+        """
+        groups = dict()
+        group_of_chord = np.array([groups.setdefault((self.evaluator.note_classes[i], self.evaluator.steps[i],
+                                                      self.evaluator.is_rest[i]), len(groups))
+                                   for i in range(len(self.chords))])
+        return group_of_chord, len(groups)
+
+    def solve(self) -> Accompaniment:
+        """
+        Method to find the accompaniment with the maximal fitness
+        :return: the best accompaniment
+        """
+        number_of_bars = self.melody.size_in_bars
+        if number_of_bars == 0:
+            self.best_fitness = CONSONANCE_COEFFICIENT
+            return Accompaniment([])
+        group_of_chord, number_of_groups = self.group_chords()
+        # the most consonant chord of every group in every bar and its consonance
+        group_consonance = np.full((number_of_bars, number_of_groups), -np.inf)
+        group_best_chord = np.zeros((number_of_bars, number_of_groups), dtype=int)
+        for chord in range(len(self.chords)):
+            group = group_of_chord[chord]
+            better = self.evaluator.consonance_table[:, chord] > group_consonance[:, group]
+            group_consonance[better, group] = self.evaluator.consonance_table[better, chord]
+            group_best_chord[better, group] = chord
+        # the last symbol is "no chord" (before the first bar and after the last one)
+        none = number_of_groups
+        representatives = np.array([np.flatnonzero(group_of_chord == group)[0] for group in range(number_of_groups)])
+        # repetition bonus of the middle chord b given its neighbours a and c: repetition[a, b, c],
+        # progression bonus of the window (a, b, c, d): progression[a, b, c, d]
+        repetition, progression = FitnessEvaluator.symbol_transitions(self.evaluator.note_classes[representatives],
+                                                                      self.evaluator.steps[representatives],
+                                                                      self.evaluator.is_rest[representatives])
+        transition = repetition[None, :, :, :] + progression
+        # value[a, b, c] is the best fitness of the bars up to the current one, ending with chords a, b, c
+        symbols = number_of_groups + 1
+        value = np.full((symbols, symbols, symbols), -np.inf)
+        value[none, none, :number_of_groups] = CONSONANCE_COEFFICIENT * group_consonance[0]
+        back_pointers = np.zeros((number_of_bars, symbols, symbols, symbols), dtype=np.min_scalar_type(symbols))
+        for bar in range(1, number_of_bars):
+            candidates = value[:, :, :, None] + transition
+            back_pointers[bar] = np.argmax(candidates, axis=0)
+            value = np.take_along_axis(candidates, back_pointers[bar][None].astype(int), axis=0)[0]
+            value[:, :, :number_of_groups] += CONSONANCE_COEFFICIENT * group_consonance[bar]
+            value[:, :, none] = -np.inf
+        value = value + repetition[None, :, :, none]
+        state = np.unravel_index(np.argmax(value), value.shape)
+        self.best_fitness = float(value[state])
+        groups = [state[2], state[1], state[0]]
+        for bar in range(number_of_bars - 1, 2, -1):
+            groups.append(back_pointers[bar][groups[-1], groups[-2], groups[-3]])
+        groups = groups[:number_of_bars][::-1]
+        return Accompaniment([self.chords[group_best_chord[bar, groups[bar]]] for bar in range(number_of_bars)])
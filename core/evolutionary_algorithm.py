@@ -1,243 +1,540 @@
-from core.music_units import *
-from core.list_generation import *
-from core.constants import *
-
-
-class EvolutionaryAlgorithm:
-    def __init__(self, number_of_generations: int, population_size: int, new_members_percentage: int,
-                 melody: Melody, key: Key):
-        """
-        Constructor of the Evolutionary Algorithm class
-        :param number_of_generations: how many iterations to perform
-        :param population_size: the amount of members in generation
-        :param new_members_percentage: how many (in percents) new members should be generated
-        :param melody: the initial melody (needed for fitness calculation)
-        :param key: the key of the melody for the fast access
-        """
-        self.n_iterations = number_of_generations
-        self.population_size = population_size
-        self.melody = melody
-        self.number_of_genes_in_chromosome = melody.size_in_bars
-        self.key = key
-        self.chords = melody.chords
-        self.new_members_percentage = new_members_percentage
-        self.current_generation = []
-        self.current_fitness = []
-        self.current_fitness_sum = 0
-
-    def generate_zeroth_generation(self):
-        """
-        Method to generate the initial generation (purely random members) for evolutionary algorithm
-        :return: None
-        """
-        for g in range(self.population_size):
-            chords_sequence = []
-            for i in range(self.melody.size_in_bars):
-                chords_sequence.append(random.choice(self.chords))
-            self.current_generation.append(Accompaniment(chords_sequence))
-        self.current_fitness = self.generate_fitness_list(self.current_generation)
-        self.current_fitness_sum = sum(self.current_fitness)
-
-    def generate_fitness_list(self, population):
-        """
-        Method for generating the list of fitness values for the provided population members (in the same order)
-        :param population: population whose members need their fitness value to be calculated
-        :return: list of fitness values for the members of population
-        """
-        fitnesses = []
-        for chromosome in population:
-            fitnesses.append(self.calculate_fitness(chromosome))
-        return fitnesses
-
-    def calculate_fitness(self, chromosome: Accompaniment, debug=False):
-        """
-        Method for caluclating fitness for one chromosome (Accompaniment)
-        :param chromosome: Accompaniment to calculate fitness of
-        :param debug: should the method print the calculated fitness or not
-        :return: fitness of the chromosome
-        """
-        CONSONANCE_COEFFICIENT = 1
-        REPETITION_COEFFICIENT = 25
-        PROGRESSION_COEFFICIENT = 5
-        fitness = (CONSONANCE_COEFFICIENT * self.consonance_fitness(chromosome) +
-                   REPETITION_COEFFICIENT * self.chord_repetition_fitness(chromosome) +
-                   PROGRESSION_COEFFICIENT * self.chord_progression_fitness(chromosome))
-        if debug:
-            print('Consonance:', CONSONANCE_COEFFICIENT * self.consonance_fitness(chromosome))
-            print('Rep:', REPETITION_COEFFICIENT * self.chord_repetition_fitness(chromosome))
-            print('Progression:', PROGRESSION_COEFFICIENT * self.chord_progression_fitness(chromosome))
-        return fitness
-
-    def consonance_fitness(self, chromosome: Accompaniment):
-        """
-        Fitness calculation for the consonant notes
-        :param chromosome:
-        :return:
-        """
-        fitness = 0
-        # consonance_interval_table = [0, 7, 5, 4, 3, 9, 8, 2, 10, 11, 1, 6]
-        # in consonance table: first three intervals are the most consonant, then next four are considered as
-        # mild consonance, next two are mildly dissonant, last three result in sharp dissonance
-        consonance = [0, 7, 5]
-        mild_consonance = [4, 3, 9, 8]
-        mild_dissonance = [2, 10]
-        dissonance = [11, 1, 6]
-        for i in range(len(chromosome.chords)):
-            chord = chromosome.chords[i]
-            for note in self.melody.notes:
-                if type(note) != Rest:
-                    if note.starting_time > ((i + 1) * 1.0):
-                        break
-                    elif (i * 1.0) < note.starting_time < ((i + 1) * 1.0):
-                        duration = (min([note.starting_time + note.duration, (i + 1) * 1.0]) - note.starting_time)
-                    elif i * 1.0 < (note.starting_time + note.duration):
-                        duration = note.starting_time + note.duration - i * 1.0
-                    else:
-                        duration = 0
-                    if duration:
-                        for chord_note in chord.note_names:
-                            if chord_note != REST:
-                                interval = abs((NOTE_NAMES.index(note.pitch) - NOTE_NAMES.index(chord_note)) % 12)
-                                # if interval points on the fact that two notes
-                                # (from the melody and from the chosen chord)
-                                # are mildly consonant, fitness grows by the note duration
-                                # (during the chord is played) * 1
-                                # sharp consonance is considered five times as good as mild consonance
-                                # tonic gives the most fitness bonus
-                                # mild dissonance is not the worst thing to happen,
-                                # so the fitness grows by 0.4 * duration
-                                # dissonance gives 0
-                                if interval in consonance:
-                                    fitness += 5 * duration * (3 - consonance.index(interval))
-                                elif interval in mild_consonance:
-                                    fitness += 1 * duration
-                                elif interval in mild_dissonance:
-                                    fitness += 0.1 * duration
-                            else:
-                                fitness -= 10 * duration
-                else:
-                    # Rest chord is better when the rest is present in the melody
-                    if note.starting_time > ((i + 1) * 1.0):
-                        break
-                    elif (i * 1.0) < note.starting_time < ((i + 1) * 1.0):
-                        duration = (min([note.starting_time + note.duration, (i + 1) * 1.0]) - note.starting_time)
-                    elif i * 1.0 < (note.starting_time + note.duration):
-                        duration = note.starting_time + note.duration - i * 1.0
-                    else:
-                        duration = 0
-                    if duration:
-                        if chord.chord_type == REST:
-                            fitness += 1 * duration
-        return max(1, fitness)
-
-    def chord_repetition_fitness(self, chromosome: Accompaniment):
-        """
-        Fitness calculation for the doubled chords (one chord repetition, if chord is not silent)
-        :param chromosome: one accompaniment we calculate the fitness for
-        :return: fitness bonus for chord repetition
-        """
-        fitness = 0
-        for i in range(chromosome.genes_count):
-            # When the chord is repeated twice, the fitness grows by 2.
-            # However, if it is repeated more than two times in a row, the fitness does not grow.
-            # For the exactly four repetitions progression, see progression fitness calculation
-            repetition_bonus = 0
-            if i > 0 and chromosome.chords[i - 1].note_names == chromosome.chords[i].note_names and \
-                    chromosome.chords[i].note_names[0] != REST:
-                repetition_bonus += 1
-            if i < chromosome.genes_count - 1 and \
-                    chromosome.chords[i].note_names == chromosome.chords[i + 1].note_names and \
-                    chromosome.chords[i].note_names[0] != REST:
-                if repetition_bonus > 0:
-                    repetition_bonus -= 1
-                else:
-                    repetition_bonus += 1
-            fitness += repetition_bonus
-        return fitness
-
-    def chord_progression_fitness(self, chromosome: Accompaniment):
-        """
-        Fitness calculation for chord progressions
-        Some popular chord progressions are in main_progressions list
-        If the progression was found in the accompaniment, the significant fitness bonus is added
-        :param chromosome: one accompaniment we calculate the fitness for
-        :return: fitness bonus for chord progressions
-        """
-        fitness = 0
-        main_progressions = [[0, 0, 0, 0], [0, 3, 4, 4], [0, 0, 3, 4], [0, 3, 0, 4], [0, 3, 4, 3], [0, 3, 4, 0],
-                             [0, 5, 1, 4], [3, 3, 0, 0], [4, 4, 0, 0], [5, 3, 0, 4], [0, 5, 3, 4]]
-        # TODO 9: understand major and minor progressions, make chord_progression_fitness method smarter
-        # TODO 10: sort main progressions to determine stronger ones and change fitness bonus to 100 + 10 * pr.index(pr)
-        for i in range(chromosome.genes_count - 3):
-            triads = list(map(lambda x: x.name, self.chords[:7]))
-            intervals = []
-            for a in range(4):
-                if chromosome.chords[i + a].name in triads:
-                    intervals.append((triads.index(self.key.name) - triads.index(chromosome.chords[i + a].name)) % 7)
-            if intervals in main_progressions:
-                fitness += 100
-        return fitness
-
-    def mutate(self, child: Accompaniment):
-        """
-        Method for mutating the child Chromosome (Accompaniment)
-        Mutating is crucial to enlarge the number of different genes in the population,
-        because randomly mutated genes (Chords in our case) may not be contained in parent's Chromosomes
-        :param child: child Chromosome (Accompaniment, sequence of chords)
-        :return: mutated child (however, the initial child Accompaniment is changed in the same way, so we have
-        two ways of accessing the child for the convenience)
-        """
-        for i in range(len(child.chords)):
-            if random.randint(0, 99) <= 12:
-                # mutate with the probability 0.13
-                child.chords[i] = random.choice(self.chords)
-        return child
-
-    def crossover(self, parent1: Accompaniment, parent2: Accompaniment):
-        """
-        Method for performing the uniform crossover between two parent Chromosomes (Accompaniments), returns their child
-        Uniform crossover means that each gene (Chord) has the equal probability to be father's or mother's
-        :param parent1: father Accompaniment
-        :param parent2: mother Accompaniment
-        :return: new child Accompaniment
-        """
-        child_genes = []  # list of Chords
-        for i in range(self.number_of_genes_in_chromosome):
-            child_genes.append(random.choice([parent1.chords[i], parent2.chords[i]]))
-        return Accompaniment(child_genes)
-
-    def create_new_generation(self):
-        """
-        Method for one iteration (generation renewal) performing
-        It creates new_members_percentage * population_size new members and sorts the list by fitness value
-        The most fit (population_size) members are chosen for the new generation
-        """
-        new_members = []
-        number_of_crossovers = self.new_members_percentage * self.population_size // 100
-        fathers, mothers = determine_parents_lists(self.current_generation, self.current_fitness,
-                                                   self.current_fitness_sum, number_of_crossovers)
-        for i in range(number_of_crossovers):
-            new_accompaniment = self.mutate(self.crossover(fathers[i], mothers[i]))
-            new_members.append(new_accompaniment)
-        # constructing list of pairs: [member, fitness] and sorting it in ascending order
-        children_fitness = self.generate_fitness_list(new_members)
-        overall_fitness = self.current_fitness + children_fitness
-        overall_generation = self.current_generation + new_members
-        overall_extended_generation_with_fitness = []
-        for i in range(self.population_size + number_of_crossovers):
-            overall_extended_generation_with_fitness.append([overall_generation[i], overall_fitness[i]])
-        overall_extended_generation_with_fitness.sort(key=lambda x: x[1])
-        self.current_generation = list(map(lambda x: x[0],
-                                           overall_extended_generation_with_fitness[number_of_crossovers:]))
-        self.current_fitness = self.generate_fitness_list(self.current_generation)
-        self.current_fitness_sum = sum(self.current_fitness)
-
-    def evolve(self) -> Accompaniment:
-        """
-        Method to start evolution: generate zeroth generation and perform n_iterations iterations
-        :return: best (by fitness) accompaniment generated
-        """
-        self.generate_zeroth_generation()
-        for i in range(self.n_iterations):
-            self.create_new_generation()
-        return self.current_generation[-1]
+from core.music_units import *
+from core.fitness import *
+from core.list_generation import *
+from core.population import *
+from core.telemetry import *
+import time
+from core.constants import *
+
+
+class EvolutionaryAlgorithm:
+    def __init__(self, number_of_generations: int, population_size: int, new_members_percentage: int,
+                 melody: Melody, key: Key, compact_population: bool = False,
+                 selection_strategy=ROULETTE_SELECTION, fitness_cache_size: int = 0,
+                 incremental_evaluation: bool = False, seed: int = None, elitism: int = None,
+                 remove_duplicates: bool = False, duplicates: str = KEEP_DUPLICATES,
+                 track_diversity: bool = False, observers: list = None):
+        """
+        Constructor of the Evolutionary Algorithm class
+        :param number_of_generations: how many iterations to perform
+        :param population_size: the amount of members in generation
+        :param new_members_percentage: how many (in percents) new members should be generated
+        :param melody: the initial melody (needed for fitness calculation)
+        :param key: the key of the melody for the fast access
+        :param compact_population: store the population as the CompactPopulation (integer matrix of chord indices
+                and the array of fitness values) instead of the list of Accompaniments. Accompaniment is built
+                only for the best member in the end
+        :param selection_strategy: how to choose parents for crossovers: name of the strategy from
+                SELECTION_STRATEGIES (roulette, rank or tournament) or the function with the same signature
+                as determine_parents_lists
+        :param fitness_cache_size: how many fitness values of the gene sequences to memorize (see FitnessCache),
+                0 disables the cache
+        :param incremental_evaluation: calculate fitness of children from the fitness terms of their parents,
+                recalculating only the bars affected by the changed genes (needs compact_population)
+        :param seed: seed of the numpy Generator drawing the initial genes, parents (for the built-in selection
+                strategies), crossover and mutation masks (None for the random seed)
+        :param elitism: survivor selection policy: None for the competition of the parents and the children
+                (the most fit members survive), otherwise the number of the best parents which always survive,
+                while all the children replace the worst other parents (see survivor_indices)
+        :param remove_duplicates: keep only one copy of every distinct member in the next generation when possible
+        :param duplicates: what to do with the children repeating the population members or each other before
+                their evaluation: KEEP_DUPLICATES, REJECT_DUPLICATES or REMUTATE_DUPLICATES (mutate them again
+                up to REMUTATION_ATTEMPTS times and reject the remaining duplicates)
+        :param track_diversity: measure the diversity of every generation (see diversity)
+        :param observers: list of GenerationObservers called after every generation with its statistics,
+                the phases of generations are timed only if there are observers
+        """
+        self.n_iterations = number_of_generations
+        self.population_size = population_size
+        self.melody = melody
+        self.number_of_genes_in_chromosome = melody.size_in_bars
+        self.key = key
+        self.chords = melody.chords
+        # index of every chord in the vocabulary and the consonance of every vocabulary chord in every bar
+        # (dot product of the bar's pitch class durations and the chord's interval weights)
+        self.chord_indices = {chord: i for i, chord in enumerate(self.chords)}
+        self.evaluator = FitnessEvaluator(melody, key)
+        self.consonance_table = self.evaluator.consonance_table.tolist()
+        self.new_members_percentage = new_members_percentage
+        self.current_generation = []
+        # matrix of genes of the current generation (in the same order)
+        self.current_genes = None
+        self.current_fitness = []
+        self.current_fitness_sum = 0
+        self.compact_population = compact_population
+        self.population = None
+        self.select_parents = (SELECTION_STRATEGIES[selection_strategy] if isinstance(selection_strategy, str)
+                               else selection_strategy)
+        # the built-in strategies draw from self.rng, the custom ones are called without it
+        self.selection_uses_rng = isinstance(selection_strategy, str)
+        self.fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size > 0 else None
+        if incremental_evaluation and not compact_population:
+            raise ValueError('Incremental evaluation is possible only for the compact population')
+        self.incremental_evaluation = incremental_evaluation
+        # random generator of the search: initial genes, parents' selection, crossover and mutation masks
+        self.rng = np.random.default_rng(seed)
+        self.elitism = elitism
+        self.remove_duplicates = remove_duplicates
+        if duplicates not in (KEEP_DUPLICATES, REJECT_DUPLICATES, REMUTATE_DUPLICATES):
+            raise ValueError('Unknown duplicates policy: ' + str(duplicates))
+        self.duplicates = duplicates
+        # how many duplicate children were rejected in every generation
+        self.duplicates_per_generation = []
+        self.track_diversity = track_diversity
+        # fraction of distinct members and the average entropy of bars for every generation (if tracked)
+        self.diversity_per_generation = []
+        self.observers = []
+        self.timer = NullTimer()
+        # time (as time.monotonic()) of the evolution start and the number of generations performed before
+        # the current evaluations_per_generation (by the other rounds of the island), for the statistics of observers
+        self.started = None
+        self.generation_offset = 0
+        # labels added to the statistics of every generation (e.g. the input file of the batch)
+        self.labels = dict()
+        for observer in observers or []:
+            self.add_observer(observer)
+        # genes and fitness of the best member found so far (members of the generation are not ordered)
+        self.best_member = None
+        self.best_member_fitness = None
+        # how many members were actually evaluated (not taken from the cache) in every generation
+        self.evaluations_per_generation = []
+        # why the last evolution stopped: STOPPED_GENERATIONS, STOPPED_TIME_LIMIT or STOPPED_STALL
+        self.stop_reason = None
+
+    def add_observer(self, observer: GenerationObserver):
+        """
+        Method to add the observer of generations (see GenerationObserver)
+        :param observer: the observer
+        :return: None
+        """
+        self.observers.append(observer)
+        self.timer = PhaseTimer()
+
+    def generate_zeroth_generation(self):
+        """
+        Method to generate the initial generation (purely random members) for evolutionary algorithm
+        :return: None
+        """
+        self.timer.start()
+        if self.compact_population:
+            self.generate_zeroth_compact_generation()
+        else:
+            self.best_member = None
+            genes = self.random_genes(self.population_size)
+            self.current_generation = [self.get_accompaniment(chromosome) for chromosome in genes]
+            self.current_genes = genes
+            fitness = self.evaluate_genes(genes) if self.population_size else np.array([])
+            self.remember_best(genes, fitness)
+            self.current_fitness = fitness.tolist()
+            self.current_fitness_sum = sum(self.current_fitness)
+        self.timer.lap(EVALUATION_PHASE)
+        self.finish_generation()
+
+    def finish_generation(self):
+        """
+        Method to measure the diversity of the generation (if tracked) and to notify the observers
+        :return: None
+        """
+        if self.track_diversity:
+            self.diversity_per_generation.append(self.population_diversity())
+        if not self.observers:
+            return
+        fitness = self.population.fitness if self.compact_population else np.array(self.current_fitness)
+        unique_fraction, bar_entropy = (self.diversity_per_generation[-1] if self.track_diversity
+                                        else self.population_diversity())
+        statistics = {'generation': self.generation_offset + len(self.evaluations_per_generation) - 1,
+                      'best': float(fitness.max()) if len(fitness) else None,
+                      'mean': float(fitness.mean()) if len(fitness) else None,
+                      'worst': float(fitness.min()) if len(fitness) else None,
+                      'best_so_far': self.best_member_fitness,
+                      'unique_fraction': unique_fraction, 'bar_entropy': bar_entropy,
+                      'evaluations': self.evaluations_per_generation[-1] if self.evaluations_per_generation else 0,
+                      'duplicates': self.duplicates_per_generation[-1] if self.duplicates_per_generation else 0,
+                      'seconds': dict(self.timer.seconds),
+                      'elapsed': time.monotonic() - self.started}
+        statistics.update(self.labels)
+        for observer in self.observers:
+            observer.generation(statistics)
+
+    def generate_zeroth_compact_generation(self):
+        """
+        Method to generate the initial generation (purely random members) as the CompactPopulation
+        :return: None
+        """
+        genes = self.random_genes(self.population_size)
+        if self.incremental_evaluation:
+            components = self.evaluate_genes(genes, self.evaluator.components)
+            self.set_population(CompactPopulation(genes, self.evaluator.combine(components), components))
+        else:
+            self.set_population(CompactPopulation(genes, self.evaluate_genes(genes)))
+
+    def set_population(self, population: CompactPopulation):
+        """
+        Method to replace the CompactPopulation (e.g. by the island model), its best member becomes the best one
+        :param population: new population
+        :return: None
+        """
+        self.population = population
+        self.best_member = None
+        self.remember_best(population.genes, population.fitness)
+
+    def remember_best(self, genes: np.ndarray, fitness: np.ndarray):
+        """
+        Method to update the best member found so far with the new members
+        :param genes: matrix of genes of the new members
+        :param fitness: their fitness values
+        :return: None
+        """
+        if len(fitness) == 0:
+            return
+        best = int(np.argmax(fitness))
+        if self.best_member is None or fitness[best] > self.best_member_fitness:
+            self.best_member = genes[best].copy()
+            self.best_member_fitness = float(fitness[best])
+
+    def random_genes(self, number_of_members: int):
+        """
+        Method to draw the genes of purely random members
+        :param number_of_members: how many members to generate
+        :return: (number_of_members x number of bars) matrix of chord indices
+        """
+        return self.rng.integers(len(self.chords), size=(number_of_members, self.number_of_genes_in_chromosome),
+                                 dtype=CompactPopulation.gene_type(len(self.chords)))
+
+    def generate_fitness_list(self, population):
+        """
+        Method for generating the list of fitness values for the provided population members (in the same order)
+        :param population: population whose members need their fitness value to be calculated
+        :return: list of fitness values for the members of population
+        """
+        if not population:
+            return []
+        return self.evaluate_genes(self.get_genes(population)).tolist()
+
+    def evaluate_genes(self, genes: np.ndarray, evaluate=None):
+        """
+        Method for calculating fitness values of the members given as the matrix of genes,
+        through the fitness cache if it is enabled
+        :param genes: (number of members x number of bars) matrix of chord indices
+        :param evaluate: function calculating the values for the matrix of genes (evaluator.evaluate by default)
+        :return: array of values in the same order
+        """
+        evaluate = evaluate or self.evaluator.evaluate
+        return self.evaluate_genes_subsets(genes, lambda indices: evaluate(genes[indices]))
+
+    def evaluate_genes_subsets(self, genes: np.ndarray, evaluate):
+        """
+        Method for calculating values for the members through the fitness cache if it is enabled,
+        and counting the evaluations which were actually performed
+        :param genes: (number of members x number of bars) matrix of chord indices
+        :param evaluate: function calculating the values for the rows of genes with the given indices
+        :return: array of values in the same order
+        """
+        if self.fitness_cache is None:
+            evaluations = len(genes)
+            values = evaluate(np.arange(len(genes)))
+        else:
+            misses = self.fitness_cache.misses
+            values = self.fitness_cache.evaluate(genes, evaluate)
+            evaluations = self.fitness_cache.misses - misses
+        if self.evaluations_per_generation:
+            self.evaluations_per_generation[-1] += evaluations
+        return values
+
+    def get_genes(self, population):
+        """
+        Method to convert the population members into the integer matrix of genes for the FitnessEvaluator
+        :param population: list of Accompaniments
+        :return: (population size x number of bars) numpy array of chord indices in the vocabulary
+        """
+        genes = np.array([[self.chord_indices[chord] for chord in chromosome.chords] for chromosome in population],
+                         dtype=CompactPopulation.gene_type(len(self.chords)))
+        # the empty population (e.g. no crossovers in the small population) is still the matrix
+        return genes.reshape(len(population), self.number_of_genes_in_chromosome)
+
+    def calculate_fitness(self, chromosome: Accompaniment, debug=False):
+        """
+        Method for caluclating fitness for one chromosome (Accompaniment)
+        :param chromosome: Accompaniment to calculate fitness of
+        :param debug: should the method print the calculated fitness or not
+        :return: fitness of the chromosome
+        """
+        fitness = (CONSONANCE_COEFFICIENT * self.consonance_fitness(chromosome) +
+                   REPETITION_COEFFICIENT * self.chord_repetition_fitness(chromosome) +
+                   PROGRESSION_COEFFICIENT * self.chord_progression_fitness(chromosome))
+        if debug:
+            print('Consonance:', CONSONANCE_COEFFICIENT * self.consonance_fitness(chromosome))
+            print('Rep:', REPETITION_COEFFICIENT * self.chord_repetition_fitness(chromosome))
+            print('Progression:', PROGRESSION_COEFFICIENT * self.chord_progression_fitness(chromosome))
+        return fitness
+
+    def consonance_fitness(self, chromosome: Accompaniment):
+        """
+        Fitness calculation for the consonant notes
+        Every pair of melody note and chord note gives the bonus according to their interval weight
+        (see INTERVAL_CONSONANCE_WEIGHTS) multiplied by the note duration during the chord is played,
+        the rest chord is better when the rest is present in the melody.
+        All the (bar, chord) scores are precomputed in consonance_table, so here they are only looked up
+        :param chromosome: one accompaniment we calculate the fitness for
+        :return: fitness for consonance (at least 1)
+        """
+        fitness = 0
+        for i in range(len(chromosome.chords)):
+            fitness += self.consonance_table[i][self.chord_indices[chromosome.chords[i]]]
+        return max(1, fitness)
+
+    def chord_repetition_fitness(self, chromosome: Accompaniment):
+        """
+        Fitness calculation for the doubled chords (one chord repetition, if chord is not silent)
+        :param chromosome: one accompaniment we calculate the fitness for
+        :return: fitness bonus for chord repetition
+        """
+        fitness = 0
+        for i in range(chromosome.genes_count):
+            # When the chord is repeated twice, the fitness grows by 2.
+            # However, if it is repeated more than two times in a row, the fitness does not grow.
+            # For the exactly four repetitions progression, see progression fitness calculation
+            repetition_bonus = 0
+            if i > 0 and chromosome.chords[i - 1].note_names == chromosome.chords[i].note_names and \
+                    chromosome.chords[i].note_names[0] != REST:
+                repetition_bonus += 1
+            if i < chromosome.genes_count - 1 and \
+                    chromosome.chords[i].note_names == chromosome.chords[i + 1].note_names and \
+                    chromosome.chords[i].note_names[0] != REST:
+                if repetition_bonus > 0:
+                    repetition_bonus -= 1
+                else:
+                    repetition_bonus += 1
+            fitness += repetition_bonus
+        return fitness
+
+    def chord_progression_fitness(self, chromosome: Accompaniment):
+        """
+        Fitness calculation for chord progressions
+        Some popular chord progressions are in main_progressions list
+        If the progression was found in the accompaniment, the significant fitness bonus is added
+        :param chromosome: one accompaniment we calculate the fitness for
+        :return: fitness bonus for chord progressions
+        """
+        fitness = 0
+        # TODO 9: understand major and minor progressions, make chord_progression_fitness method smarter
+        # TODO 10: sort main progressions to determine stronger ones and change fitness bonus to 100 + 10 * pr.index(pr)
+        for i in range(chromosome.genes_count - PROGRESSION_LENGTH + 1):
+            triads = list(map(lambda x: x.name, self.chords[:7]))
+            intervals = []
+            for a in range(PROGRESSION_LENGTH):
+                if chromosome.chords[i + a].name in triads:
+                    intervals.append((triads.index(self.key.name) - triads.index(chromosome.chords[i + a].name)) % 7)
+            if intervals in MAIN_PROGRESSIONS:
+                fitness += PROGRESSION_BONUS
+        return fitness
+
+    def crossover_batch(self, fathers: np.ndarray, mothers: np.ndarray):
+        """
+        Method for performing the uniform crossover for all the pairs of parents at once:
+        every gene of every child is the father's one with the probability FATHER_GENE_PROBABILITY
+        (0.5), otherwise it is the mother's one
+        :param fathers: matrix of genes of the fathers
+        :param mothers: matrix of genes of the mothers (in the same order)
+        :return: matrix of genes of the children
+        """
+        return np.where(self.rng.random(fathers.shape) < FATHER_GENE_PROBABILITY, fathers, mothers)
+
+    def mutate_batch(self, children: np.ndarray):
+        """
+        Method for mutating the genes of all the children in place: every gene is replaced by the random chord
+        with the probability MUTATION_PROBABILITY (0.13)
+        :param children: matrix of genes of the children
+        :return: mutated children
+        """
+        mutated = self.rng.random(children.shape) < MUTATION_PROBABILITY
+        children[mutated] = self.rng.integers(len(self.chords), size=np.count_nonzero(mutated))
+        return children
+
+    def choose_parents(self, generation: list, fitnesses, fitness_sum, n_of_children: int):
+        """
+        Method to choose the parents by the selection strategy (the built-in ones draw from self.rng)
+        :param generation: current generation (or the indices of its members)
+        :param fitnesses: fitness values of the members
+        :param fitness_sum: sum of all fitness values
+        :param n_of_children: number of crossover applications
+        :return: fathers list and mothers list
+        """
+        if self.selection_uses_rng:
+            return self.select_parents(generation, fitnesses, fitness_sum, n_of_children, rng=self.rng)
+        return self.select_parents(generation, fitnesses, fitness_sum, n_of_children)
+
+    def create_new_generation(self):
+        """
+        Method for one iteration (generation renewal) performing
+        It creates new_members_percentage * population_size new members, and population_size members
+        are chosen for the new generation by the partial selection (see survivor_indices)
+        """
+        self.timer.start()
+        if self.compact_population:
+            self.create_new_compact_generation()
+            return
+        number_of_crossovers = self.new_members_percentage * self.population_size // 100
+        fathers, mothers = self.choose_parents(self.current_generation, self.current_fitness,
+                                               self.current_fitness_sum, number_of_crossovers)
+        self.timer.lap(SELECTION_PHASE)
+        children = self.mutate_batch(self.crossover_batch(self.get_genes(fathers), self.get_genes(mothers)))
+        if self.duplicates != KEEP_DUPLICATES and len(children):
+            children = children[self.filter_duplicates(children, self.current_genes)]
+        new_members = [self.get_accompaniment(child) for child in children]
+        self.timer.lap(VARIATION_PHASE)
+        children_fitness = self.evaluate_genes(children) if new_members else np.array([])
+        self.remember_best(children, children_fitness)
+        self.timer.lap(EVALUATION_PHASE)
+        overall_fitness = np.concatenate([self.current_fitness, children_fitness])
+        overall_generation = self.current_generation + new_members
+        overall_genes = np.concatenate([self.current_genes, children])
+        survivors = survivor_indices(overall_fitness, self.population_size, len(self.current_generation),
+                                     self.elitism, overall_genes if self.remove_duplicates else None)
+        self.current_generation = [overall_generation[i] for i in survivors]
+        self.current_genes = overall_genes[survivors]
+        self.current_fitness = overall_fitness[survivors].tolist()
+        self.current_fitness_sum = sum(self.current_fitness)
+        self.timer.lap(SURVIVAL_PHASE)
+
+    def create_new_compact_generation(self):
+        """
+        Method for one iteration (generation renewal) over the CompactPopulation,
+        parents are chosen by their indices and children are stored directly into the matrix of genes
+        """
+        number_of_crossovers = self.new_members_percentage * self.population_size // 100
+        fathers, mothers = self.choose_parents(list(range(len(self.population))), self.population.fitness,
+                                               self.population.fitness_sum(), number_of_crossovers)
+        fathers = np.array(fathers, dtype=int)
+        mothers = np.array(mothers, dtype=int)
+        self.timer.lap(SELECTION_PHASE)
+        children = self.mutate_batch(self.crossover_batch(self.population.genes[fathers],
+                                                          self.population.genes[mothers]))
+        if self.duplicates != KEEP_DUPLICATES:
+            kept = self.filter_duplicates(children, self.population.genes)
+            children, fathers, mothers = children[kept], fathers[kept], mothers[kept]
+        self.timer.lap(VARIATION_PHASE)
+        number_of_parents = len(self.population)
+        if self.incremental_evaluation:
+            components = self.evaluate_children_incrementally(children, fathers, mothers)
+            self.population = self.population.extend(children, self.evaluator.combine(components), components)
+        else:
+            self.population = self.population.extend(children, self.evaluate_genes(children))
+        self.remember_best(children, self.population.fitness[number_of_parents:])
+        self.timer.lap(EVALUATION_PHASE)
+        self.population = self.population.select_fittest(self.population_size, number_of_parents, self.elitism,
+                                                         self.remove_duplicates)
+        self.timer.lap(SURVIVAL_PHASE)
+
+    def filter_duplicates(self, children: np.ndarray, population_genes: np.ndarray):
+        """
+        Method for applying the duplicates policy to the children before their evaluation
+        :param children: matrix of genes of the children (mutated in place by REMUTATE_DUPLICATES)
+        :param population_genes: matrix of genes of the current population
+        :return: boolean array, True for the children to keep
+        """
+        known = gene_keys(population_genes)
+        duplicates = duplicate_rows(children, known)
+        if self.duplicates == REMUTATE_DUPLICATES:
+            for attempt in range(REMUTATION_ATTEMPTS):
+                if not duplicates.any():
+                    break
+                repeated = np.flatnonzero(duplicates)
+                children[repeated] = self.mutate_batch(children[repeated])
+                duplicates[repeated] = duplicate_rows(children[repeated], known)
+        if self.duplicates_per_generation:
+            self.duplicates_per_generation[-1] += int(np.count_nonzero(duplicates))
+        return ~duplicates
+
+    def population_diversity(self):
+        """
+        :return: fraction of distinct members and the average entropy of bars of the current generation
+        """
+        genes = self.population.genes if self.compact_population else self.current_genes
+        return diversity(genes, len(self.chords))
+
+    def evaluate_children_incrementally(self, children: np.ndarray, fathers: np.ndarray, mothers: np.ndarray):
+        """
+        Method for calculating fitness terms of the children from the fitness terms of their parents:
+        for every child the parent with fewer different genes is taken as the base,
+        and only the bars affected by the differences are recalculated (see FitnessEvaluator.delta_components)
+        :param children: matrix of genes of the children
+        :param fathers: indices of the fathers in the population
+        :param mothers: indices of the mothers in the population
+        :return: (number of children x 3) array of fitness terms
+        """
+        genes = self.population.genes
+        closer_to_mother = ((children != genes[mothers]).sum(axis=1) < (children != genes[fathers]).sum(axis=1))
+        bases = np.where(closer_to_mother, mothers, fathers)
+        return self.evaluate_genes_subsets(children, lambda indices: self.evaluator.delta_components(
+            children[indices], genes[bases[indices]], self.population.components[bases[indices]]))
+
+    def get_accompaniment(self, genes: np.ndarray) -> Accompaniment:
+        """
+        Method to build the Accompaniment from the row of genes
+        :param genes: row of chord indices
+        :return: Accompaniment with the corresponding chords from the vocabulary
+        """
+        return Accompaniment([self.chords[i] for i in genes])
+
+    def best_fitness(self):
+        """
+        :return: fitness of the best member found so far
+        """
+        return self.best_member_fitness
+
+    def get_best_accompaniment(self) -> Accompaniment:
+        """
+        :return: the best member found so far
+        """
+        return self.get_accompaniment(self.best_member)
+
+    def evolve(self, time_limit: float = None, stall_generations: int = None) -> Accompaniment:
+        """
+        Method to start evolution: generate zeroth generation and perform n_iterations iterations
+        Evolution can be stopped earlier by the time limit or when the best fitness does not grow,
+        the reason is stored into stop_reason
+        :param time_limit: wall-clock time (in seconds) for the whole evolution, no new generations are started
+                after it is over (None for no limit)
+        :param stall_generations: stop after that many generations without the best fitness improvement
+                (None for no limit)
+        :return: best (by fitness) accompaniment generated
+        """
+        self.started = time.monotonic()
+        deadline = None if time_limit is None else self.started + time_limit
+        self.generation_offset = 0
+        self.evaluations_per_generation = [0]
+        self.duplicates_per_generation = [0]
+        self.diversity_per_generation = []
+        self.generate_zeroth_generation()
+        self.continue_evolution(self.n_iterations, deadline, stall_generations)
+        return self.get_best_accompaniment()
+
+    def continue_evolution(self, number_of_generations: int, deadline: float = None, stall_generations: int = None):
+        """
+        Method to perform number_of_generations more iterations over the current generation
+        :param number_of_generations: how many iterations to perform
+        :param deadline: time (as time.monotonic()) after which no new generations are started (None for no deadline)
+        :param stall_generations: stop after that many generations without the best fitness improvement
+                (None for no limit)
+        :return: None, the reason of stopping is stored into stop_reason
+        """
+        self.stop_reason = STOPPED_GENERATIONS
+        best_fitness = self.best_fitness()
+        generations_without_improvement = 0
+        for i in range(number_of_generations):
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = STOPPED_TIME_LIMIT
+                break
+            self.evaluations_per_generation.append(0)
+            self.duplicates_per_generation.append(0)
+            self.create_new_generation()
+            self.finish_generation()
+            if self.best_fitness() > best_fitness:
+                best_fitness = self.best_fitness()
+                generations_without_improvement = 0
+            else:
+                generations_without_improvement += 1
+            if stall_generations is not None and generations_without_improvement >= stall_generations:
+                self.stop_reason = STOPPED_STALL
+                break
@@ -0,0 +1,268 @@
+from core.music_units import *
+from core.constants import *
+from collections import OrderedDict
+
+
+class FitnessEvaluator:
+    """
+    Vectorized fitness calculation for the whole population at once.
+    Population is represented as the (population size x number of bars) integer matrix of genes,
+    where each gene is the index of the chord in the vocabulary (melody.chords)
+    """
+    def __init__(self, melody: Melody, key: Key):
+        """
+        Constructor of the evaluator, precomputes all the lookup tables for the melody and its chord vocabulary
+        :param melody: the initial melody (its duration matrix, chords and their interval weights are used)
+        :param key: the key of the melody (needed for the chord progressions)
+        """
+        self.chords = melody.chords
+        self.number_of_bars = melody.size_in_bars
+        # consonance of every vocabulary chord in every bar: (number of bars x vocabulary size)
+        self.consonance_table = melody.duration_matrix @ melody.interval_weights.T
+        # chords with equal note names (e.g. inverses of one triad) are repetitions of each other
+        note_classes = {}
+        self.note_classes = np.array([note_classes.setdefault(tuple(chord.note_names), len(note_classes))
+                                      for chord in self.chords])
+        self.is_rest = np.array([chord.note_names[0] == REST for chord in self.chords])
+        # scale step of the triad down from the tonic triad (7 for the chords that are not triads of the key)
+        triads = list(map(lambda x: x.name, self.chords[:7]))
+        self.steps = np.array([(triads.index(key.name) - triads.index(chord.name)) % 7 if chord.name in triads
+                               else 7 for chord in self.chords])
+
+    @staticmethod
+    def encode_steps(steps: np.ndarray):
+        """
+        Method to encode PROGRESSION_LENGTH consecutive scale steps (along the last axis) as one base-8 number
+        :param steps: array with the last axis of length PROGRESSION_LENGTH
+        :return: array of codes (or one code)
+        """
+        code = 0
+        for a in range(PROGRESSION_LENGTH):
+            code = code * 8 + steps[..., a]
+        return code
+
+    @classmethod
+    def symbol_transitions(cls, classes: np.ndarray, steps: np.ndarray, is_rest: np.ndarray):
+        """
+        Method to tabulate the repetition and progression bonuses between the symbols (e.g. groups of interchangeable
+        chords) for the dynamic programming over the bars. "No chord" (before the first bar and after the last one)
+        is added as the last symbol
+        :param classes: note classes of the symbols (see note_classes)
+        :param steps: scale steps of the symbols down from the tonic triad (see steps)
+        :param is_rest: is the symbol silent or not
+        :return: repetition[a, b, c] bonus of the middle chord b given its neighbours a and c
+                and progression[a, b, c, d] bonus of the window (a, b, c, d), both multiplied by their coefficients
+        """
+        classes = np.append(classes, -1)
+        steps = np.append(steps, 7)
+        is_rest = np.append(is_rest, False)
+        equal = (classes[:, None] == classes[None, :]) & (classes[:, None] >= 0)
+        repetition = ((equal[:, :, None] ^ equal[None, :, :]) & ~is_rest[None, :, None]) * REPETITION_COEFFICIENT
+        codes = cls.encode_steps(np.stack(np.meshgrid(steps, steps, steps, steps, indexing='ij'), -1))
+        progression = cls.progression_table[codes] * (PROGRESSION_COEFFICIENT * PROGRESSION_BONUS)
+        return repetition, progression
+
+    def raw_consonance(self, genes: np.ndarray):
+        """
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: consonance fitness of every member before it is clamped to be at least 1
+        """
+        return self.consonance_table[np.arange(genes.shape[1]), genes].sum(axis=1)
+
+    def consonance(self, genes: np.ndarray):
+        """
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: consonance fitness (at least 1) of every member
+        """
+        return np.maximum(1, self.raw_consonance(genes))
+
+    def repetition_terms(self, genes: np.ndarray, rows: np.ndarray, bars: np.ndarray):
+        """
+        Repetition bonus of the separate bars: chord is rewarded when it is repeated by exactly one of its neighbours
+        (and it is not silent)
+        :param genes: (population size x number of bars) matrix of chord indices
+        :param rows: members the bars belong to
+        :param bars: indices of the bars
+        :return: array of 0 and 1 for every (row, bar) pair
+        """
+        number_of_bars = genes.shape[1]
+        flat_genes = genes.ravel()
+        positions = rows * number_of_bars + bars
+        chords = flat_genes[positions]
+        classes = self.note_classes[chords]
+        left = (bars > 0) & (self.note_classes[flat_genes[np.maximum(positions - 1, 0)]] == classes)
+        right = ((bars < number_of_bars - 1) &
+                 (self.note_classes[flat_genes[np.minimum(positions + 1, len(flat_genes) - 1)]] == classes))
+        return ((left ^ right) & ~self.is_rest[chords]).astype(int)
+
+    def progression_matches(self, genes: np.ndarray, rows: np.ndarray, starts: np.ndarray):
+        """
+        :param genes: (population size x number of bars) matrix of chord indices
+        :param rows: members the windows belong to
+        :param starts: first bars of the windows of PROGRESSION_LENGTH chords
+        :return: boolean array, True for the windows forming one of the MAIN_PROGRESSIONS
+        """
+        flat_genes = genes.ravel()
+        positions = rows * genes.shape[1] + starts
+        code = 0
+        for a in range(PROGRESSION_LENGTH):
+            code = code * 8 + self.steps[flat_genes[positions + a]]
+        return self.progression_table[code]
+
+    def chord_repetition(self, genes: np.ndarray):
+        """
+        Chord is rewarded when it is repeated by exactly one of its neighbours (and it is not silent)
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: chord repetition fitness of every member
+        """
+        classes = self.note_classes[genes]
+        equal = classes[:, 1:] == classes[:, :-1]
+        no_pair = np.zeros((genes.shape[0], 1), dtype=bool)
+        left = np.hstack([no_pair, equal])
+        right = np.hstack([equal, no_pair])
+        return ((left ^ right) & ~self.is_rest[genes]).sum(axis=1)
+
+    def chord_progression(self, genes: np.ndarray):
+        """
+        Every window of PROGRESSION_LENGTH triads forming one of the MAIN_PROGRESSIONS gives PROGRESSION_BONUS
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: chord progression fitness of every member
+        """
+        if genes.shape[1] < PROGRESSION_LENGTH:
+            return np.zeros(genes.shape[0], dtype=int)
+        windows = np.lib.stride_tricks.sliding_window_view(self.steps[genes], PROGRESSION_LENGTH, axis=1)
+        return PROGRESSION_BONUS * self.progression_table[self.encode_steps(windows)].sum(axis=1)
+
+    def evaluate(self, genes: np.ndarray):
+        """
+        Method for calculating fitness of all the members of the population in one pass
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: array of fitness values in the same order
+        """
+        return (CONSONANCE_COEFFICIENT * self.consonance(genes) +
+                REPETITION_COEFFICIENT * self.chord_repetition(genes) +
+                PROGRESSION_COEFFICIENT * self.chord_progression(genes))
+
+    def components(self, genes: np.ndarray):
+        """
+        Method for calculating the separate fitness terms of all the members, needed for the incremental evaluation
+        :param genes: (population size x number of bars) matrix of chord indices
+        :return: (population size x 3) array of consonance (not clamped), chord repetition and progression fitness
+        """
+        return np.stack([self.raw_consonance(genes), self.chord_repetition(genes),
+                         self.chord_progression(genes)], axis=1).astype(float)
+
+    @staticmethod
+    def combine(components: np.ndarray):
+        """
+        Method for calculating fitness values from the separate fitness terms
+        :param components: (number of members x 3) array of fitness terms (see components)
+        :return: array of fitness values
+        """
+        return (CONSONANCE_COEFFICIENT * np.maximum(1, components[:, 0]) +
+                REPETITION_COEFFICIENT * components[:, 1] +
+                PROGRESSION_COEFFICIENT * components[:, 2])
+
+    def delta_components(self, genes: np.ndarray, bases: np.ndarray, base_components: np.ndarray):
+        """
+        Method for the incremental calculation of fitness terms of the members which differ from the known members
+        (bases) only in some genes. Only the changed bars, their neighbours (for repetitions) and the windows
+        containing them (for progressions) are recalculated, so the cost depends on the number of changes
+        :param genes: (number of members x number of bars) matrix of chord indices
+        :param bases: matrix of chord indices of the known members (one for each member)
+        :param base_components: fitness terms of the known members (see components)
+        :return: (number of members x 3) array of fitness terms of the members
+        """
+        number_of_members, number_of_bars = genes.shape
+        components = base_components.astype(float)
+        changed = genes != bases
+        rows, bars = np.nonzero(changed)
+        if len(rows) == 0:
+            return components
+        components[:, 0] += np.bincount(rows, self.consonance_table[bars, genes[rows, bars]] -
+                                        self.consonance_table[bars, bases[rows, bars]], number_of_members)
+        # repetition terms of the changed bars and their neighbours
+        affected = changed.copy()
+        affected[:, 1:] |= changed[:, :-1]
+        affected[:, :-1] |= changed[:, 1:]
+        rows, bars = np.nonzero(affected)
+        components[:, 1] += np.bincount(rows, self.repetition_terms(genes, rows, bars) -
+                                        self.repetition_terms(bases, rows, bars), number_of_members)
+        # progression windows containing at least one changed bar
+        if number_of_bars >= PROGRESSION_LENGTH:
+            affected = changed[:, :number_of_bars - PROGRESSION_LENGTH + 1].copy()
+            for a in range(1, PROGRESSION_LENGTH):
+                affected |= changed[:, a:number_of_bars - PROGRESSION_LENGTH + 1 + a]
+            rows, starts = np.nonzero(affected)
+            components[:, 2] += PROGRESSION_BONUS * np.bincount(
+                rows, self.progression_matches(genes, rows, starts).astype(int) -
+                self.progression_matches(bases, rows, starts), number_of_members)
+        return components
+
+
+class FitnessCache:
+    """
+    Bounded memo table of fitness values (or fitness terms) keyed by the gene sequence
+    (the bytes of the row of chord indices)
+    Least recently used entries are evicted first. Hits and misses are counted to see how many evaluations
+    are actually new
+    """
+    def __init__(self, max_size: int):
+        """
+        Constructor of the cache
+        :param max_size: maximal number of stored values
+        """
+        self.max_size = max_size
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """
+        :return: number of stored values
+        """
+        return len(self.table)
+
+    def evaluate(self, genes: np.ndarray, evaluate):
+        """
+        Method for getting the memorized values (fitness or fitness terms) of the members,
+        only the unknown gene sequences are evaluated (once, even if they are repeated in genes)
+        :param genes: (number of members x number of bars) matrix of chord indices
+        :param evaluate: function which calculates the values for the rows of genes with the given indices
+        :return: array of values in the same order
+        """
+        values = [None] * len(genes)
+        missing = dict()
+        for i in range(len(genes)):
+            key = genes[i].tobytes()
+            if key in self.table:
+                self.table.move_to_end(key)
+                values[i] = self.table[key]
+                self.hits += 1
+            elif key in missing:
+                missing[key].append(i)
+                self.hits += 1
+            else:
+                missing[key] = [i]
+                self.misses += 1
+        if missing:
+            new_values = evaluate(np.array([indices[0] for indices in missing.values()]))
+            for key, indices, value in zip(missing.keys(), missing.values(), new_values):
+                for i in indices:
+                    values[i] = value
+                self.table[key] = value
+            while len(self.table) > self.max_size:
+                self.table.popitem(last=False)
+        return np.array(values)
+
+    def hit_rate(self):
+        """
+        :return: fraction of lookups answered without evaluation
+        """
+        return self.hits / max(1, self.hits + self.misses)
+
+
+# windows of steps are encoded as base-8 numbers, only the main progressions are marked in the table shared by all
+# the evaluators and solvers (windows with non-triad chords contain the digit 7, so they are never marked)
+FitnessEvaluator.progression_table = np.zeros(8 ** PROGRESSION_LENGTH, dtype=bool)
+FitnessEvaluator.progression_table[FitnessEvaluator.encode_steps(np.array(MAIN_PROGRESSIONS))] = True
@@ -1,92 +1,243 @@
-from core.evolutionary_algorithm import *
-
-
-class GeneratorOfAccompaniment:
-    """
-    Class for all generation handling. Instance of this class is an instrument to use for converting into
-    the MIDI file with all the needed settings
-    """
-
-    def __init__(self, melody: Melody, number_of_generations_ea=100, population_size_ea=1000,
-                 new_members_percentage_ea=30):
-        """
-        Constructor with all the needed parameters for evolutionary algorithm described above
-        :param melody: Melody of the original input track
-        :param number_of_generations_ea: how many iterations to perform (the amount of new generations to make)
-        :param population_size_ea: the size of one generation (in members)
-        :param new_members_percentage_ea: how many percents of new members (with respect to the initial population size)
-                to generate using crossover and mutations for each generation
-        """
-        self.melody = melody
-        self.chords = melody.chords
-        self.key = melody.key
-        self.ea = EvolutionaryAlgorithm(number_of_generations_ea, population_size_ea, new_members_percentage_ea,
-                                        melody, self.key)
-
-    def get_best_accompaniment(self):
-        """
-        :return: the best accompaniment found by the evolutionary algorithm
-        """
-        return self.ea.evolve()
-
-    def generate_midi_accompaniment(self, output_file_name: str, style: int):
-        """
-        Method that creates the MIDI output file with the best generated accompaniment and initial melody.
-        Uses settings provided to it
-        :param output_file_name:
-        :param style:
-        :param rests_generation:
-        :return:
-        """
-        accompaniment = self.get_best_accompaniment()
-        chords_part = mus.stream.Part()
-        chords_instruments = [mus.instrument.ElectricPiano(),
-                              mus.instrument.AcousticGuitar(),
-                              mus.instrument.Violoncello(),
-                              mus.instrument.Flute(),
-                              mus.instrument.Xylophone(),
-                              mus.instrument.Choir()]
-        chords_octave = [(self.melody.lowest_octave - 1),
-                         (self.melody.lowest_octave - 1),
-                         (self.melody.lowest_octave - 1),
-                         (self.melody.average_octave - 1),
-                         (self.melody.lowest_octave - 1),
-                         (self.melody.highest_octave + 0)]
-        chords_volume = [self.melody.get_average_volume(),
-                         min(127, self.melody.get_average_volume() + 4),
-                         max(16, self.melody.get_average_volume() - 10),
-                         min(127, self.melody.get_average_volume() + 20),
-                         max(16, self.melody.get_average_volume() - 8),
-                         max(16, self.melody.get_average_volume() - 8)]
-        chords_part.insert(chords_instruments[style])
-        for chord in accompaniment.chords:
-            chord21 = chord.get_chord21()
-            if type(chord21) != mus.note.Rest:
-                for i in range(len(chord21.notes)):
-                    if type(chord.notes[i]) != Rest:
-                        chord21.notes[i].octave = chords_octave[style] + chord.notes[i].octave_offset
-                        chord21.notes[i].volume = chords_volume[style]
-                        chord21.duration.quarterLength = 1.0
-                chords_part.append(mus.chord.Chord(chord21))
-            else:
-                chords_part.append(mus.note.Rest(duration=mus.duration.Duration(1.0)))
-        music_part = mus.stream.Part()
-        music_instruments = [mus.instrument.ElectricPiano(),
-                             mus.instrument.AcousticGuitar(),
-                             mus.instrument.Violin(),
-                             mus.instrument.Koto(),
-                             mus.instrument.Xylophone(),
-                             mus.instrument.ChurchBells()]
-        music_part.insert(music_instruments[style])
-        for note in self.melody.notes:
-            if type(note) != Rest:
-                music_part.append(note.note_itself)
-            else:
-                music_part.append(note.note_itself)
-        output = mus.stream.Stream()
-        output.append(music_part)
-        output.append(chords_part)
-        midi_file = mus.midi.translate.streamToMidiFile(output)
-        midi_file.open(output_file_name, 'wb')
-        midi_file.write()
-        midi_file.close()
+from core.evolutionary_algorithm import *
+from core.dynamic_programming import *
+from core.islands import *
+from core.midi_io import *
+from core.result_cache import *
+
+
+class GeneratorOfAccompaniment:
+    """
+    Class for all generation handling. Instance of this class is an instrument to use for converting into
+    the MIDI file with all the needed settings
+    """
+
+    def __init__(self, melody: Melody, number_of_generations_ea=100, population_size_ea=1000,
+                 new_members_percentage_ea=30, compact_population_ea=False,
+                 selection_strategy_ea=ROULETTE_SELECTION, fitness_cache_size_ea=0,
+                 incremental_evaluation_ea=False, engine=EVOLUTIONARY_ENGINE, islands_ea=1, workers_ea=None,
+                 migration_interval_ea=10, island_seeds_ea=None, time_limit_ea=None, stall_generations_ea=None,
+                 elitism_ea=None, remove_duplicates_ea=False, duplicates_ea=KEEP_DUPLICATES, track_diversity_ea=False,
+                 observers_ea=None, result_cache: ResultCache = None, seed: int = None):
+        """
+        Constructor with all the needed parameters for evolutionary algorithm described above
+        :param melody: Melody of the original input track
+        :param number_of_generations_ea: how many iterations to perform (the amount of new generations to make)
+        :param population_size_ea: the size of one generation (in members)
+        :param new_members_percentage_ea: how many percents of new members (with respect to the initial population size)
+                to generate using crossover and mutations for each generation
+        :param compact_population_ea: store the population of evolutionary algorithm as the integer matrix of genes
+                instead of the list of Accompaniments (see EvolutionaryAlgorithm)
+        :param selection_strategy_ea: parents' selection strategy of evolutionary algorithm
+                (roulette, rank, tournament or the custom function, see EvolutionaryAlgorithm)
+        :param fitness_cache_size_ea: how many fitness values of evaluated gene sequences to memorize (0 to disable)
+        :param incremental_evaluation_ea: evaluate children incrementally from their parents' fitness terms
+                (needs compact_population_ea)
+        :param engine: search engine for the best accompaniment: 'ea' for the evolutionary algorithm or
+                'dp' for the exact dynamic programming solver (the parameters of evolutionary algorithm are not used)
+        :param islands_ea: number of populations evolved in parallel processes with migrations (see IslandModel),
+                1 for the single population. The island model always uses the compact population
+        :param workers_ea: number of worker processes for the islands (by default, as many as processors)
+        :param migration_interval_ea: how many generations islands evolve between migrations of their best members
+        :param island_seeds_ea: list of random seeds, one for every island (by default, random ones)
+        :param time_limit_ea: wall-clock time limit (in seconds) for the evolution, None for no limit
+        :param stall_generations_ea: stop the evolution after that many generations without the best fitness
+                improvement, None for no limit (the reason of stopping is stored into ea.stop_reason)
+        :param elitism_ea: survivor selection of evolutionary algorithm: None for the most fit parents and children,
+                otherwise the number of the best parents kept while the children replace the others
+        :param remove_duplicates_ea: keep only distinct members in the generations of evolutionary algorithm
+        :param duplicates_ea: policy for the children repeating the existing members: 'keep', 'reject' or 'remutate'
+        :param track_diversity_ea: measure the diversity of every generation (stored into ea.diversity_per_generation)
+        :param observers_ea: list of GenerationObservers of evolutionary algorithm (e.g. JsonlTraceSink)
+        :param result_cache: ResultCache for storing the found accompaniments on disk, the search is skipped
+                if the result for the same melody, rests permission, search parameters and seed is already stored
+                (None to disable)
+        :param seed: random seed of the search (None for the unseeded search)
+        """
+        self.melody = melody
+        self.chords = melody.chords
+        self.key = melody.key
+        self.ea = EvolutionaryAlgorithm(number_of_generations_ea, population_size_ea, new_members_percentage_ea,
+                                        melody, self.key, compact_population_ea or islands_ea > 1,
+                                        selection_strategy_ea, fitness_cache_size_ea, incremental_evaluation_ea,
+                                        seed, elitism_ea, remove_duplicates_ea, duplicates_ea, track_diversity_ea,
+                                        observers_ea)
+        if engine not in (EVOLUTIONARY_ENGINE, DYNAMIC_PROGRAMMING_ENGINE):
+            raise ValueError('Unknown engine: ' + str(engine))
+        self.engine = engine
+        self.solver = DynamicProgrammingSolver(melody, self.key) if engine == DYNAMIC_PROGRAMMING_ENGINE else None
+        self.time_limit = time_limit_ea
+        self.stall_generations = stall_generations_ea
+        self.seed = seed
+        if seed is not None and island_seeds_ea is None and islands_ea > 1:
+            seeds_generator = random.Random(seed)
+            island_seeds_ea = [seeds_generator.randrange(2 ** 32) for i in range(islands_ea)]
+        self.islands = (IslandModel(self.ea, islands_ea, workers_ea, migration_interval_ea, seeds=island_seeds_ea)
+                        if islands_ea > 1 else None)
+        # everything the found accompaniment depends on (the number of workers and the fitness cache do not matter),
+        # the search with the custom selection function is not cached
+        self.result_cache = result_cache if not callable(selection_strategy_ea) else None
+        self.search_parameters = {'engine': engine}
+        if engine == EVOLUTIONARY_ENGINE:
+            self.search_parameters.update({
+                'number_of_generations_ea': number_of_generations_ea, 'population_size_ea': population_size_ea,
+                'new_members_percentage_ea': new_members_percentage_ea,
+                'compact_population_ea': compact_population_ea or islands_ea > 1,
+                'selection_strategy_ea': None if callable(selection_strategy_ea) else selection_strategy_ea,
+                'incremental_evaluation_ea': incremental_evaluation_ea, 'islands_ea': islands_ea,
+                'migration_interval_ea': migration_interval_ea, 'island_seeds_ea': island_seeds_ea,
+                'time_limit_ea': time_limit_ea, 'stall_generations_ea': stall_generations_ea,
+                'elitism_ea': elitism_ea, 'remove_duplicates_ea': remove_duplicates_ea,
+                'duplicates_ea': duplicates_ea})
+        # the result of the last search, reused by all the renderings
+        self.best_accompaniment = None
+        # was the last result taken from the result cache or not
+        self.cached = False
+
+    def get_best_accompaniment(self, search_again: bool = False, time_limit: float = None):
+        """
+        The search is performed only once, then the found accompaniment is returned.
+        With the result cache, the stored accompaniment is returned instead of the search
+        :param search_again: run the search again even if the accompaniment is already found (or cached)
+        :param time_limit: external time limit (in seconds) for the evolution (e.g. the deadline of the service job),
+                the shorter of it and time_limit_ea is used. It is not a search parameter, so it is not a part
+                of the result cache key, and the accompaniment of the evolution stopped by it is not cached
+        :return: the best accompaniment found by the evolutionary algorithm (or the dynamic programming solver)
+        """
+        if self.best_accompaniment is not None and not search_again:
+            return self.best_accompaniment
+        result_key = None
+        if self.result_cache is not None:
+            result_key = self.result_cache.result_key(self.melody, self.search_parameters, self.seed)
+            result = None if search_again else self.result_cache.get(self.melody, result_key)
+            if result is not None:
+                self.best_accompaniment = result[0]
+                self.cached = True
+                return self.best_accompaniment
+        self.cached = False
+        if self.seed is not None:
+            # only the generator of the search is reseeded, the global random state of the process is not touched
+            self.ea.rng = np.random.default_rng(self.seed)
+        external_limit = time_limit is not None and (self.time_limit is None or time_limit < self.time_limit)
+        if external_limit:
+            time_limit = max(time_limit, 0.0)
+        else:
+            time_limit = self.time_limit
+        if self.engine == DYNAMIC_PROGRAMMING_ENGINE:
+            self.best_accompaniment = self.solver.solve()
+        elif self.islands is not None:
+            self.best_accompaniment = self.islands.evolve(time_limit, self.stall_generations)
+        else:
+            self.best_accompaniment = self.ea.evolve(time_limit, self.stall_generations)
+        if external_limit and self.engine != DYNAMIC_PROGRAMMING_ENGINE and self.ea.stop_reason == STOPPED_TIME_LIMIT:
+            # the search was cut short, its result does not match the search parameters of the key
+            result_key = None
+        if result_key is not None:
+            self.result_cache.put(self.melody, result_key, self.best_accompaniment,
+                                  self.ea.calculate_fitness(self.best_accompaniment))
+        return self.best_accompaniment
+
+    def get_chords_octave(self, style: int):
+        """
+        :param style: style number (0 to 5)
+        :return: base octave of the chords for the style
+        """
+        chords_octave = [(self.melody.lowest_octave - 1),
+                         (self.melody.lowest_octave - 1),
+                         (self.melody.lowest_octave - 1),
+                         (self.melody.average_octave - 1),
+                         (self.melody.lowest_octave - 1),
+                         (self.melody.highest_octave + 0)]
+        return chords_octave[style]
+
+    def get_chords_volume(self, style: int):
+        """
+        :param style: style number (0 to 5)
+        :return: volume (velocity) of the chords for the style
+        """
+        chords_volume = [self.melody.get_average_volume(),
+                         min(127, self.melody.get_average_volume() + 4),
+                         max(16, self.melody.get_average_volume() - 10),
+                         min(127, self.melody.get_average_volume() + 20),
+                         max(16, self.melody.get_average_volume() - 8),
+                         max(16, self.melody.get_average_volume() - 8)]
+        return chords_volume[style]
+
+    def generate_midi_accompaniment(self, output_file_name: str, style: int, accompaniment: Accompaniment = None,
+                                    renderer: str = NATIVE_RENDERER):
+        """
+        Method that creates the MIDI output file with the best generated accompaniment and initial melody.
+        Uses settings provided to it
+        :param output_file_name:
+        :param style:
+        :param accompaniment: accompaniment to render (by default, the best one, it is searched for only once)
+        :param renderer: 'native' to write the MIDI file directly or 'music21' to build and write music21 streams
+                (both produce the same file)
+        :return: the rendered accompaniment
+        """
+        if renderer not in (NATIVE_RENDERER, MUSIC21_RENDERER):
+            raise ValueError('Unknown renderer: ' + str(renderer))
+        if accompaniment is None:
+            accompaniment = self.get_best_accompaniment()
+        if renderer == NATIVE_RENDERER:
+            write_midi_accompaniment(output_file_name, melody_notes(self.melody.notes),
+                                     chords_notes(accompaniment, self.get_chords_octave(style),
+                                                  self.get_chords_volume(style)),
+                                     MELODY_INSTRUMENTS[style], CHORDS_INSTRUMENTS[style])
+            return accompaniment
+        chords_part = mus.stream.Part()
+        chords_instruments = [mus.instrument.ElectricPiano(),
+                              mus.instrument.AcousticGuitar(),
+                              mus.instrument.Violoncello(),
+                              mus.instrument.Flute(),
+                              mus.instrument.Xylophone(),
+                              mus.instrument.Choir()]
+        chords_octave = self.get_chords_octave(style)
+        chords_volume = self.get_chords_volume(style)
+        chords_part.insert(chords_instruments[style])
+        for chord in accompaniment.chords:
+            chord21 = chord.get_chord21()
+            if type(chord21) != mus.note.Rest:
+                for i in range(len(chord21.notes)):
+                    if type(chord.notes[i]) != Rest:
+                        chord21.notes[i].octave = chords_octave + chord.notes[i].octave_offset
+                        chord21.notes[i].volume = chords_volume
+                        chord21.duration.quarterLength = 1.0
+                chords_part.append(mus.chord.Chord(chord21))
+            else:
+                chords_part.append(mus.note.Rest(duration=mus.duration.Duration(1.0)))
+        music_part = mus.stream.Part()
+        music_instruments = [mus.instrument.ElectricPiano(),
+                             mus.instrument.AcousticGuitar(),
+                             mus.instrument.Violin(),
+                             mus.instrument.Koto(),
+                             mus.instrument.Xylophone(),
+                             mus.instrument.ChurchBells()]
+        music_part.insert(music_instruments[style])
+        for note in self.melody.notes:
+            if type(note) != Rest:
+                music_part.append(note.note_itself)
+            else:
+                music_part.append(note.note_itself)
+        output = mus.stream.Stream()
+        output.append(music_part)
+        output.append(chords_part)
+        midi_file = mus.midi.translate.streamToMidiFile(output)
+        midi_file.open(output_file_name, 'wb')
+        midi_file.write()
+        midi_file.close()
+        return accompaniment
+
+    def generate_midi_accompaniments(self, output_file_names: dict, accompaniment: Accompaniment = None,
+                                     renderer: str = NATIVE_RENDERER):
+        """
+        Method that creates MIDI output files of several styles with the same accompaniment
+        :param output_file_names: dictionary of the output file names by the style numbers
+        :param accompaniment: accompaniment to render (by default, the best one, it is searched for only once)
+        :param renderer: 'native' or 'music21' (see generate_midi_accompaniment)
+        :return: the rendered accompaniment
+        """
+        if accompaniment is None:
+            accompaniment = self.get_best_accompaniment()
+        for style, output_file_name in output_file_names.items():
+            self.generate_midi_accompaniment(output_file_name, style, accompaniment, renderer)
+        return accompaniment
@@ -1,53 +1,181 @@
-from core.generator import *
-
-
-def start():
-    """
-    Main function for running the program and setting parameters. Provides interface for working with user.
-    Here user specifies input files' names, style number and the rest chord generation permission
-    :return:
-    """
-    print('Welcome to the MIDI Accompaniment generator!\n',
-          'The program was made by Vladislav Urzhumov, student of Innopolis University. November, 2022.')
-    print(' The program will generate one output file for each input file specified.')
-    print('It\'s interface is simple, however, I\'ve tried to make it as user friendly as possible!\n')
-    print('In the following input field you will be able to provide filenames with extensions (only .mid) of input',
-          'files (separated by space) to process them in the program.\n',
-          'If you just press enter without specifying any names,',
-          'base input files will be used.\n',
-          'Base input files (according to the task) are: input1.mid, input2.mid, input3.mid')
-    files = (input('Please, specify filenames or just press enter for sample generation: ').split() or
-             ['data/samples/input1.mid', 'data/samples/input2.mid', 'data/samples/input3.mid'])
-    print('\nGreat! Now, please, specify the style of the music you want to receive in the output files.',
-          '\nStyles differ in instruments used, sometimes octaves for the accompaniment  and even additional parts.',
-          '\nThe list of currently available styles:\n',
-          '0 (Stock, just press enter) - Classical piano\n',
-          '1 - Acoustic Guitar\n',
-          '2 - Orchestra with Violin and Violoncello\n',
-          '3 - Japanese style (Koto and Flute)\n',
-          '4 - Xylophone\n',
-          '5 - Choir and Church Bell\n')
-    style = (int(input('Please, specify the number of style or press enter: ') or 0))
-    while style < 0 or style > 5:
-        style = (int(input('Please, specify correct number (0 to 5) or press enter: ') or 0))
-    print('\nPerfect! Last thing before we start. Should the program use Rests',
-          '("silence" chords) as the part of Accompaniment?')
-    rests = any(input('Type something if yes, or just press enter for no: '))
-    print('Thank you! Now we start! It will take some time...\n')
-    for input_file in files:
-        try:
-            stream = mus.converter.parse(input_file)
-            print('Your file', input_file, 'was converted succesfully')
-            melody = Melody(stream, rests)
-            print('The key of the melody was determined as', melody.key.name)
-            generator = GeneratorOfAccompaniment(melody)
-            filename = None
-            try:
-                filename = ('data/results/output-' + input_file.lstrip('data/samples/input').rstrip('.mid') + '-'
-                            + melody.key.name + '.mid')
-                generator.generate_midi_accompaniment(filename, style)
-                print('The Accompaniment was successfully generated!')
-            except FileNotFoundError:
-                print('Error! Output file', filename, 'can not be created in the specified directory')
-        except FileNotFoundError:
-            print('Error! File', input_file, 'was not found in the current directory or has an incorrect name.')
+from core.generator import *
+from core.batch import *
+from core.service import *
+import argparse
+
+
+def start():
+    """
+    Main function for running the program and setting parameters. Provides interface for working with user.
+    Here user specifies input files' names, style number and the rest chord generation permission
+    :return:
+    """
+    print('Welcome to the MIDI Accompaniment generator!\n',
+          'The program was made by Vladislav Urzhumov, student of Innopolis University. November, 2022.')
+    print(' The program will generate one output file for each input file specified.')
+    print('It\'s interface is simple, however, I\'ve tried to make it as user friendly as possible!\n')
+    print('In the following input field you will be able to provide filenames with extensions (only .mid) of input',
+          'files (separated by space) to process them in the program.\n',
+          'If you just press enter without specifying any names,',
+          'base input files will be used.\n',
+          'Base input files (according to the task) are: input1.mid, input2.mid, input3.mid')
+    files = (input('Please, specify filenames or just press enter for sample generation: ').split() or
+             ['data/samples/input1.mid', 'data/samples/input2.mid', 'data/samples/input3.mid'])
+    print('\nGreat! Now, please, specify the style of the music you want to receive in the output files.',
+          '\nStyles differ in instruments used, sometimes octaves for the accompaniment  and even additional parts.',
+          '\nThe list of currently available styles:\n',
+          '0 (Stock, just press enter) - Classical piano\n',
+          '1 - Acoustic Guitar\n',
+          '2 - Orchestra with Violin and Violoncello\n',
+          '3 - Japanese style (Koto and Flute)\n',
+          '4 - Xylophone\n',
+          '5 - Choir and Church Bell\n')
+    style = (int(input('Please, specify the number of style or press enter: ') or 0))
+    while style < 0 or style > 5:
+        style = (int(input('Please, specify correct number (0 to 5) or press enter: ') or 0))
+    print('\nPerfect! Last thing before we start. Should the program use Rests',
+          '("silence" chords) as the part of Accompaniment?')
+    rests = any(input('Type something if yes, or just press enter for no: '))
+    print('Thank you! Now we start! It will take some time...\n')
+    for input_file in files:
+        try:
+            melody = load_melody(input_file, rests)
+            print('Your file', input_file, 'was converted succesfully')
+            print('The key of the melody was determined as', melody.key.name)
+            generator = GeneratorOfAccompaniment(melody)
+            filename = None
+            try:
+                filename = ('data/results/output-' + input_file.lstrip('data/samples/input').rstrip('.mid') + '-'
+                            + melody.key.name + '.mid')
+                generator.generate_midi_accompaniment(filename, style)
+                print('The Accompaniment was successfully generated!')
+            except FileNotFoundError:
+                print('Error! Output file', filename, 'can not be created in the specified directory')
+        except FileNotFoundError:
+            print('Error! File', input_file, 'was not found in the current directory or has an incorrect name.')
+
+
+def start_batch(arguments: list):
+    """
+    Non-interactive entry point for processing many files at once in the pool of worker processes.
+    Results are recorded into the JSONL manifest, files already done are skipped when the command is re-run
+    :param arguments: command line arguments (without the program name)
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Generate accompaniments for many MIDI files')
+    parser.add_argument('sources', nargs='+', help='directories, glob patterns or names of .mid files')
+    parser.add_argument('--output', default='data/results', help='directory for the output files')
+    parser.add_argument('--manifest', default=None, help='JSONL manifest (default: manifest.jsonl in the output)')
+    parser.add_argument('--style', type=int, nargs='+', default=[0], choices=range(6),
+                        help='style numbers (0 to 5), several styles are rendered from one search')
+    parser.add_argument('--rests', action='store_true', help='allow rest chords')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--engine', default=EVOLUTIONARY_ENGINE,
+                        choices=[EVOLUTIONARY_ENGINE, DYNAMIC_PROGRAMMING_ENGINE], help='search engine')
+    parser.add_argument('--generations', type=int, default=100, help='number of generations of the EA')
+    parser.add_argument('--population', type=int, default=1000, help='population size of the EA')
+    parser.add_argument('--retry-failed', action='store_true', help='process the files failed before again')
+    parser.add_argument('--music21-reader', action='store_true',
+                        help='always read the files with music21 instead of the native MIDI reader')
+    parser.add_argument('--renderer', default=NATIVE_RENDERER, choices=[NATIVE_RENDERER, MUSIC21_RENDERER],
+                        help='MIDI rendering backend')
+    parser.add_argument('--cache', default=None, help='directory of the persistent result cache (off by default)')
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help='how many results the cache keeps')
+    parser.add_argument('--seed', type=int, default=None, help='random seed of the search')
+    parser.add_argument('--trace', default=None, help='JSONL file for the statistics of every generation of the EA')
+    parser.add_argument('--metrics', default=None, help='file for the EA metrics in the Prometheus text format')
+    arguments = parser.parse_args(arguments)
+    manifest_path = arguments.manifest or os.path.join(arguments.output, 'manifest.jsonl')
+    os.makedirs(arguments.output, exist_ok=True)
+    generator_parameters = {'number_of_generations_ea': arguments.generations,
+                            'population_size_ea': arguments.population, 'engine': arguments.engine,
+                            'seed': arguments.seed}
+    observers = []
+    if arguments.trace is not None:
+        observers.append(JsonlTraceSink(arguments.trace))
+    if arguments.metrics is not None:
+        observers.append(PrometheusTextSink(arguments.metrics))
+    if arguments.cache is not None:
+        generator_parameters['result_cache'] = ResultCache(arguments.cache, arguments.cache_size)
+    style = arguments.style[0] if len(arguments.style) == 1 else arguments.style
+    records = process_corpus(arguments.sources, arguments.output, manifest_path, style, arguments.rests,
+                             arguments.workers, generator_parameters, arguments.retry_failed,
+                             not arguments.music21_reader, arguments.renderer, observers)
+    for record in records:
+        if record['status'] == DONE:
+            print(record['file'], '->', record['output'], '(' + record['key'] + ', fitness',
+                  round(record['fitness'], 2), 'in', round(record['seconds']['total'], 2),
+                  's, cached)' if record.get('cached') else 's)')
+        else:
+            print('Error!', record['file'], 'was not processed:', record['error'])
+    print(len(records), 'files processed, the manifest is', manifest_path)
+
+
+def start_key_analysis(arguments: list):
+    """
+    Entry point of the key analysis of many files (see detect_corpus_keys)
+    :param arguments: command line arguments (without the program name and the keys command)
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Determine the keys of many MIDI files')
+    parser.add_argument('sources', nargs='+', help='directories, glob patterns or names of .mid files')
+    parser.add_argument('--output', default=None, help='JSONL file for the keys (by default, they are only printed)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--music21-reader', action='store_true',
+                        help='always read the files with music21 instead of the native MIDI reader')
+    arguments = parser.parse_args(arguments)
+    records = detect_corpus_keys(arguments.sources, arguments.workers, not arguments.music21_reader)
+    for record in records:
+        if record['status'] == DONE:
+            print(record['file'], record['key'])
+        else:
+            print('Error!', record['file'], 'was not analysed:', record['error'])
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output:
+            output.writelines(json.dumps(record) + '\n' for record in records)
+    keys = [record['key'] for record in records if record['status'] == DONE]
+    print(len(records), 'files analysed, the most common keys:',
+          ', '.join('{} ({})'.format(key_name, keys.count(key_name))
+                    for key_name in sorted(sorted(set(keys)), key=keys.count, reverse=True)[:5]))
+
+
+def start_service(arguments: list):
+    """
+    Entry point of the long-running accompaniment service on localhost (see AccompanimentService)
+    :param arguments: command line arguments (without the program name and the serve command)
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Serve accompaniment jobs over HTTP on localhost')
+    parser.add_argument('--host', default=SERVICE_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--queue-depth', type=int, default=QUEUE_DEPTH,
+                        help='how many jobs can wait for a free worker')
+    parser.add_argument('--timeout', type=float, default=JOB_TIMEOUT, help='time limit of every job in seconds')
+    parser.add_argument('--engine', default=EVOLUTIONARY_ENGINE,
+                        choices=[EVOLUTIONARY_ENGINE, DYNAMIC_PROGRAMMING_ENGINE], help='default search engine')
+    parser.add_argument('--generations', type=int, default=100, help='default number of generations of the EA')
+    parser.add_argument('--population', type=int, default=1000, help='default population size of the EA')
+    parser.add_argument('--music21-reader', action='store_true',
+                        help='always read the files with music21 instead of the native MIDI reader')
+    parser.add_argument('--renderer', default=NATIVE_RENDERER, choices=[NATIVE_RENDERER, MUSIC21_RENDERER],
+                        help='MIDI rendering backend')
+    parser.add_argument('--preload-music21', action='store_true', help='import music21 in the workers in advance')
+    parser.add_argument('--cache', default=None, help='directory of the persistent result cache (off by default)')
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help='how many results the cache keeps')
+    arguments = parser.parse_args(arguments)
+    generator_parameters = {'number_of_generations_ea': arguments.generations,
+                            'population_size_ea': arguments.population, 'engine': arguments.engine}
+    if arguments.cache is not None:
+        generator_parameters['result_cache'] = ResultCache(arguments.cache, arguments.cache_size)
+    service = AccompanimentService(arguments.host, arguments.port, arguments.workers, arguments.queue_depth,
+                                   arguments.timeout, generator_parameters, not arguments.music21_reader,
+                                   arguments.renderer, arguments.preload_music21)
+    print('Serving accompaniments on http://{}:{} with {} workers (Ctrl+C to stop)'.format(
+        arguments.host, arguments.port, service.workers))
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
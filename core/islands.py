@@ -0,0 +1,154 @@
+from core.evolutionary_algorithm import *
+from concurrent.futures import ProcessPoolExecutor
+import math
+import time
+
+# The algorithm evolving islands in the current worker process (set by the pool initializer):
+worker_algorithm = None
+
+
+def initialize_worker(algorithm: EvolutionaryAlgorithm):
+    """
+    Initializer of the worker process: stores the algorithm, so it is transferred to every worker only once.
+    The observers of the algorithm are replaced by the recorder, the statistics are passed to them
+    by the parent process (see IslandModel.evolve)
+    :param algorithm: EvolutionaryAlgorithm with the compact population
+    :return: None
+    """
+    global worker_algorithm
+    worker_algorithm = algorithm
+    worker_algorithm.observers = [StatisticsRecorder()] if algorithm.observers else []
+
+
+def evolve_island(population, random_state, number_of_generations: int, deadline: float = None, island: int = 0,
+                  first_generation: int = 0, started: float = None):
+    """
+    Function for evolving one island in the worker process for several generations
+    :param population: CompactPopulation of the island or None to generate the zeroth generation
+    :param random_state: state of the algorithm's numpy Generator of the island
+    :param number_of_generations: how many generations to perform
+    :param deadline: time (as time.monotonic()) after which no new generations are started (None for no deadline)
+    :param island: index of the island (added to the statistics of generations)
+    :param first_generation: how many generations the island performed before (to number the generations)
+    :param started: time (as time.monotonic()) of the evolution start
+    :return: new CompactPopulation of the island, new state of the generator, the reason of stopping,
+            the genes and fitness of the best member found by the island in these generations,
+            the recorded statistics of the generations and the number of generations performed
+    """
+    worker_algorithm.rng.bit_generator.state = random_state
+    worker_algorithm.labels = dict(worker_algorithm.labels, island=island)
+    worker_algorithm.generation_offset = first_generation
+    worker_algorithm.started = started if started is not None else time.monotonic()
+    for observer in worker_algorithm.observers:
+        observer.statistics = []
+    worker_algorithm.evaluations_per_generation = [0]
+    worker_algorithm.duplicates_per_generation = [0]
+    if population is None:
+        worker_algorithm.generate_zeroth_generation()
+    else:
+        worker_algorithm.set_population(population)
+    worker_algorithm.continue_evolution(number_of_generations, deadline)
+    return (worker_algorithm.population,
+            worker_algorithm.rng.bit_generator.state,
+            worker_algorithm.stop_reason, worker_algorithm.best_member, worker_algorithm.best_member_fitness,
+            [statistics for observer in worker_algorithm.observers for statistics in observer.statistics],
+            len(worker_algorithm.evaluations_per_generation) - 1)
+
+
+class IslandModel:
+    """
+    Parallel evolution of several independent populations (islands) of the evolutionary algorithm
+    in the pool of processes. Every migration_interval generations the best members of every island migrate
+    to the next island (ring topology), replacing its worst members
+    """
+    def __init__(self, algorithm: EvolutionaryAlgorithm, number_of_islands: int, workers: int = None,
+                 migration_interval: int = 10, migrants: int = None, seeds: list = None):
+        """
+        Constructor of the island model
+        :param algorithm: EvolutionaryAlgorithm with the compact population, its parameters are used on every island
+        :param number_of_islands: how many populations to evolve
+        :param workers: number of worker processes (by default, as many as processors)
+        :param migration_interval: how many generations islands evolve between migrations
+        :param migrants: how many best members migrate from every island (by default, 5% of the population)
+        :param seeds: list of random seeds of the islands (by default, random ones)
+        """
+        if not algorithm.compact_population:
+            raise ValueError('Island model needs the evolutionary algorithm with the compact population')
+        if seeds is not None and len(seeds) != number_of_islands:
+            raise ValueError('Number of seeds must be equal to the number of islands')
+        self.algorithm = algorithm
+        self.number_of_islands = number_of_islands
+        self.workers = workers
+        self.migration_interval = max(1, migration_interval)
+        self.migrants = migrants if migrants is not None else max(1, algorithm.population_size // 20)
+        self.seeds = seeds if seeds is not None else [random.randrange(2 ** 32) for i in range(number_of_islands)]
+        self.populations = [None] * number_of_islands
+
+    def migrate(self):
+        """
+        Method for moving copies of the best members of every island to the next one instead of its worst members
+        :return: None
+        """
+        best = [population.take(population.best_members(self.migrants)) for population in self.populations]
+        for i in range(self.number_of_islands):
+            migrants = best[i - 1]
+            population = self.populations[i]
+            self.populations[i] = population.extend(migrants.genes, migrants.fitness,
+                                                    migrants.components).select_fittest(len(population))
+
+    def evolve(self, time_limit: float = None, stall_generations: int = None) -> Accompaniment:
+        """
+        Method to evolve all the islands for the algorithm's number of generations
+        Evolution can be stopped earlier by the time limit or when the best fitness over all islands does not grow
+        (checked between migrations), the reason is stored into the algorithm's stop_reason
+        :param time_limit: wall-clock time (in seconds) for the whole evolution (None for no limit)
+        :param stall_generations: stop after that many generations without the best fitness improvement
+                (None for no limit)
+        :return: the best accompaniment found by all islands (even if it did not survive till the end)
+        """
+        started = time.monotonic()
+        deadline = None if time_limit is None else started + time_limit
+        best_fitness = None
+        generations_without_improvement = 0
+        self.algorithm.stop_reason = STOPPED_GENERATIONS
+        random_states = [np.random.default_rng(seed).bit_generator.state for seed in self.seeds]
+        self.populations = [None] * self.number_of_islands
+        # the best members found by the islands in every round
+        best_genes = []
+        best_fitnesses = []
+        # how many generations every island performed
+        generations = [0] * self.number_of_islands
+        number_of_rounds = max(1, math.ceil(self.algorithm.n_iterations / self.migration_interval))
+        with ProcessPoolExecutor(self.workers, initializer=initialize_worker, initargs=(self.algorithm,)) as pool:
+            for r in range(number_of_rounds):
+                number_of_generations = min(self.migration_interval,
+                                            self.algorithm.n_iterations - r * self.migration_interval)
+                results = list(pool.map(evolve_island, self.populations, random_states,
+                                        [number_of_generations] * self.number_of_islands,
+                                        [deadline] * self.number_of_islands, range(self.number_of_islands),
+                                        generations, [started] * self.number_of_islands))
+                self.populations = [result[0] for result in results]
+                random_states = [result[1] for result in results]
+                best_genes += [result[3] for result in results]
+                best_fitnesses += [result[4] for result in results]
+                for i, result in enumerate(results):
+                    replay(result[5], self.algorithm.observers)
+                    generations[i] += result[6]
+                if STOPPED_TIME_LIMIT in [result[2] for result in results]:
+                    self.algorithm.stop_reason = STOPPED_TIME_LIMIT
+                    break
+                round_best_fitness = max(result[4] for result in results)
+                if best_fitness is None or round_best_fitness > best_fitness:
+                    best_fitness = round_best_fitness
+                    generations_without_improvement = 0
+                else:
+                    generations_without_improvement += number_of_generations
+                if stall_generations is not None and generations_without_improvement >= stall_generations:
+                    self.algorithm.stop_reason = STOPPED_STALL
+                    break
+                if r < number_of_rounds - 1:
+                    self.migrate()
+        best_island = max(self.populations, key=lambda population: population.fitness[population.best])
+        self.algorithm.set_population(best_island)
+        self.algorithm.remember_best(np.array(best_genes), np.array(best_fitnesses))
+        return self.algorithm.get_best_accompaniment()
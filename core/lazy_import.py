@@ -0,0 +1,30 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Proxy of the module which is imported only on the first access to its attributes,
+    so heavy libraries (music21) are loaded only when they are actually used
+    """
+    def __init__(self, module_name: str):
+        """
+        Constructor of the proxy
+        :param module_name: full name of the module to import
+        """
+        self.module_name = module_name
+        self.module = None
+
+    def __getattr__(self, attribute: str):
+        """
+        :param attribute: name of the module attribute
+        :return: the attribute of the imported module
+        """
+        if self.module is None:
+            self.module = importlib.import_module(self.module_name)
+        return getattr(self.module, attribute)
+
+    def is_loaded(self):
+        """
+        :return: True if the module was already imported
+        """
+        return self.module is not None
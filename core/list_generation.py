@@ -1,53 +1,96 @@
-from numpy import random as nprand
-
-
-def calculate_probabilities(fitnesses, fitness_sum):
-    """
-    Method for calculating probabilities for probability-dependent choice for the roulette wheel in the parents'
-    lists generation
-    :param fitnesses: list of fitness values
-    :param fitness_sum: sum of all the fitness values (for the fast access)
-    :return: list of corresponding probabilities summing up to 1
-    """
-    probabilities = list(map(lambda x: x / fitness_sum, fitnesses))
-    prob_sum = sum(probabilities)
-    if prob_sum < 1:
-        probabilities[-1] += 1 - prob_sum
-    elif prob_sum > 1:
-        diff = prob_sum - 1
-        delta = diff / len(probabilities)
-        probabilities = list(map(lambda x: x - delta, probabilities))
-    return probabilities
-
-
-def determine_parents_lists(generation: list, fitnesses, fitness_sum, n_of_children: int):
-    """
-    Method for generating n_of_children fathers and n_of_children mothers for the next crossovers
-    They are chosen from the current generation by fitness proportional roulette wheel
-    Parents do not repeat, and they are stored in random order, so they can be randomly breed pairwise by the index
-    :param fitnesses: list of corresponding fitnesses of chromosomes from the generation
-    :param generation: current generation, consisting
-    :param fitness_sum: sum of all fitness values for the whole generation
-    :param n_of_children: number of crossover applications = number of fathers = number of mothers
-    :return: fathers list and mothers list
-    """
-    generation_cpy = generation.copy()
-    fitness_cpy = fitnesses.copy()
-    fitsum = fitness_sum
-    probabilities = calculate_probabilities(fitness_cpy, fitsum)
-    fathers = []
-    mothers = []
-    for i in range(n_of_children * 2):
-        parent = nprand.choice(generation_cpy, 1, p=probabilities)[0]
-        if i % 2 == 0:
-            fathers.append(parent)
-        else:
-            mothers.append(parent)
-        index = generation_cpy.index(parent)
-        generation_cpy.remove(generation_cpy[index])
-        probabilities.remove(probabilities[index])
-        fitsum -= fitness_cpy[index]
-        fitness_cpy.remove(fitness_cpy[index])
-        probabilities = calculate_probabilities(fitness_cpy, fitsum)
-    return fathers, mothers
-
+from core.constants import *
+import numpy as np
+
+
+def sampling_order(weights, n_of_samples: int, rng: np.random.Generator):
+    """
+    Method for weighted sampling without replacement in one batched step (exponential keys method):
+    each member gets the key -ln(u) / weight, and sorting the keys gives the same distribution as drawing
+    the members one by one with probabilities proportional to the weights of the remaining ones
+    :param weights: array of positive weights of the members
+    :param n_of_samples: how many distinct members to draw
+    :param rng: numpy Generator of the keys
+    :return: array of indices of drawn members in the order of drawing
+    """
+    weights = np.asarray(weights, dtype=float)
+    if n_of_samples > len(weights):
+        raise ValueError('Can not choose ' + str(n_of_samples) + ' distinct parents from ' + str(len(weights)) +
+                         ' members')
+    if n_of_samples == 0:
+        return np.array([], dtype=int)
+    keys = -np.log(1 - rng.random(len(weights))) / weights
+    chosen = np.argpartition(keys, n_of_samples - 1)[:n_of_samples]
+    return chosen[np.argsort(keys[chosen])]
+
+
+def split_parents(generation, order):
+    """
+    Method to split the chosen members into fathers (even positions) and mothers (odd positions)
+    :param generation: current generation
+    :param order: indices of the chosen members
+    :return: fathers list and mothers list
+    """
+    return [generation[i] for i in order[0::2]], [generation[i] for i in order[1::2]]
+
+
+def determine_parents_lists(generation: list, fitnesses, fitness_sum, n_of_children: int,
+                            rng: np.random.Generator = None):
+    """
+    Method for generating n_of_children fathers and n_of_children mothers for the next crossovers
+    They are chosen from the current generation by fitness proportional roulette wheel
+    Parents do not repeat, and they are stored in random order, so they can be randomly breed pairwise by the index
+    :param fitnesses: list of corresponding fitnesses of chromosomes from the generation
+    :param generation: current generation, consisting
+    :param fitness_sum: sum of all fitness values for the whole generation
+    :param n_of_children: number of crossover applications = number of fathers = number of mothers
+    :param rng: numpy Generator of the choice (by default, the new unseeded one)
+    :return: fathers list and mothers list
+    """
+    probabilities = np.asarray(fitnesses, dtype=float) / fitness_sum
+    return split_parents(generation, sampling_order(probabilities, n_of_children * 2,
+                                                    rng if rng is not None else np.random.default_rng()))
+
+
+def rank_parents_lists(generation: list, fitnesses, fitness_sum, n_of_children: int,
+                       rng: np.random.Generator = None):
+    """
+    Method for generating fathers and mothers lists by rank selection: the probability is proportional
+    to the rank of the member by fitness (1 for the worst one), not to the fitness itself
+    Parents do not repeat, as in determine_parents_lists
+    :param generation: current generation
+    :param fitnesses: list of corresponding fitnesses of chromosomes from the generation
+    :param fitness_sum: sum of all fitness values for the whole generation (not needed for ranks)
+    :param n_of_children: number of crossover applications = number of fathers = number of mothers
+    :param rng: numpy Generator of the choice (by default, the new unseeded one)
+    :return: fathers list and mothers list
+    """
+    ranks = np.empty(len(fitnesses))
+    ranks[np.argsort(fitnesses, kind='stable')] = np.arange(1, len(fitnesses) + 1)
+    return split_parents(generation, sampling_order(ranks, n_of_children * 2,
+                                                    rng if rng is not None else np.random.default_rng()))
+
+
+def tournament_parents_lists(generation: list, fitnesses, fitness_sum, n_of_children: int,
+                             tournament_size: int = TOURNAMENT_SIZE, rng: np.random.Generator = None):
+    """
+    Method for generating fathers and mothers lists by tournament selection: every parent is the most fit
+    of tournament_size randomly chosen members. Tournaments are independent, so one member can be chosen
+    as the parent several times
+    :param generation: current generation
+    :param fitnesses: list of corresponding fitnesses of chromosomes from the generation
+    :param fitness_sum: sum of all fitness values for the whole generation (not needed for tournaments)
+    :param n_of_children: number of crossover applications = number of fathers = number of mothers
+    :param tournament_size: number of members in one tournament
+    :param rng: numpy Generator of the tournaments (by default, the new unseeded one)
+    :return: fathers list and mothers list
+    """
+    fitnesses = np.asarray(fitnesses)
+    rng = rng if rng is not None else np.random.default_rng()
+    participants = rng.integers(len(fitnesses), size=(n_of_children * 2, tournament_size))
+    winners = participants[np.arange(n_of_children * 2), np.argmax(fitnesses[participants], axis=1)]
+    return split_parents(generation, winners)
+
+
+SELECTION_STRATEGIES = {ROULETTE_SELECTION: determine_parents_lists,
+                        RANK_SELECTION: rank_parents_lists,
+                        TOURNAMENT_SELECTION: tournament_parents_lists}
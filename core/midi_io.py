@@ -0,0 +1,460 @@
+from core.music_units import *
+from fractions import Fraction
+import struct
+
+# Quantization grids (in quarters) of music21 MIDI import: sixteenths and eighth-note triplets
+QUANTIZATION_TICKS = [1 / 4, 1 / 3]
+# Largest denominator music21 keeps for offsets and durations
+DENOMINATOR_LIMIT = 65535
+BAR_DURATION = 4.0
+# Channel of percussion (0-based), its notes are not pitched
+PERCUSSION_CHANNEL = 9
+# Events turned by music21 into objects of the part (they are taken into account during quantization):
+# track name, instrument name, tempo, time signature, key signature (meta events) and program change
+OBJECT_META_EVENTS = {0x03, 0x04, 0x51, 0x58, 0x59}
+PROGRAM_CHANGE = 0xC0
+TIME_SIGNATURE = 0x58
+# Pitch classes which music21 spells with flats (E-, B-), Melody.parse_notes turns them into sharps without octave
+FLAT_PITCH_CLASSES = {3, 10}
+# Values of the written MIDI files (the same as music21 writes): ticks per quarter, default octave and velocity,
+# the conductor track (tempo of 120 quarters per minute and 4/4 time signature)
+TICKS_PER_QUARTER = 10080
+DEFAULT_OCTAVE = 4
+DEFAULT_VELOCITY = 90
+CONDUCTOR_EVENTS = b'\x00\xff\x51\x03\x07\xa1\x20\x00\xff\x58\x04\x04\x02\x18\x08'
+
+
+class UnsupportedMidiError(ValueError):
+    """
+    Error of the native MIDI reader: the file is valid, but the reader can not produce the same notes as music21
+    (several tracks with notes, chords, time signatures other than 4/4, etc.)
+    """
+
+
+def write_variable_length(value: int):
+    """
+    Function to encode the variable-length quantity of the MIDI file
+    :param value: non-negative integer
+    :return: bytes of the quantity
+    """
+    result = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        result.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(result)
+
+
+def read_variable_length(data: bytes, position: int):
+    """
+    Function to read the variable-length quantity of the MIDI file
+    :param data: bytes of the file
+    :param position: index of the first byte of the quantity
+    :return: the value and the index of the next byte
+    """
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, position
+
+
+def read_track(data: bytes, position: int, end: int):
+    """
+    Function to decode the events of one track
+    :param data: bytes of the file
+    :param position: index of the first event of the track
+    :param end: index of the end of the track
+    :return: list of note events (tick, is note on, pitch, channel, velocity), list of ticks of the events
+            music21 turns into objects and list of time signatures (numerator, denominator)
+    """
+    notes = []
+    object_ticks = []
+    time_signatures = []
+    tick = 0
+    status = 0
+    while position < end:
+        delta, position = read_variable_length(data, position)
+        tick += delta
+        byte = data[position]
+        if byte >= 0x80:
+            status = byte
+            position += 1
+        elif status >= 0xF0 or status == 0:
+            raise UnsupportedMidiError('Running status without the channel message')
+        if status == 0xFF:
+            meta_type = data[position]
+            length, position = read_variable_length(data, position + 1)
+            if meta_type in OBJECT_META_EVENTS:
+                object_ticks.append(tick)
+            if meta_type == TIME_SIGNATURE:
+                time_signatures.append((data[position], 2 ** data[position + 1]))
+            position += length
+            if meta_type == 0x2F:
+                break
+            status = 0
+        elif status in (0xF0, 0xF7):
+            length, position = read_variable_length(data, position)
+            position += length
+            status = 0
+        else:
+            kind = status & 0xF0
+            channel = status & 0x0F
+            if kind in (PROGRAM_CHANGE, 0xD0):
+                if kind == PROGRAM_CHANGE:
+                    object_ticks.append(tick)
+                position += 1
+            else:
+                if kind in (0x80, 0x90):
+                    velocity = data[position + 1]
+                    notes.append((tick, kind == 0x90 and velocity > 0, data[position], channel, velocity))
+                position += 2
+    return notes, object_ticks, time_signatures
+
+
+def pair_note_events(events: list):
+    """
+    Function to join note on and note off events into notes the way music21 does: every note on
+    ends with the nearest following note off of the same pitch and channel (notes without it are dropped)
+    :param events: note events of the track (tick, is note on, pitch, channel, velocity) in the order of the file
+    :return: list of notes (starting tick, ending tick, pitch, channel, velocity) sorted by the starting tick
+    """
+    notes = []
+    waiting = dict()
+    for tick, is_note_on, pitch, channel, velocity in events:
+        if is_note_on:
+            note = [tick, None, pitch, channel, velocity]
+            notes.append(note)
+            waiting.setdefault((pitch, channel), []).append(note)
+        else:
+            for note in waiting.pop((pitch, channel), []):
+                note[1] = tick
+    notes = [note for note in notes if note[1] is not None]
+    notes.sort(key=lambda note: note[0])
+    return notes
+
+
+def to_quarters(value):
+    """
+    Function to store the offset or duration the way music21 does: as float if it is a multiple of a power of 1/2,
+    as Fraction (with the denominator up to 65535) otherwise, so the sums of triplets stay exact
+    :param value: offset or duration in quarters (float or Fraction)
+    :return: float or Fraction
+    """
+    if type(value) == float:
+        if value.as_integer_ratio()[1] <= DENOMINATOR_LIMIT:
+            return value
+        value = Fraction(value).limit_denominator(DENOMINATOR_LIMIT)
+    if value.denominator & (value.denominator - 1) == 0:
+        return value.numerator / value.denominator
+    return value
+
+
+def quantize(value: float, zero_allowed: bool = True, gap_to_fill: float = 0.0):
+    """
+    Function to quantize the offset or duration to the nearest multiple of the sixteenth or the triplet eighth,
+    exactly as music21 does it (the duration filling the gap up to the next note is preferred)
+    :param value: offset or duration in quarters
+    :param zero_allowed: can the value become zero or not
+    :param gap_to_fill: distance to the next note (for durations)
+    :return: quantized value
+    """
+    found = []
+    for tick in QUANTIZATION_TICKS:
+        multiple = math.floor(value / tick)
+        low, high = tick * multiple, tick * (multiple + 1)
+        if low <= value <= low + tick / 2.0:
+            match, error = low, round(value - low, 7)
+        else:
+            match, error = high, round(high - value, 7)
+        if not zero_allowed and match == 0.0:
+            match, error = tick, abs(round(value - tick, 7))
+        remaining_gap = 0.0 if gap_to_fill % tick == 0 else max(gap_to_fill - match, 0.0)
+        found.append((remaining_gap, error, tick, match))
+    return min(found)[3]
+
+
+def read_midi_notes(file_name: str):
+    """
+    Function to read the melody from the Standard MIDI File without music21. Notes are quantized,
+    split at the bar lines and supplemented with rests just like after music21 parsing,
+    so Melody built from them is the same as Melody built from the music21 stream.
+    Only single-voice melodies in 4/4 are supported, for anything else UnsupportedMidiError is raised
+    :param file_name: name of the .mid file
+    :return: list of Notes and Rests of the melody and the length of the melody in quarters
+    """
+    with open(file_name, 'rb') as midi_file:
+        data = midi_file.read()
+    if data[:4] != b'MThd':
+        raise UnsupportedMidiError('Not a Standard MIDI File')
+    header_length = struct.unpack('>I', data[4:8])[0]
+    number_of_tracks, division = struct.unpack('>xxHH', data[8:14])
+    if division & 0x8000:
+        raise UnsupportedMidiError('SMPTE time division is not supported')
+    position = 8 + header_length
+    melody_track = None
+    time_signatures = []
+    for t in range(number_of_tracks):
+        chunk_type = data[position:position + 4]
+        length = struct.unpack('>I', data[position + 4:position + 8])[0]
+        position += 8
+        if chunk_type == b'MTrk':
+            track = read_track(data, position, min(position + length, len(data)))
+            time_signatures += track[2]
+            if any(event[1] for event in track[0]):
+                if melody_track is not None:
+                    raise UnsupportedMidiError('Several tracks with notes are not supported')
+                melody_track = track
+        position += length
+    if melody_track is None:
+        raise UnsupportedMidiError('No notes in the file')
+    if any(time_signature != (4, 4) for time_signature in time_signatures):
+        raise UnsupportedMidiError('Only 4/4 time signature is supported')
+    notes = pair_note_events(melody_track[0])
+    for i in range(len(notes)):
+        if notes[i][3] == PERCUSSION_CHANNEL:
+            raise UnsupportedMidiError('Percussion notes are not supported')
+        if i > 0 and notes[i][0] - notes[i - 1][0] < division / 4:
+            raise UnsupportedMidiError('Chords and several voices are not supported')
+    # offsets of the notes and the other objects of the part (the next one determines the gap to fill)
+    ticks = sorted(set([note[0] for note in notes] + melody_track[1]))
+    offsets = {tick: to_quarters(quantize(float(to_quarters(tick / division)))) for tick in ticks}
+    records = []
+    next_tick = 0
+    for starting_tick, ending_tick, pitch, channel, velocity in notes:
+        offset = offsets[starting_tick]
+        while next_tick < len(ticks) and offsets[ticks[next_tick]] <= offset:
+            next_tick += 1
+        duration = to_quarters((ending_tick - starting_tick) / division)
+        if next_tick < len(ticks):
+            gap = to_quarters(offsets[ticks[next_tick]] - offset)
+            duration = to_quarters(quantize(float(duration), False, gap))
+        else:
+            duration = to_quarters(quantize(float(duration), False))
+        records.append((offset, duration, pitch, velocity))
+    if offsets[ticks[-1]] > max(to_quarters(record[0] + record[1]) for record in records):
+        raise UnsupportedMidiError('Events after the end of the last note are not supported')
+    return split_into_bars(records, sorted(set(offsets[tick] for tick in melody_track[1])))
+
+
+def split_into_bars(records: list, object_offsets: list):
+    """
+    Function to make Notes and Rests from the quantized notes: notes crossing the bar lines are split (tied),
+    gaps between notes and the end of the last bar are filled with rests (separate for every bar
+    and split at the offsets of the other objects of the part, like tempo marks).
+    The order is the one of music21 measures: by starting time, tied continuations after the notes starting there
+    :param records: quantized notes (offset, duration, MIDI pitch, velocity) in order
+    :param object_offsets: sorted offsets of the other objects of the part
+    :return: list of Notes and Rests and the length of the melody in quarters
+    """
+    pieces = []
+    current_time = 0.0
+    for offset, duration, pitch, velocity in records:
+        pieces += split_gap(current_time, offset, object_offsets)
+        pieces += split_piece(offset, duration, pitch, velocity)
+        current_time = max(current_time, to_quarters(offset + duration))
+    size = math.ceil(current_time / BAR_DURATION) * BAR_DURATION
+    pieces += split_gap(current_time, size, object_offsets)
+    pieces.sort(key=lambda piece: piece[:2])
+    return [piece[2] for piece in pieces], int(size)
+
+
+def split_gap(starting_time: float, ending_time: float, object_offsets: list):
+    """
+    Function to fill the gap between notes with Rests split at the bar lines and at the offsets of the objects
+    :param starting_time: starting time of the gap in quarters
+    :param ending_time: ending time of the gap in quarters
+    :param object_offsets: sorted offsets of the other objects of the part
+    :return: list of Rests (see split_piece)
+    """
+    pieces = []
+    for offset in object_offsets + [ending_time]:
+        if starting_time < offset <= ending_time:
+            pieces += split_piece(starting_time, to_quarters(offset - starting_time))
+            starting_time = offset
+    return pieces
+
+
+def split_piece(starting_time: float, duration: float, pitch: int = None, velocity: int = None):
+    """
+    Function to make the Note (or the Rest, if pitch is None) split at the bar lines
+    :param starting_time: starting time of the piece in quarters
+    :param duration: duration of the piece in quarters
+    :param pitch: MIDI pitch of the note or None for the rest
+    :param velocity: velocity of the note
+    :return: list of (starting time, is it a tied continuation, Note or Rest)
+    """
+    pieces = []
+    ending_time = to_quarters(starting_time + duration)
+    octave = None if pitch is None or pitch % 12 in FLAT_PITCH_CLASSES else pitch // 12 - 1
+    while ending_time > starting_time:
+        bar_end = (math.floor(starting_time / BAR_DURATION) + 1) * BAR_DURATION
+        part_duration = to_quarters(min(ending_time, bar_end) - starting_time)
+        if pitch is None:
+            piece = Rest(duration=part_duration, starting_time=starting_time)
+        else:
+            tie = None
+            if bar_end < ending_time:
+                tie = 'start' if not pieces else 'continue'
+            elif pieces:
+                tie = 'stop'
+            piece = Note(pitch=NOTE_NAMES[pitch % 12], octave=octave, duration=part_duration,
+                         starting_time=starting_time, velocity=velocity, tie=tie)
+        pieces.append((starting_time, len(pieces) > 0, piece))
+        starting_time = to_quarters(starting_time + part_duration)
+    return pieces
+
+
+def strip_ties(notes: list):
+    """
+    Function to join the tied notes of the melody the way music21 does before writing MIDI:
+    a chain of notes started by the tie start ends with the tie stop or with the following note of the same pitch,
+    the first note of the chain gets the duration of the whole chain and the others are removed
+    :param notes: list of Notes and Rests of the melody
+    :return: list of durations of the pieces (None for the removed ones)
+    """
+    durations = [note.duration for note in notes]
+    connected = []
+
+    def same_pitch(i):
+        return (i > 0 and i - 1 in connected and type(notes[i]) == Note and type(notes[i - 1]) == Note and
+                (notes[i].pitch, notes[i].written_octave) == (notes[i - 1].pitch, notes[i - 1].written_octave))
+
+    for i, note in enumerate(notes):
+        tie = note.tie if type(note) == Note else None
+        if tie == 'start':
+            if i == 0 or i - 1 not in connected:
+                connected = [i]
+            else:
+                connected.append(i)
+            continue
+        if tie == 'continue':
+            if connected and same_pitch(i):
+                connected.append(i)
+            else:
+                connected = [i]
+            continue
+        if tie == 'stop' or same_pitch(i):
+            connected.append(i)
+            if len(connected) >= 2:
+                for j in connected[1:]:
+                    durations[connected[0]] = to_quarters(durations[connected[0]] + durations[j])
+                    durations[j] = None
+            connected = []
+    return durations
+
+
+def melody_notes(notes: list):
+    """
+    Function to calculate the MIDI notes of the melody the way music21 renders the appended notes and rests:
+    every piece starts at the end of the previous one, then tied notes are joined
+    :param notes: list of Notes and Rests of the melody
+    :return: list of MIDI notes (starting tick, ending tick, MIDI pitch, velocity)
+    """
+    midi_notes = []
+    current_time = 0.0
+    for note, duration in zip(notes, strip_ties(notes)):
+        if type(note) == Note and duration is not None:
+            octave = note.written_octave if note.written_octave is not None else DEFAULT_OCTAVE
+            starting_tick = round(current_time * TICKS_PER_QUARTER)
+            midi_notes.append((starting_tick, starting_tick + round(duration * TICKS_PER_QUARTER),
+                               NOTE_NAMES.index(note.pitch) + 12 * (octave + 1),
+                               note.velocity if note.velocity is not None else DEFAULT_VELOCITY))
+        current_time = to_quarters(current_time + note.duration)
+    return midi_notes
+
+
+def chords_notes(accompaniment: Accompaniment, octave: int, velocity: int):
+    """
+    Function to calculate the MIDI notes of the accompaniment: one chord per quarter
+    :param accompaniment: the accompaniment to render
+    :param octave: base octave of the chords
+    :param velocity: velocity of the chord notes
+    :return: list of MIDI notes (starting tick, ending tick, MIDI pitch, velocity)
+    """
+    midi_notes = []
+    for i, chord in enumerate(accompaniment.chords):
+        if chord.chord_type != REST:
+            for name, octave_offset in zip(chord.note_names, chord.octave_offsets):
+                midi_notes.append((i * TICKS_PER_QUARTER, (i + 1) * TICKS_PER_QUARTER,
+                                   NOTE_NAMES.index(name) + 12 * (octave + octave_offset + 1), velocity))
+    return midi_notes
+
+
+def write_track(midi_file, events: bytes):
+    """
+    Function to write the track chunk to the file
+    :param midi_file: file opened for writing bytes
+    :param events: bytes of the track events
+    :return: None
+    """
+    midi_file.write(b'MTrk' + struct.pack('>I', len(events)))
+    midi_file.write(events)
+
+
+def track_events(instrument: tuple, channel: int, notes: list):
+    """
+    Function to encode the track of one instrument. Events at the same tick are ordered as music21 orders them:
+    note offs before note ons, otherwise in the order of the notes
+    :param instrument: track name and MIDI program of the instrument
+    :param channel: MIDI channel (0-based)
+    :param notes: list of MIDI notes (starting tick, ending tick, MIDI pitch, velocity)
+    :return: bytes of the track events
+    """
+    name = instrument[0].encode()
+    program = bytes([0xC0 | channel, instrument[1]])
+    events = bytearray(b'\x00\xff\x03' + write_variable_length(len(name)) + name + b'\x00' + program +
+                       b'\x00' + bytes([0xE0 | channel, 0, 64]) + b'\x00' + program)
+    messages = []
+    for starting_tick, ending_tick, pitch, velocity in notes:
+        messages.append((starting_tick, 1, bytes([0x90 | channel, pitch, velocity])))
+        messages.append((ending_tick, 0, bytes([0x80 | channel, pitch, 0])))
+    messages.sort(key=lambda message: message[:2])
+    last_tick = 0
+    for tick, order, message in messages:
+        events += write_variable_length(tick - last_tick)
+        events += message
+        last_tick = tick
+    events += write_variable_length(TICKS_PER_QUARTER) + b'\xff\x2f\x00'
+    return bytes(events)
+
+
+def write_midi_accompaniment(output_file_name: str, melody_notes: list, chords_notes: list,
+                             melody_instrument: tuple, chords_instrument: tuple):
+    """
+    Function to write the MIDI file with the melody and the accompaniment directly, without music21.
+    The file is the same as music21 writes for two parts: conductor track, melody track and chords track
+    (the chords use the second channel if their instrument differs from the melody's one)
+    :param output_file_name: name of the output .mid file
+    :param melody_notes: MIDI notes of the melody (see melody_notes)
+    :param chords_notes: MIDI notes of the chords (see chords_notes)
+    :param melody_instrument: track name and MIDI program of the melody instrument
+    :param chords_instrument: track name and MIDI program of the chords instrument
+    :return: None
+    """
+    chords_channel = 0 if chords_instrument[1] == melody_instrument[1] else 1
+    with open(output_file_name, 'wb') as midi_file:
+        midi_file.write(b'MThd' + struct.pack('>IHHH', 6, 1, 3, TICKS_PER_QUARTER))
+        write_track(midi_file, CONDUCTOR_EVENTS + write_variable_length(TICKS_PER_QUARTER) + b'\xff\x2f\x00')
+        write_track(midi_file, track_events(melody_instrument, 0, melody_notes))
+        write_track(midi_file, track_events(chords_instrument, chords_channel, chords_notes))
+
+
+def load_melody(file_name: str, generate_rests: bool = False, native: bool = True) -> Melody:
+    """
+    Function to read the melody from the MIDI file. The native reader is used when possible,
+    music21 parsing is used for the files the native reader does not support (or if native is False)
+    :param file_name: name of the .mid file
+    :param generate_rests: boolean to allow or prohibit the rest (silent) chord generation for the key
+    :param native: try the native MIDI reader first
+    :return: Melody of the file
+    """
+    if native:
+        try:
+            notes, size_in_bars = read_midi_notes(file_name)
+            return Melody(generate_rests=generate_rests, notes=notes, size_in_bars=size_in_bars)
+        except (UnsupportedMidiError, IndexError, struct.error):
+            pass
+    return Melody(mus.converter.parse(file_name), generate_rests)
@@ -1,379 +1,686 @@
-from core.constants import *
-import music21 as mus
-import random
-
-
-class AtomicPiece:
-    """
-    Abstract parent class for Notes and Rests
-    """
-    def __init__(self, piece):
-        """
-        Constructor of the AtomicPiece
-        :param piece: music21 Note or Rest object with duration
-        """
-        self.duration = piece.duration.quarterLength
-
-
-class Note(AtomicPiece):
-    """
-    The class of the note which contains pitch (e.g. C#), octave number, it's duration and starting time.
-    Needed for quick calculations of simultaneous playing of two notes,
-    because the starting_time and duration are easily accessibly without calculation.
-    However, instance of music21 class is accessible by note.note_itself
-    """
-
-    def __init__(self, note: mus.note.Note, octave_offset=0):
-        """
-        Constructor of the Note class, takes the music21 Note class instance and the octave_offset (for inverses, etc.)
-        :param note: music21 Note class instance
-        :param octave_offset: the number to add to the base octave of the note during processing; by default set to 0
-        """
-        super().__init__(note)
-        self.note_itself = note
-        self.pitch = note.name
-        self.octave = note.octave
-        self.octave_offset = octave_offset
-        if note.measureNumber:
-            self.starting_time = (note.measureNumber - 1) * 4.0 + note.offset
-        else:
-            self.starting_time = note.offset
-
-    def get_note21(self) -> mus.note.Note:
-        """
-        Getter of music21 object
-        :return: Note music21 object
-        """
-        return self.note_itself
-
-    def get_volume21(self) -> mus.volume.Volume:
-        """
-        Getter for music21 volume object
-        :return: Volume from music21
-        """
-        return self.note_itself.volume
-
-    def get_octave(self) -> int:
-        """
-        Getter for the octave of the note (calculated with the offset)
-        :return: octave of the note
-        """
-        if self.octave:
-            return self.octave + self.octave_offset
-        elif self.note_itself.octave:
-            return self.note_itself.octave + self.octave_offset
-        else:
-            self.set_octave()
-            return self.octave + self.octave_offset
-
-    def set_octave(self, octave=3):
-        """
-        Setter for the note octave
-        :param octave: new octave
-        :return: None
-        """
-        self.octave = octave
-
-
-class Rest(AtomicPiece):
-    """
-    The class of the Rest piece of the music
-    """
-    def __init__(self, rest: mus.note.Rest):
-        """
-        Constructor of the rest. The music21 Rest class instance must be provided
-        :param rest: the music21 Rest class instance
-        """
-        super().__init__(rest)
-        self.note_itself = rest
-        if rest.measureNumber:
-            self.starting_time = (rest.measureNumber - 1) * 4.0 + rest.offset
-        else:
-            self.starting_time = rest.offset
-
-
-class Key:
-    """
-    Class of the Key that stores the key's name, tonic, scale, gamma (cycling_pitches) and allows to get
-    all the consonant chords
-    """
-    def __init__(self, key_name: str):
-        """
-        Constructor for the key, takes the key name
-        :param key_name: string containing the name of the key (in tiny notation, e.g. C#m or F)
-        """
-        self.scale = MINOR if MINOR in key_name else MAJOR
-        self.name = key_name
-        self.tonic = key_name.rstrip(self.scale)
-        self.cyclic_pitches = []
-        self.find_cyclic_key_pitches()
-
-    def find_cyclic_key_pitches(self):
-        """
-        Method to find the row of the key table (or the part of the circle of fifths)
-        """
-        for i in range(7):
-            pitch = NOTE_NAMES[(NOTE_NAMES.index(self.tonic) +
-                                (sum(MINOR_SCALE_STEPS[:i]) if (self.scale == MINOR) else
-                                 (sum(MAJOR_SCALE_STEPS[:i])))) % 12]
-            self.cyclic_pitches.append(pitch)
-
-    def get_chords(self, generate_rests: bool = False):
-        """
-        Method to get all the consonant chords for the current key. Chords can be used for the Accompaniment generation
-        :param generate_rests: are rest (silent) chords allowed or not
-        :return: list of consonant chords
-        """
-        consonant_chords = []
-        for i in range(7):
-            triad_name = self.cyclic_pitches[i] + (MINOR_KEY_SCALES[i] if (self.scale == MINOR) else
-                                                   MAJOR_KEY_SCALES[i])
-            consonant_chords.append(Chord(triad_name))
-        for i in range(7):
-            triad_type = (MINOR_KEY_SCALES[i] if (self.scale == MINOR) else MAJOR_KEY_SCALES[i])
-            sus2_allowed = (MINOR_SUS2_ALLOWED[i] if (self.scale == MINOR) else MAJOR_SUS2_ALLOWED[i])
-            sus4_allowed = (MINOR_SUS4_ALLOWED[i] if (self.scale == MINOR) else MAJOR_SUS4_ALLOWED[i])
-            if triad_type != DIMINISHED:
-                consonant_chords.append(Chord(self.cyclic_pitches[i] + triad_type, 1))
-                consonant_chords.append(Chord(self.cyclic_pitches[i] + triad_type, 2))
-                if sus2_allowed:
-                    consonant_chords.append(Chord(self.cyclic_pitches[i] + SUS2))
-                if sus4_allowed:
-                    consonant_chords.append(Chord(self.cyclic_pitches[i] + SUS4))
-            if generate_rests:
-                consonant_chords.append(Chord(REST))
-        return consonant_chords
-
-
-class Chord:
-    """
-    Class of the Chord, supports both Three-note chords and rest (silent) chords
-    """
-    def __init__(self, chord_name: str, inverse_number=0):
-        """
-        Constructor of the Chord. Chord name must be provided. Possible types of Chords are:
-        m, DIM, sus2, sus4, (Major is empty string after the tonic)
-        :param chord_name: name of the chord, which must contain tonic name and chord type
-        :param inverse_number: 0, 1 or 2 for the inverse of triad Chords
-        """
-        self.inverse = inverse_number
-        if chord_name != REST:
-            self.chord_type = SUS2 if (SUS2 in chord_name) else (SUS4 if
-                                                                 (SUS4 in chord_name) else
-                                                                 DIMINISHED if (DIMINISHED in chord_name)
-                                                                 else MINOR if (MINOR in chord_name) else MAJOR)
-            self.tonic = chord_name.rstrip(self.chord_type)
-            self.name = chord_name
-            self.note_names = []
-            self.notes = []
-            self.chord_itself = None
-            self.calculate_notes()
-        else:
-            self.chord_type = REST
-            self.tonic = None
-            self.name = REST
-            self.notes = [Rest(mus.note.Rest())]
-            self.note_names = [REST]
-            self.chord_itself = self.notes[0].note_itself
-        # TODO: chord_itself from three notes
-
-    def __str__(self):
-        """
-        :return: string representation of the Chord: it's name and notes
-        """
-        return self.tonic + self.chord_type + \
-               (('inv' + str(self.inverse)) if self.inverse else '') + ' chord: ' + \
-               ' '.join(list(map(lambda x: x.pitch, self.notes)))
-
-    def calculate_notes(self):
-        """
-        Method to calculate all the notes of the Chord (even the rest), given the chord tonic and type.
-        The table of offsets must be present in the file as CHORD_NOTE_OFFSETS.
-        The notes keyboard must also be present as NOTE_NAMES
-        :return: None, notes are stored into Chord.notes
-        """
-        duration = mus.duration.Duration(4.0)
-        if self.chord_type == REST:
-            for i in range(3):
-                new_rest21 = mus.note.Rest(duration=duration)
-                new_rest = Rest(new_rest21)
-                self.notes.append(new_rest)
-                self.note_names.append(REST)
-        else:
-            for offset in CHORD_NOTE_OFFSETS[self.chord_type]:
-                name = (NOTE_NAMES[(NOTE_NAMES.index(self.tonic) + offset) % 12])
-                self.note_names.append(name)
-                new_note21 = mus.note.Note(name, duration=duration)
-                new_note = Note(new_note21, (1 if ((NOTE_NAMES.index(self.tonic) + offset) > 12) else 0) +
-                                (1 if (self.inverse == 1 and len(self.note_names) == 1) or
-                                      (self.inverse == 2 and len(self.note_names) <= 2) else 0))
-                self.notes.append(new_note)
-        self.chord_itself = mus.chord.Chord([self.notes[0].note_itself, self.notes[1].note_itself,
-                                             self.notes[2].note_itself])
-        # TODO 8: Dominantsept chord, Leading tone (Cmaj7 C E G B and Dominantsept is C E G B- (flat))
-        # TODO 9: Polychords (Cmaj + Gmaj = Cmaj9 = C E G + G B D = C E G B D)
-
-    def get_chord21(self):
-        """
-        :return: music21 representation of the chord or rest
-        """
-        return self.chord_itself
-
-
-class Accompaniment:
-    """
-    Accompaniment is Chromosome for the evolutionary algorithm,
-    which is the sequence of chords for the accompaniment of the initial melody
-    """
-    def __init__(self, chords: list[Chord]):
-        """
-        Constructor of the accompaniment
-        :param chords: list of Chords
-        """
-        self.chords = chords
-        self.genes_count = len(chords)
-
-    def __str__(self):
-        res = ""
-        res += '\n'.join((str(self.chords[i]) for i in range(self.genes_count)))
-        res += '\n-----------------------------------'
-        return res
-
-
-class Melody:
-    """
-    Class of the Melody. Has methods to determine the key, parse all notes, find average volume and octaves
-    """
-    def __init__(self, stream: mus.stream.Stream, generate_rests: bool = False):
-        """
-        Constructor of the Melody
-        :param stream: the converted and parsed melody's stream from music21 converter
-        :param generate_rests: boolean to allow or prohibit the rest (silent) chord generation for the key
-        """
-        self.stream = stream
-        self.size_in_bars = int(stream.duration.quarterLength)
-        self.notes = []
-        self.key = None
-        self.parse_notes()
-        self.determine_key()
-        self.chords = self.key.get_chords(generate_rests)
-        self.lowest_octave, self.average_octave, self.highest_octave = self.get_octaves()
-
-    def parse_notes(self):
-        """
-        Parse notes (and rests) of the melody and store them into Melody.notes
-        :return: None
-        """
-        notes = []
-        for part in self.stream:
-            if type(part) == mus.stream.Part:
-                for bar in part:
-                    if type(bar) == mus.stream.Measure:
-                        for note in bar:
-                            if type(note) == mus.note.Note:
-                                if note.pitch.accidental is not None and (note.pitch.accidental.name == 'flat'):
-                                    note.pitch = mus.pitch.Pitch(NOTE_NAMES[NOTE_NAMES.index(note.pitch.step) - 1])
-                                notes.append(Note(note))
-                            elif type(note) == mus.note.Rest:
-                                notes.append(Rest(note))
-        self.notes = notes
-
-    def determine_key(self):
-        """
-        Method for the key determining of the whole melody. Determining is performed by manual calculation method.
-        However, automatic analysis (by music21 library) can be performed instead, just de-comment commented lines
-        :return: None, key is stored into Melody.key
-        """
-        # auto_determined = (self.stream.analyze('key'))
-        set_of_notes = set()
-        count_of_notes = dict()
-        i = 0
-        while type(self.notes[i]) == Rest:
-            i += 1
-        first_note = self.notes[i].pitch
-        i = -1
-        while type(self.notes[i]) == Rest:
-            i -= 1
-        last_note = self.notes[i].pitch
-        for note in self.notes:
-            if type(note) != Rest:
-                set_of_notes.add(note.pitch)
-                count_of_notes[note.pitch] = count_of_notes.get(note.pitch, 0) + 1
-        mostly_used_note = (list(count_of_notes.keys())[list(count_of_notes.values()).index(
-            max(list(count_of_notes.values())))])
-        possible_keys = []
-        key_probabilities = []
-        for note in set_of_notes:
-            missing_chords = 0
-            for i in range(7):
-                if NOTE_NAMES[(NOTE_NAMES.index(note) + sum(MAJOR_SCALE_STEPS[:i])) % 12] not in set_of_notes:
-                    missing_chords += 1
-            if (len(set_of_notes) < 7 and missing_chords <= (7 - len(set_of_notes))) or missing_chords == 0:
-                possible_keys.append(note)
-                key_probabilities.append(1)
-                possible_keys.append(NOTE_NAMES[(NOTE_NAMES.index(note) + sum(MAJOR_SCALE_STEPS[:5])) % 12] + MINOR)
-                key_probabilities.append(1)
-        for i in range(len(possible_keys)):
-            key = possible_keys[i]
-            tonic = key.rstrip(MINOR)
-            steps = MINOR_SCALE_STEPS if tonic != key else MAJOR_SCALE_STEPS
-            mediant = NOTE_NAMES[(NOTE_NAMES.index(tonic) + sum(steps[:2])) % 12]
-            dominant = NOTE_NAMES[(NOTE_NAMES.index(tonic) + sum(steps[:4])) % 12]
-            subdominant = NOTE_NAMES[(NOTE_NAMES.index(tonic) + sum(steps[:3])) % 12]
-            if last_note == tonic:
-                key_probabilities[i] *= 3
-            elif last_note == dominant:
-                key_probabilities[i] *= 2.5
-            elif last_note == mediant:
-                key_probabilities[i] *= 2.25
-            elif last_note == subdominant:
-                key_probabilities[i] *= 1.5
-            if first_note == tonic:
-                key_probabilities[i] *= 2
-            elif first_note == dominant:
-                key_probabilities[i] *= 1.75
-            elif first_note == mediant:
-                key_probabilities[i] *= 1.75
-            elif first_note == subdominant:
-                key_probabilities[i] *= 1.25
-            if mostly_used_note == tonic:
-                key_probabilities[i] *= 2.5
-            elif mostly_used_note == dominant:
-                key_probabilities[i] *= 2
-            elif mostly_used_note == mediant:
-                key_probabilities[i] *= 1.75
-            elif mostly_used_note == subdominant:
-                key_probabilities[i] *= 1.5
-        # self.key = Key(auto_determined.tonic.name + (MINOR if auto_determined.mode == 'minor' else MAJOR))
-        self.key = Key(possible_keys[key_probabilities.index(max(key_probabilities))])
-
-    def get_average_volume(self):
-        """
-        Method to get the average note's volume of the melody's notes
-        :return: average volume
-        """
-        sum_volumes = 0
-        notes_count = len(self.notes)
-        for note in self.notes:
-            if type(note) != Rest:
-                sum_volumes += int(note.get_volume21().velocity)
-        return sum_volumes // notes_count
-
-    def get_octaves(self):
-        """
-        Method to calculate the lowest, average and highest note's octave in the melody
-        :return: lowest, average, highest note's octave
-        """
-        lowest = 9
-        highest = 0
-        sum_of_octaves = 0
-        notes_count = len(self.notes)
-        for note in self.notes:
-            if type(note) != Rest:
-                oct = int(note.get_octave())
-                if oct < lowest:
-                    lowest = oct
-                if oct > highest:
-                    highest = oct
-                sum_of_octaves += oct
-        return lowest, sum_of_octaves // notes_count, highest
+from core.constants import *
+from core.lazy_import import LazyModule
+import numpy as np
+import random
+import math
+
+# music21 is imported only when MIDI parsing or rendering actually happens
+mus = LazyModule('music21')
+
+
+class AtomicPiece:
+    """
+    Abstract parent class for Notes and Rests
+    The music21 object of the piece (note_itself) is built only on the first access if it was not provided
+    """
+    __slots__ = ('duration', 'starting_time', 'piece21')
+
+    def __init__(self, piece=None, duration: float = None, starting_time: float = 0.0):
+        """
+        Constructor of the AtomicPiece
+        :param piece: music21 Note or Rest object with duration (or None, then duration and starting_time are used)
+        :param duration: duration of the piece in quarters (if piece is not provided)
+        :param starting_time: starting time of the piece in quarters (if piece is not provided)
+        """
+        self.piece21 = piece
+        if piece is not None:
+            self.duration = piece.duration.quarterLength
+            if piece.measureNumber:
+                self.starting_time = (piece.measureNumber - 1) * 4.0 + piece.offset
+            else:
+                self.starting_time = piece.offset
+        else:
+            self.duration = duration
+            self.starting_time = starting_time
+
+    @property
+    def note_itself(self):
+        """
+        :return: music21 object of the piece (built on the first access)
+        """
+        if self.piece21 is None:
+            self.piece21 = self.build_piece21()
+        return self.piece21
+
+    def build_piece21(self):
+        """
+        Method to build the music21 object of the piece from its values
+        :return: music21 object
+        """
+        raise NotImplementedError
+
+    def __getstate__(self):
+        """
+        music21 object is not pickled, it is built again from the values when needed
+        :return: values of the piece
+        """
+        return {slot: None if slot == 'piece21' else getattr(self, slot)
+                for cls in type(self).__mro__ for slot in getattr(cls, '__slots__', ())}
+
+    def __setstate__(self, state):
+        """
+        :param state: values of the piece
+        """
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+class Note(AtomicPiece):
+    """
+    The class of the note which contains pitch (e.g. C#), octave number, it's duration and starting time.
+    Needed for quick calculations of simultaneous playing of two notes,
+    because the starting_time and duration are easily accessibly without calculation.
+    However, instance of music21 class is accessible by note.note_itself
+    """
+    __slots__ = ('pitch', 'octave', 'octave_offset', 'velocity', 'written_octave', 'tie')
+
+    def __init__(self, note=None, octave_offset=0, pitch: str = None, octave: int = None, duration: float = None,
+                 starting_time: float = 0.0, velocity: int = None, tie: str = None):
+        """
+        Constructor of the Note class, takes the music21 Note class instance and the octave_offset (for inverses, etc.)
+        Instead of the music21 Note, the note values can be provided (then the music21 Note is built only if needed)
+        :param note: music21 Note class instance or None
+        :param octave_offset: the number to add to the base octave of the note during processing; by default set to 0
+        :param pitch: name of the note pitch (if note is not provided)
+        :param octave: octave of the note or None (if note is not provided)
+        :param duration: duration of the note in quarters (if note is not provided)
+        :param starting_time: starting time of the note in quarters (if note is not provided)
+        :param velocity: velocity (volume) of the note or None (if note is not provided)
+        :param tie: type of the tie of the note ('start', 'continue', 'stop') or None (if note is not provided)
+        """
+        super().__init__(note, duration, starting_time)
+        self.octave_offset = octave_offset
+        if note is not None:
+            self.pitch = note.name
+            self.octave = note.octave
+            self.velocity = note.volume.velocity
+            self.tie = note.tie.type if note.tie is not None else None
+        else:
+            self.pitch = pitch
+            self.octave = octave
+            self.velocity = velocity
+            self.tie = tie
+        # octave of the music21 note, it stays None for the notes without octave even when the octave is set
+        self.written_octave = self.octave
+
+    def build_piece21(self):
+        """
+        :return: music21 Note with the pitch, octave, duration, velocity and tie of the note
+        """
+        note = mus.note.Note(self.pitch, quarterLength=self.duration)
+        if self.written_octave is not None:
+            note.octave = self.written_octave
+        if self.velocity is not None:
+            note.volume.velocity = self.velocity
+        if self.tie is not None:
+            note.tie = mus.tie.Tie(self.tie)
+        return note
+
+    def get_note21(self) -> 'mus.note.Note':
+        """
+        Getter of music21 object
+        :return: Note music21 object
+        """
+        return self.note_itself
+
+    def get_volume21(self) -> 'mus.volume.Volume':
+        """
+        Getter for music21 volume object
+        :return: Volume from music21
+        """
+        return self.note_itself.volume
+
+    def get_octave(self) -> int:
+        """
+        Getter for the octave of the note (calculated with the offset)
+        :return: octave of the note
+        """
+        if self.octave:
+            return self.octave + self.octave_offset
+        elif self.piece21 is not None and self.piece21.octave:
+            return self.piece21.octave + self.octave_offset
+        else:
+            self.set_octave()
+            return self.octave + self.octave_offset
+
+    def set_octave(self, octave=3):
+        """
+        Setter for the note octave
+        :param octave: new octave
+        :return: None
+        """
+        self.octave = octave
+
+
+class Rest(AtomicPiece):
+    """
+    The class of the Rest piece of the music
+    """
+    __slots__ = ()
+
+    def __init__(self, rest=None, duration: float = 1.0, starting_time: float = 0.0):
+        """
+        Constructor of the rest. The music21 Rest class instance must be provided,
+        or its duration and starting time (then the music21 Rest is built only if needed)
+        :param rest: the music21 Rest class instance or None
+        :param duration: duration of the rest in quarters (if rest is not provided)
+        :param starting_time: starting time of the rest in quarters (if rest is not provided)
+        """
+        super().__init__(rest, duration, starting_time)
+
+    def build_piece21(self):
+        """
+        :return: music21 Rest with the duration of the rest
+        """
+        return mus.note.Rest(quarterLength=self.duration)
+
+
+class Key:
+    """
+    Class of the Key that stores the key's name, tonic, scale, gamma (cycling_pitches) and allows to get
+    all the consonant chords
+    Chord vocabularies, their interval weights and cyclic pitches are built once per process for every key
+    and shared by all the melodies in this key
+    """
+    # (key name, generate_rests) -> list of consonant chords; (key name, generate_rests) -> interval weights table;
+    # key name -> cyclic pitches
+    vocabularies = dict()
+    weight_tables = dict()
+    pitches = dict()
+
+    def __init__(self, key_name: str):
+        """
+        Constructor for the key, takes the key name
+        :param key_name: string containing the name of the key (in tiny notation, e.g. C#m or F)
+        """
+        self.scale = MINOR if MINOR in key_name else MAJOR
+        self.name = key_name
+        self.tonic = key_name.rstrip(self.scale)
+        self.cyclic_pitches = []
+        if key_name in Key.pitches:
+            self.cyclic_pitches = Key.pitches[key_name]
+        else:
+            self.find_cyclic_key_pitches()
+            Key.pitches[key_name] = self.cyclic_pitches
+
+    def find_cyclic_key_pitches(self):
+        """
+        Method to find the row of the key table (or the part of the circle of fifths)
+        """
+        for i in range(7):
+            pitch = NOTE_NAMES[(NOTE_NAMES.index(self.tonic) +
+                                (sum(MINOR_SCALE_STEPS[:i]) if (self.scale == MINOR) else
+                                 (sum(MAJOR_SCALE_STEPS[:i])))) % 12]
+            self.cyclic_pitches.append(pitch)
+
+    def get_chords(self, generate_rests: bool = False):
+        """
+        Method to get all the consonant chords for the current key. Chords can be used for the Accompaniment generation
+        Chords are built on the first request for the key and then shared (the list itself is a copy)
+        :param generate_rests: are rest (silent) chords allowed or not
+        :return: list of consonant chords
+        """
+        if (self.name, generate_rests) not in Key.vocabularies:
+            Key.vocabularies[(self.name, generate_rests)] = self.build_chords(generate_rests)
+        return list(Key.vocabularies[(self.name, generate_rests)])
+
+    def get_interval_weights(self, generate_rests: bool = False):
+        """
+        Method to get the table of interval weights of all the consonant chords (in the order of get_chords)
+        against every melody pitch class and the rest, built once for the key
+        :param generate_rests: are rest (silent) chords allowed or not
+        :return: numpy array (number of chords x 13), rows are Chord.interval_weights
+        """
+        if (self.name, generate_rests) not in Key.weight_tables:
+            Key.weight_tables[(self.name, generate_rests)] = np.array(
+                [chord.interval_weights for chord in self.get_chords(generate_rests)])
+        return Key.weight_tables[(self.name, generate_rests)]
+
+    @staticmethod
+    def prepare_all_vocabularies():
+        """
+        Method to build the chords and interval weights for all 24 major and minor keys (with and without rests)
+        in advance, e.g. in the worker process before it starts processing melodies
+        :return: None
+        """
+        for tonic in NOTE_NAMES:
+            for scale in (MAJOR, MINOR):
+                for generate_rests in (False, True):
+                    Key(tonic + scale).get_interval_weights(generate_rests)
+
+    def build_chords(self, generate_rests: bool = False):
+        """
+        Method to build all the consonant chords for the current key
+        :param generate_rests: are rest (silent) chords allowed or not
+        :return: list of consonant chords
+        """
+        consonant_chords = []
+        for i in range(7):
+            triad_name = self.cyclic_pitches[i] + (MINOR_KEY_SCALES[i] if (self.scale == MINOR) else
+                                                   MAJOR_KEY_SCALES[i])
+            consonant_chords.append(Chord(triad_name))
+        for i in range(7):
+            triad_type = (MINOR_KEY_SCALES[i] if (self.scale == MINOR) else MAJOR_KEY_SCALES[i])
+            sus2_allowed = (MINOR_SUS2_ALLOWED[i] if (self.scale == MINOR) else MAJOR_SUS2_ALLOWED[i])
+            sus4_allowed = (MINOR_SUS4_ALLOWED[i] if (self.scale == MINOR) else MAJOR_SUS4_ALLOWED[i])
+            if triad_type != DIMINISHED:
+                consonant_chords.append(Chord(self.cyclic_pitches[i] + triad_type, 1))
+                consonant_chords.append(Chord(self.cyclic_pitches[i] + triad_type, 2))
+                if sus2_allowed:
+                    consonant_chords.append(Chord(self.cyclic_pitches[i] + SUS2))
+                if sus4_allowed:
+                    consonant_chords.append(Chord(self.cyclic_pitches[i] + SUS4))
+            if generate_rests:
+                consonant_chords.append(Chord(REST))
+        return consonant_chords
+
+
+class Chord:
+    """
+    Class of the Chord, supports both Three-note chords and rest (silent) chords
+    Only the plain values (names, octave offsets, interval weights) are calculated on construction,
+    music21 representations (notes and chord_itself) are built on the first access
+    """
+    __slots__ = ('inverse', 'chord_type', 'tonic', 'name', 'note_names', 'octave_offsets', 'interval_weights',
+                 'chord_notes', 'chord21')
+
+    def __init__(self, chord_name: str, inverse_number=0):
+        """
+        Constructor of the Chord. Chord name must be provided. Possible types of Chords are:
+        m, DIM, sus2, sus4, (Major is empty string after the tonic)
+        :param chord_name: name of the chord, which must contain tonic name and chord type
+        :param inverse_number: 0, 1 or 2 for the inverse of triad Chords
+        """
+        self.inverse = inverse_number
+        self.note_names = []
+        self.octave_offsets = []
+        self.chord_notes = None
+        self.chord21 = None
+        if chord_name != REST:
+            self.chord_type = SUS2 if (SUS2 in chord_name) else (SUS4 if
+                                                                 (SUS4 in chord_name) else
+                                                                 DIMINISHED if (DIMINISHED in chord_name)
+                                                                 else MINOR if (MINOR in chord_name) else MAJOR)
+            self.tonic = chord_name[:len(chord_name) - len(self.chord_type)]
+            self.name = chord_name
+            self.calculate_note_names()
+        else:
+            self.chord_type = REST
+            self.tonic = None
+            self.name = REST
+            self.note_names = [REST]
+            self.octave_offsets = [0]
+        # TODO: chord_itself from three notes
+        self.interval_weights = self.calculate_interval_weights()
+
+    def __str__(self):
+        """
+        :return: string representation of the Chord: it's name and notes
+        """
+        return self.tonic + self.chord_type + \
+               (('inv' + str(self.inverse)) if self.inverse else '') + ' chord: ' + \
+               ' '.join(self.note_names)
+
+    def __getstate__(self):
+        """
+        music21 representations are not pickled, they are built again when needed
+        :return: values of the chord
+        """
+        return {slot: None if slot in ('chord_notes', 'chord21') else getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        """
+        :param state: values of the chord
+        """
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def calculate_note_names(self):
+        """
+        Method to calculate the names of the notes of the Chord and their octave offsets, given the chord tonic and type.
+        The table of offsets must be present in the file as CHORD_NOTE_OFFSETS.
+        The notes keyboard must also be present as NOTE_NAMES
+        :return: None, names are stored into Chord.note_names and offsets into Chord.octave_offsets
+        """
+        for offset in CHORD_NOTE_OFFSETS[self.chord_type]:
+            name = (NOTE_NAMES[(NOTE_NAMES.index(self.tonic) + offset) % 12])
+            self.note_names.append(name)
+            self.octave_offsets.append((1 if ((NOTE_NAMES.index(self.tonic) + offset) > 12) else 0) +
+                                       (1 if (self.inverse == 1 and len(self.note_names) == 1) or
+                                             (self.inverse == 2 and len(self.note_names) <= 2) else 0))
+
+    def calculate_notes(self):
+        """
+        Method to calculate all the notes of the Chord (even the rest) from the note names and octave offsets
+        :return: list of Notes (or one Rest for the rest chord)
+        """
+        # TODO 8: Dominantsept chord, Leading tone (Cmaj7 C E G B and Dominantsept is C E G B- (flat))
+        # TODO 9: Polychords (Cmaj + Gmaj = Cmaj9 = C E G + G B D = C E G B D)
+        if self.chord_type == REST:
+            return [Rest()]
+        return [Note(pitch=name, duration=4.0, octave_offset=octave_offset)
+                for name, octave_offset in zip(self.note_names, self.octave_offsets)]
+
+    @property
+    def notes(self):
+        """
+        :return: list of Notes of the chord (or one Rest for the rest chord), built on the first access
+        """
+        if self.chord_notes is None:
+            self.chord_notes = self.calculate_notes()
+        return self.chord_notes
+
+    @property
+    def chord_itself(self):
+        """
+        :return: music21 Chord of the notes (or music21 Rest for the rest chord), built on the first access
+        """
+        if self.chord21 is None:
+            if self.chord_type == REST:
+                self.chord21 = self.notes[0].note_itself
+            else:
+                self.chord21 = mus.chord.Chord([note.note_itself for note in self.notes])
+        return self.chord21
+
+    def calculate_interval_weights(self):
+        """
+        Method to calculate the consonance weight of the chord against every melody pitch class (and the melody rest).
+        Weight of the pitch class is the sum of interval weights between it and every chord note,
+        the last (REST_COLUMN) element is the weight of the melody rest
+        :return: numpy array of 13 weights, to be multiplied by the sounding durations of the melody in one bar
+        """
+        weights = np.zeros(REST_COLUMN + 1)
+        if self.chord_type == REST:
+            weights[:REST_COLUMN] = REST_CHORD_NOTE_PENALTY
+            weights[REST_COLUMN] = REST_CHORD_REST_BONUS
+        else:
+            for pitch_class in range(12):
+                for chord_note in self.note_names:
+                    interval = (pitch_class - NOTE_NAMES.index(chord_note)) % 12
+                    weights[pitch_class] += INTERVAL_CONSONANCE_WEIGHTS[interval]
+        return weights
+
+    def get_chord21(self):
+        """
+        :return: music21 representation of the chord or rest
+        """
+        return self.chord_itself
+
+
+class Accompaniment:
+    """
+    Accompaniment is Chromosome for the evolutionary algorithm,
+    which is the sequence of chords for the accompaniment of the initial melody
+    """
+    def __init__(self, chords: list[Chord]):
+        """
+        Constructor of the accompaniment
+        :param chords: list of Chords
+        """
+        self.chords = chords
+        self.genes_count = len(chords)
+
+    def __str__(self):
+        res = ""
+        res += '\n'.join((str(self.chords[i]) for i in range(self.genes_count)))
+        res += '\n-----------------------------------'
+        return res
+
+
+class Melody:
+    """
+    Class of the Melody. Has methods to determine the key, parse all notes, find average volume and octaves
+    """
+    def __init__(self, stream: 'mus.stream.Stream' = None, generate_rests: bool = False, notes: list = None,
+                 size_in_bars: int = None):
+        """
+        Constructor of the Melody
+        Instead of the music21 stream, already parsed notes can be provided, then music21 is not needed at all
+        :param stream: the converted and parsed melody's stream from music21 converter (or None)
+        :param generate_rests: boolean to allow or prohibit the rest (silent) chord generation for the key
+        :param notes: list of Notes and Rests of the melody in order (if stream is not provided)
+        :param size_in_bars: length of the melody (if stream is not provided; by default, the end of the last note)
+        """
+        self.stream = stream
+        self.generate_rests = generate_rests
+        self.notes = []
+        self.key = None
+        if stream is not None:
+            self.size_in_bars = int(stream.duration.quarterLength)
+            self.parse_notes()
+        else:
+            self.notes = notes
+            self.size_in_bars = (size_in_bars if size_in_bars is not None else
+                                 int(max([note.starting_time + note.duration for note in notes], default=0)))
+        self.duration_matrix = self.calculate_duration_matrix()
+        self.determine_key()
+        self.chords = self.key.get_chords(generate_rests)
+        self.interval_weights = self.key.get_interval_weights(generate_rests)
+        self.lowest_octave, self.average_octave, self.highest_octave = self.get_octaves()
+
+    def parse_notes(self):
+        """
+        Parse notes (and rests) of the melody and store them into Melody.notes
+        :return: None
+        """
+        notes = []
+        for part in self.stream:
+            if type(part) == mus.stream.Part:
+                for bar in part:
+                    if type(bar) == mus.stream.Measure:
+                        for note in bar:
+                            if type(note) == mus.note.Note:
+                                if note.pitch.accidental is not None and (note.pitch.accidental.name == 'flat'):
+                                    note.pitch = mus.pitch.Pitch(NOTE_NAMES[NOTE_NAMES.index(note.pitch.step) - 1])
+                                notes.append(Note(note))
+                            elif type(note) == mus.note.Rest:
+                                notes.append(Rest(note))
+        self.notes = notes
+
+    def calculate_duration_matrix(self):
+        """
+        Method to calculate the (size_in_bars x 13) matrix of sounding durations of every pitch class in every bar,
+        the last (REST_COLUMN) column stores the duration of the rests.
+        Durations are the same as the ones the consonance fitness used to accumulate note by note:
+        notes are scanned in their order until the first one starting after the end of the bar
+        :return: numpy array with durations
+        """
+        matrix = np.zeros((self.size_in_bars, REST_COLUMN + 1))
+        latest_start = 0.0
+        for note in self.notes:
+            latest_start = max(latest_start, note.starting_time)
+            column = REST_COLUMN if type(note) == Rest else NOTE_NAMES.index(note.pitch)
+            for i, duration in Melody.note_durations(note, latest_start, self.size_in_bars):
+                matrix[i, column] += duration
+        return matrix
+
+    @staticmethod
+    def note_durations(note, latest_start: float, size_in_bars: int = None):
+        """
+        Method to calculate the durations the note adds to the bars of the duration matrix
+        :param note: Note or Rest
+        :param latest_start: the latest starting time of this and all the previous notes
+        :param size_in_bars: length of the melody (None if it is not known yet)
+        :return: list of pairs (bar, duration)
+        """
+        durations = []
+        ending_time = note.starting_time + note.duration
+        last_bar = math.ceil(ending_time) if size_in_bars is None else min(size_in_bars, math.ceil(ending_time))
+        # bar i sees the note only if no previous note started after i + 1,
+        # and the duration can be non-zero only for the bars starting before the end of the note
+        for i in range(max(0, math.ceil(latest_start) - 1), last_bar):
+            if (i * 1.0) < note.starting_time < ((i + 1) * 1.0):
+                duration = (min([ending_time, (i + 1) * 1.0]) - note.starting_time)
+            elif i * 1.0 < ending_time:
+                duration = ending_time - i * 1.0
+            else:
+                duration = 0
+            durations.append((i, duration))
+        return durations
+
+    def determine_key(self):
+        """
+        Method for the key determining of the whole melody. Determining is performed by manual calculation method
+        (see Melody.key_names). However, automatic analysis (by music21 library) can be performed instead,
+        just de-comment commented lines
+        :return: None, key is stored into Melody.key
+        """
+        # auto_determined = (self.stream.analyze('key'))
+        # self.key = Key(auto_determined.tonic.name + (MINOR if auto_determined.mode == 'minor' else MAJOR))
+        key_name = Melody.key_names(*[np.array([value]) for value in Melody.pitch_class_histogram(self.notes)])[0]
+        if key_name is None:
+            raise ValueError('No key contains all the notes of the melody')
+        self.key = Key(key_name)
+
+    @staticmethod
+    def pitch_class_histogram(notes: list):
+        """
+        Method to calculate the statistics of the pitch classes the key is determined by
+        :param notes: list of Notes and Rests
+        :return: durations (in quarters) and numbers of notes of every pitch class (arrays of 12),
+                pitch classes of the first, the last and the most used note (the first used one among equally used),
+                -1 for the melody without notes
+        """
+        pitch_classes = np.fromiter([REST_COLUMN if type(note) == Rest else PITCH_CLASSES[note.pitch]
+                                     for note in notes], int, len(notes))
+        durations = np.fromiter([note.duration for note in notes], float, len(notes))
+        is_note = pitch_classes != REST_COLUMN
+        pitch_classes, durations = pitch_classes[is_note], durations[is_note]
+        if len(pitch_classes) == 0:
+            return np.zeros(12), np.zeros(12, dtype=int), -1, -1, -1
+        counts = np.bincount(pitch_classes, minlength=12)
+        most_used = min(np.flatnonzero(counts == counts.max()),
+                        key=lambda pitch_class: np.argmax(pitch_classes == pitch_class))
+        return (np.bincount(pitch_classes, durations, minlength=12), counts, pitch_classes[0], pitch_classes[-1],
+                most_used)
+
+    @staticmethod
+    def key_names(durations: np.ndarray, counts: np.ndarray, first_notes: np.ndarray, last_notes: np.ndarray,
+                  most_used_notes: np.ndarray):
+        """
+        Method to choose the keys of many melodies at once by their pitch class statistics
+        (see Melody.pitch_class_histogram), all 24 keys of all the melodies are scored together.
+        The keys containing all the used notes (or the whole scale of which is used) are possible,
+        the ones whose tonic, dominant, mediant or subdominant is the first, the last or the most used note
+        are more probable (see LAST_NOTE_KEY_WEIGHTS and others). The equally probable keys are compared
+        by the duration of the notes of their tonic triads
+        :param durations: durations of the pitch classes of every melody (melodies x 12)
+        :param counts: numbers of notes of the pitch classes of every melody (melodies x 12)
+        :param first_notes: pitch class of the first note of every melody
+        :param last_notes: pitch class of the last note of every melody
+        :param most_used_notes: pitch class of the most used note of every melody
+        :return: list of names of the most probable keys (None for the melody no key is possible for)
+        """
+        present = counts > 0
+        number_of_notes = present.sum(axis=1)
+        scale_notes_used = present.astype(int) @ KEY_SCALES[:12].T.astype(int)
+        # the major key is possible if its tonic is used and the melody is inside its scale (if it has less than 7
+        # different notes) or uses its whole scale, then the relative minor key is possible too
+        possible = present & (((number_of_notes < 7)[:, None] & (scale_notes_used == number_of_notes[:, None]))
+                              | (scale_notes_used == 7))
+        possible = np.concatenate([possible, possible[:, RELATIVE_MAJOR_TONICS]], axis=1)
+        probabilities = (LAST_NOTE_WEIGHTS[:, last_notes] * FIRST_NOTE_WEIGHTS[:, first_notes]
+                         * MOST_USED_NOTE_WEIGHTS[:, most_used_notes]).T
+        probabilities = np.where(possible, probabilities, 0.0)
+        best = probabilities == probabilities.max(axis=1, keepdims=True)
+        choices = np.argmax(np.where(best, durations @ KEY_TONIC_TRIADS.T, -1.0), axis=1)
+        return [KEY_NAMES[choice] if possible[i].any() else None for i, choice in enumerate(choices)]
+
+    @staticmethod
+    def key_name(first_note: str, last_note: str, count_of_notes: dict, duration_of_notes: dict = None):
+        """
+        Method to choose the key by the notes of the melody (see Melody.key_names)
+        :param first_note: pitch of the first note
+        :param last_note: pitch of the last note
+        :param count_of_notes: dictionary of the number of notes of every pitch (in the order of the first use)
+        :param duration_of_notes: dictionary of the duration of notes of every pitch (by default, the numbers of notes
+                are used to compare equally probable keys)
+        :return: name of the most probable key
+        """
+        counts = np.zeros((1, 12), dtype=int)
+        durations = np.zeros((1, 12))
+        for pitch, count in count_of_notes.items():
+            counts[0, PITCH_CLASSES[pitch]] = count
+            durations[0, PITCH_CLASSES[pitch]] = (duration_of_notes or count_of_notes)[pitch]
+        mostly_used_note = max(count_of_notes, key=count_of_notes.get)
+        key_name = Melody.key_names(durations, counts, np.array([PITCH_CLASSES[first_note]]),
+                                    np.array([PITCH_CLASSES[last_note]]),
+                                    np.array([PITCH_CLASSES[mostly_used_note]]))[0]
+        if key_name is None:
+            raise ValueError('No key contains all the notes of the melody')
+        return key_name
+
+    @staticmethod
+    def detect_keys(melodies_notes: list):
+        """
+        Method to determine the keys of many melodies at once, e.g. for the key analysis of the whole corpus
+        (the Melodies are not built, so neither the chords nor anything else is calculated)
+        :param melodies_notes: list of lists of Notes and Rests
+        :return: list of names of the keys (None for the melody without a possible key or without notes)
+        """
+        if not melodies_notes:
+            return []
+        histograms = [Melody.pitch_class_histogram(notes) for notes in melodies_notes]
+        durations, counts, first_notes, last_notes, most_used_notes = [np.array(values) for values in zip(*histograms)]
+        key_names = Melody.key_names(durations, counts, first_notes, last_notes, most_used_notes)
+        return [key_name if first_note >= 0 else None for key_name, first_note in zip(key_names, first_notes)]
+
+    def get_average_volume(self):
+        """
+        Method to get the average note's volume of the melody's notes
+        :return: average volume
+        """
+        sum_volumes = 0
+        notes_count = len(self.notes)
+        for note in self.notes:
+            if type(note) != Rest:
+                sum_volumes += int(note.velocity)
+        return sum_volumes // notes_count
+
+    def get_octaves(self):
+        """
+        Method to calculate the lowest, average and highest note's octave in the melody
+        :return: lowest, average, highest note's octave
+        """
+        lowest = 9
+        highest = 0
+        sum_of_octaves = 0
+        notes_count = len(self.notes)
+        for note in self.notes:
+            if type(note) != Rest:
+                oct = int(note.get_octave())
+                if oct < lowest:
+                    lowest = oct
+                if oct > highest:
+                    highest = oct
+                sum_of_octaves += oct
+        return lowest, sum_of_octaves // notes_count, highest
+
+
+def key_tables():
+    """
+    Function to build the tables of all 24 keys used by Melody.key_names (majors from C, then minors from Cm)
+    :return: names of the keys, key x pitch class arrays: scale membership, tonic triad membership and the weights
+            of the last, the first and the most used note, and the relative major tonic of every minor key
+    """
+    names = [NOTE_NAMES[tonic] + scale for scale in (MAJOR, MINOR) for tonic in range(12)]
+    scales = np.zeros((24, 12), dtype=bool)
+    tonic_triads = np.zeros((24, 12))
+    weights = np.ones((3, 24, 12))
+    for key in range(24):
+        tonic = key % 12
+        steps = MAJOR_SCALE_STEPS if key < 12 else MINOR_SCALE_STEPS
+        degrees = [(tonic + sum(steps[:i])) % 12 for i in range(7)]
+        scales[key, degrees] = True
+        tonic_triads[key, [degrees[0], degrees[2], degrees[4]]] = 1.0
+        # tonic, dominant, mediant and subdominant
+        for degree, pitch_class in enumerate([degrees[0], degrees[4], degrees[2], degrees[3]]):
+            for heuristic, key_weights in enumerate([LAST_NOTE_KEY_WEIGHTS, FIRST_NOTE_KEY_WEIGHTS,
+                                                     MOST_USED_NOTE_KEY_WEIGHTS]):
+                weights[heuristic, key, pitch_class] = key_weights[degree]
+    relative_major_tonics = [(tonic + 12 - sum(MAJOR_SCALE_STEPS[:5])) % 12 for tonic in range(12)]
+    return names, scales, tonic_triads, weights[0], weights[1], weights[2], relative_major_tonics
+
+
+(KEY_NAMES, KEY_SCALES, KEY_TONIC_TRIADS, LAST_NOTE_WEIGHTS, FIRST_NOTE_WEIGHTS, MOST_USED_NOTE_WEIGHTS,
+ RELATIVE_MAJOR_TONICS) = key_tables()
@@ -0,0 +1,190 @@
+from core.constants import *
+import numpy as np
+
+
+def top_indices(values: np.ndarray, k: int):
+    """
+    Function to find the k largest values by the partial selection (in linear time, without the full sort)
+    :param values: array of values
+    :param k: how many values to find
+    :return: array of indices of the k largest values in no particular order
+    """
+    if k <= 0:
+        return np.array([], dtype=int)
+    if k >= len(values):
+        return np.arange(len(values))
+    return np.argpartition(values, len(values) - k)[len(values) - k:]
+
+
+def unique_rows(genes: np.ndarray):
+    """
+    Function to find the distinct members given as the matrix of genes
+    :param genes: (number of members x number of bars) matrix of chord indices
+    :return: sorted array of indices of the first occurrence of every distinct row
+    """
+    if len(genes) == 0:
+        return np.array([], dtype=int)
+    rows = np.ascontiguousarray(genes).view(np.dtype((np.void, genes.dtype.itemsize * genes.shape[1])))
+    return np.sort(np.unique(rows.ravel(), return_index=True)[1])
+
+
+def gene_keys(genes: np.ndarray):
+    """
+    Function to get the hashable keys of the members (the bytes of their rows of chord indices, as in FitnessCache)
+    :param genes: (number of members x number of bars) matrix of chord indices
+    :return: set of keys of all the rows
+    """
+    return {row.tobytes() for row in genes}
+
+
+def duplicate_rows(genes: np.ndarray, known: set):
+    """
+    Function to find the members which are already known or repeat the previous members, the keys of other members
+    are added to the known ones
+    :param genes: (number of members x number of bars) matrix of chord indices
+    :param known: set of the keys of known members (see gene_keys)
+    :return: boolean array, True for the duplicates
+    """
+    duplicates = np.zeros(len(genes), dtype=bool)
+    for i in range(len(genes)):
+        key = genes[i].tobytes()
+        if key in known:
+            duplicates[i] = True
+        else:
+            known.add(key)
+    return duplicates
+
+
+def diversity(genes: np.ndarray, vocabulary_size: int):
+    """
+    Function to measure the diversity of the population
+    :param genes: (number of members x number of bars) matrix of chord indices
+    :param vocabulary_size: number of chords in the vocabulary
+    :return: fraction of distinct members and the average over the bars of the entropy (in bits)
+            of the chords chosen for the bar
+    """
+    if genes.size == 0:
+        return 0.0, 0.0
+    members, bars = genes.shape
+    counts = np.bincount((genes + np.arange(bars) * vocabulary_size).ravel(),
+                         minlength=bars * vocabulary_size).reshape(bars, vocabulary_size)
+    probabilities = counts[counts > 0] / members
+    return len(unique_rows(genes)) / members, float(-(probabilities * np.log2(probabilities)).sum() / bars)
+
+
+def survivor_indices(fitness: np.ndarray, size: int, number_of_parents: int = None, elitism: int = None,
+                     genes: np.ndarray = None):
+    """
+    Function to choose the members of the next generation from the parents followed by the children.
+    By default, the size most fit members survive (parents and children compete with each other).
+    With elitism, only the elitism best parents are kept for sure, the children take the remaining places
+    (the best ones, if there are too many of them) and the best other parents fill the places left.
+    If the genes are given, only one copy of every distinct member can survive
+    (unless there are too few distinct members to fill the generation)
+    :param fitness: array of fitness values of the parents and the children
+    :param size: how many members survive
+    :param number_of_parents: how many of the members are the parents (needed for elitism)
+    :param elitism: how many best parents always survive, None for the competition of all the members
+    :param genes: matrix of genes of the members to remove the duplicates, None to keep them
+    :return: array of indices of the survivors in no particular order
+    """
+    candidates = np.arange(len(fitness)) if genes is None else unique_rows(genes)
+    if elitism is None:
+        chosen = candidates[top_indices(fitness[candidates], size)]
+    else:
+        parents = candidates[candidates < number_of_parents]
+        children = candidates[candidates >= number_of_parents]
+        elites = top_indices(fitness[parents], min(elitism, size))
+        other_parents = np.delete(parents, elites)
+        parents = parents[elites]
+        children = children[top_indices(fitness[children], size - len(parents))]
+        other_parents = other_parents[top_indices(fitness[other_parents], size - len(parents) - len(children))]
+        chosen = np.concatenate([parents, children, other_parents])
+    if len(chosen) < size:
+        others = np.setdiff1d(np.arange(len(fitness)), chosen, assume_unique=True)
+        chosen = np.concatenate([chosen, others[top_indices(fitness[others], size - len(chosen))]])
+    return chosen
+
+
+class CompactPopulation:
+    """
+    Array-backed population for the evolutionary algorithm: one contiguous integer matrix of genes
+    (population size x number of bars, each gene is the index of the chord in the vocabulary)
+    and the parallel array of fitness values. Members are not ordered, the index of the best member is tracked
+    Separate fitness terms of the members can be stored as well (for the incremental evaluation of children)
+    """
+    def __init__(self, genes: np.ndarray, fitness: np.ndarray, components: np.ndarray = None, best: int = None):
+        """
+        Constructor of the population
+        :param genes: (population size x number of bars) matrix of chord indices
+        :param fitness: array of fitness values of the members (in the same order)
+        :param components: (population size x 3) array of fitness terms of the members or None
+        :param best: index of the most fit member (found if not given)
+        """
+        self.genes = genes
+        self.fitness = fitness
+        self.components = components
+        self.best = best if best is not None or len(fitness) == 0 else int(np.argmax(fitness))
+
+    def __len__(self):
+        """
+        :return: number of members in the population
+        """
+        return len(self.fitness)
+
+    @staticmethod
+    def gene_type(vocabulary_size: int):
+        """
+        :param vocabulary_size: number of chords in the vocabulary
+        :return: the smallest numpy integer type able to store any chord index
+        """
+        return np.min_scalar_type(max(vocabulary_size - 1, 0))
+
+    def fitness_sum(self):
+        """
+        :return: sum of all the fitness values
+        """
+        return float(self.fitness.sum())
+
+    def extend(self, genes: np.ndarray, fitness: np.ndarray, components: np.ndarray = None):
+        """
+        Method to get the population extended by new members
+        :param genes: matrix of genes of the new members
+        :param fitness: fitness values of the new members
+        :param components: fitness terms of the new members (if the population stores them)
+        :return: new CompactPopulation with the current members followed by the new ones
+        """
+        best = self.best
+        if len(fitness) and (best is None or fitness.max() > self.fitness[best]):
+            best = len(self) + int(np.argmax(fitness))
+        return CompactPopulation(np.concatenate([self.genes, genes]), np.concatenate([self.fitness, fitness]),
+                                 None if self.components is None else np.concatenate([self.components, components]),
+                                 best)
+
+    def take(self, indices: np.ndarray):
+        """
+        :param indices: indices of the members
+        :return: new CompactPopulation of the members with the given indices
+        """
+        return CompactPopulation(self.genes[indices], self.fitness[indices],
+                                 None if self.components is None else self.components[indices])
+
+    def select_fittest(self, size: int, number_of_parents: int = None, elitism: int = None,
+                       remove_duplicates: bool = False):
+        """
+        Method to get the members of the next generation by the partial selection (see survivor_indices)
+        :param size: how many members to keep
+        :param number_of_parents: how many first members are the parents (needed for elitism)
+        :param elitism: how many best parents always survive, None for the competition of all the members
+        :param remove_duplicates: keep only one copy of every distinct member when possible
+        :return: new CompactPopulation of the survivors
+        """
+        return self.take(survivor_indices(self.fitness, size, number_of_parents, elitism,
+                                          self.genes if remove_duplicates else None))
+
+    def best_members(self, number_of_members: int):
+        """
+        :param number_of_members: how many members to find
+        :return: indices of the most fit members in no particular order
+        """
+        return top_indices(self.fitness, number_of_members)
@@ -0,0 +1,122 @@
+from core.music_units import *
+import hashlib
+import json
+import os
+
+# Default number of search results kept in the cache directory:
+RESULT_CACHE_SIZE = 10000
+
+
+def melody_digest(melody: Melody):
+    """
+    Function to calculate the hash of the melody content: its length and pitch, octave, starting time
+    and duration of every note and rest (the values the search depends on)
+    :param melody: the melody
+    :return: hexadecimal SHA-256 digest
+    """
+    content = [melody.size_in_bars]
+    for note in melody.notes:
+        if type(note) == Rest:
+            content.append([None, None, float(note.starting_time), float(note.duration)])
+        else:
+            content.append([note.pitch, note.written_octave, float(note.starting_time), float(note.duration)])
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent content-addressed cache of the search results: for every melody content, rests permission,
+    search parameters and random seed the chosen chord sequence, key and fitness are stored in a separate
+    JSON file of the cache directory. When there are more than max_size files, the least recently used
+    ones are deleted. The cache can be shared by several processes
+    """
+    def __init__(self, directory: str, max_size: int = RESULT_CACHE_SIZE):
+        """
+        Constructor of the cache
+        :param directory: directory of the cache files (created if needed)
+        :param max_size: how many results to keep
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def result_key(melody: Melody, search_parameters: dict, seed: int = None):
+        """
+        :param melody: the melody (its content and rests permission are used)
+        :param search_parameters: parameters of the search engine
+        :param seed: random seed of the search (None if the search was not seeded)
+        :return: key of the search result
+        """
+        content = json.dumps([melody_digest(melody), melody.generate_rests, search_parameters, seed], sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def file_name(self, key: str):
+        """
+        :param key: key of the search result
+        :return: name of the file with the result
+        """
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, melody: Melody, key: str):
+        """
+        Method to find the stored result for the melody
+        :param melody: the melody, its chord vocabulary is used to restore the accompaniment
+        :param key: key of the search result
+        :return: stored Accompaniment and its fitness or None if there is no such result
+        """
+        try:
+            with open(self.file_name(key)) as result_file:
+                result = json.load(result_file)
+            os.utime(self.file_name(key))
+        except (OSError, ValueError):
+            return None
+        chords = {(chord.name, chord.inverse): chord for chord in melody.chords}
+        try:
+            accompaniment = Accompaniment([chords[(name, inverse)] for name, inverse in result['chords']])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if result.get('key') != melody.key.name:
+            return None
+        return accompaniment, result['fitness']
+
+    def put(self, melody: Melody, key: str, accompaniment: Accompaniment, fitness: float):
+        """
+        Method to store the result of the search and to evict the least recently used results
+        :param melody: the melody
+        :param key: key of the search result
+        :param accompaniment: the found accompaniment
+        :param fitness: its fitness
+        :return: None
+        """
+        result = {'key': melody.key.name, 'fitness': float(fitness),
+                  'chords': [[chord.name, chord.inverse] for chord in accompaniment.chords]}
+        temporary_file_name = self.file_name(key) + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_file_name, 'w') as result_file:
+            json.dump(result, result_file)
+        os.replace(temporary_file_name, self.file_name(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Method to delete the least recently used results above the size of the cache
+        :return: None
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+        if len(files) <= self.max_size:
+            return
+        files.sort()
+        for modified, path in files[:len(files) - self.max_size]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.directory) if name.endswith('.json')])
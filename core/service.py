@@ -0,0 +1,356 @@
+from core.batch import *
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import tempfile
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+# Jobs waiting for a free worker (running ones are not counted), the next jobs are rejected:
+QUEUE_DEPTH = 32
+# Seconds from accepting the job to sending the result:
+JOB_TIMEOUT = 60.0
+# Share of the remaining time of the job given to the evolution (the rest is left for reading and rendering):
+EVOLUTION_TIME_SHARE = 0.9
+# Largest MIDI payload accepted, in bytes:
+MAX_PAYLOAD_SIZE = 1 << 20
+# Latencies of that many last jobs are used for the statistics:
+LATENCY_WINDOW = 1000
+# Query parameters of the job and the keyword arguments of GeneratorOfAccompaniment they set:
+JOB_PARAMETERS = {'engine': ('engine', str), 'generations': ('number_of_generations_ea', int),
+                  'population': ('population_size_ea', int), 'percentage': ('new_members_percentage_ea', int),
+                  'seed': ('seed', int), 'time_limit': ('time_limit_ea', float)}
+STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                422: 'Unprocessable Entity', 429: 'Too Many Requests', 500: 'Internal Server Error',
+                504: 'Gateway Timeout'}
+
+
+def warm_worker(preload_music21: bool = False):
+    """
+    Initializer of the worker process: the chord vocabularies of all the keys are built (and music21 is imported)
+    once, before the worker gets its first job
+    :param preload_music21: import music21 too (it is needed only for the files the native reader does not support
+            and for the music21 renderer)
+    :return: None
+    """
+    Key.prepare_all_vocabularies()
+    if preload_music21:
+        mus.converter
+
+
+def worker_is_ready():
+    """
+    Job submitted to every worker at the start of the service, so the workers are started and warmed in advance
+    :return: True
+    """
+    return True
+
+
+def process_job(payload: bytes, style: int, rests: bool, generator_parameters: dict, native_reader: bool = True,
+                renderer: str = NATIVE_RENDERER, time_limit: float = None):
+    """
+    Function for generating the accompaniment for the MIDI file given as bytes (run in the worker process).
+    The payload and the result are stored in the temporary directory, then the file is processed just like in the batch
+    :param payload: contents of the input .mid file
+    :param style: style number (0 to 5)
+    :param rests: are rest chords allowed or not
+    :param generator_parameters: keyword arguments for GeneratorOfAccompaniment
+    :param native_reader: read the file with the native MIDI reader when possible (see load_melody)
+    :param renderer: MIDI rendering backend, 'native' or 'music21'
+    :param time_limit: time limit (in seconds) for the evolution left by the deadline of the job
+    :return: record of the job (see process_file, without the file names) and the output .mid file as bytes
+            (None if the job failed)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, 'input.mid')
+        with open(input_file, 'wb') as midi_file:
+            midi_file.write(payload)
+        record = process_file(input_file, directory, style, rests, generator_parameters, native_reader, renderer,
+                              time_limit=time_limit)
+        output = None
+        if record['status'] == DONE:
+            with open(record['output'], 'rb') as midi_file:
+                output = midi_file.read()
+    record.pop('file')
+    record.pop('output', None)
+    return record, output
+
+
+def percentiles(values):
+    """
+    :param values: collection of numbers
+    :return: dictionary of the mean, median, 90th and 99th percentiles and the maximum (empty for no values)
+    """
+    if not values:
+        return dict()
+    ordered = sorted(values)
+    return {'mean': sum(ordered) / len(ordered), 'p50': ordered[(len(ordered) - 1) // 2],
+            'p90': ordered[int(0.9 * (len(ordered) - 1))], 'p99': ordered[int(0.99 * (len(ordered) - 1))],
+            'max': ordered[-1]}
+
+
+class LatencyStatistics:
+    """
+    Counters of the jobs and the latencies (waiting in the queue, processing and total, in seconds)
+    of the last LATENCY_WINDOW finished jobs
+    """
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.started = time.time()
+        self.counters = dict.fromkeys(['accepted', 'done', 'failed', 'rejected', 'timed_out'], 0)
+        self.latencies = {name: deque(maxlen=window) for name in ('queue', 'processing', 'total')}
+
+    def count(self, counter: str):
+        self.counters[counter] += 1
+
+    def add(self, queue: float, processing: float, total: float):
+        """
+        Method to record the latencies of the finished job
+        :return: None
+        """
+        self.latencies['queue'].append(queue)
+        self.latencies['processing'].append(processing)
+        self.latencies['total'].append(total)
+
+    def snapshot(self):
+        """
+        :return: dictionary of the counters, uptime and percentiles of the latencies
+        """
+        return {'uptime': time.time() - self.started, 'jobs': dict(self.counters),
+                'latency': {name: percentiles(values) for name, values in self.latencies.items()}}
+
+
+class AccompanimentService:
+    """
+    Long-running accompaniment service on localhost: jobs (MIDI files with the style, rests permission
+    and search parameters) are received over HTTP and dispatched to the pool of worker processes, which are started
+    and warmed (see warm_worker) once, so neither the imports nor the chord vocabularies are paid per job.
+    The endpoints are:
+    POST /accompany?style=0&rests=1&engine=dp&generations=100&population=1000&percentage=30&seed=1&time_limit=5
+    with the .mid file as the body (all the parameters are optional), answered with the accompanied .mid file
+    (the key, fitness and timings are in the X-Key, X-Fitness and X-Seconds headers);
+    GET /stats with the JSON statistics of the jobs and GET /health.
+    At most QUEUE_DEPTH jobs wait for a free worker, the next ones are answered with 429. The job not finished
+    within its timeout is answered with 504, the evolution gets most of the remaining time as its time limit,
+    so the worker stops soon after that
+    """
+    def __init__(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = None,
+                 queue_depth: int = QUEUE_DEPTH, job_timeout: float = JOB_TIMEOUT,
+                 generator_parameters: dict = None, native_reader: bool = True, renderer: str = NATIVE_RENDERER,
+                 preload_music21: bool = False):
+        """
+        Constructor of the service
+        :param host: address to listen on (localhost by default)
+        :param port: port to listen on (0 for any free port, see self.port after the start)
+        :param workers: number of worker processes (by default, as many as processors)
+        :param queue_depth: how many jobs can wait for a free worker
+        :param job_timeout: seconds from accepting the job to sending the result
+        :param generator_parameters: default keyword arguments for GeneratorOfAccompaniment (the job can override
+                the ones in JOB_PARAMETERS)
+        :param native_reader: read the files with the native MIDI reader when possible (see load_melody)
+        :param renderer: MIDI rendering backend, 'native' or 'music21'
+        :param preload_music21: import music21 in the workers in advance (see warm_worker)
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.queue_depth = queue_depth
+        self.job_timeout = job_timeout
+        self.generator_parameters = generator_parameters or {}
+        self.native_reader = native_reader
+        self.renderer = renderer
+        self.preload_music21 = preload_music21
+        self.statistics = LatencyStatistics()
+        self.pool = None
+        self.server = None
+        self.free_workers = None
+        self.waiting = 0
+        self.running = 0
+
+    async def start(self):
+        """
+        Method to start and warm the worker processes and to start listening
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=warm_worker, initargs=(self.preload_music21,))
+        await asyncio.gather(*[loop.run_in_executor(self.pool, worker_is_ready) for i in range(self.workers)])
+        self.free_workers = asyncio.Semaphore(self.workers)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """
+        Method to stop listening and to shut the worker processes down
+        :return: None
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        """
+        Method to run the service until it is interrupted
+        :return: None
+        """
+        try:
+            await self.start()
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    def job_parameters(self, query: dict):
+        """
+        Method to parse the parameters of the job
+        :param query: dictionary of the query parameters (lists of values, see parse_qs)
+        :return: style, rests permission and keyword arguments for GeneratorOfAccompaniment
+        """
+        unknown = set(query) - set(JOB_PARAMETERS) - {'style', 'rests'}
+        if unknown:
+            raise ValueError('Unknown parameters: ' + ', '.join(sorted(unknown)))
+        style = int(query.get('style', ['0'])[-1])
+        if not 0 <= style < len(STYLE_NAMES):
+            raise ValueError('Style must be 0 to ' + str(len(STYLE_NAMES) - 1))
+        rests = query.get('rests', ['0'])[-1].lower() in ('1', 'true', 'yes')
+        generator_parameters = dict(self.generator_parameters)
+        for name, (keyword, value_type) in JOB_PARAMETERS.items():
+            if name in query:
+                generator_parameters[keyword] = value_type(query[name][-1])
+        if generator_parameters.get('engine', EVOLUTIONARY_ENGINE) not in (EVOLUTIONARY_ENGINE,
+                                                                          DYNAMIC_PROGRAMMING_ENGINE):
+            raise ValueError('Unknown engine: ' + generator_parameters['engine'])
+        for keyword in ('number_of_generations_ea', 'population_size_ea', 'new_members_percentage_ea'):
+            if generator_parameters.get(keyword, 1) < 1:
+                raise ValueError(keyword + ' must be positive')
+        return style, rests, generator_parameters
+
+    async def run_job(self, payload: bytes, style: int, rests: bool, generator_parameters: dict):
+        """
+        Method to process the job in the pool: the job waits for a free worker (the worker is considered busy
+        until its job is actually over, even after the timeout), and the whole job is limited by the job timeout
+        :param payload: contents of the input .mid file
+        :param style: style number (0 to 5)
+        :param rests: are rest chords allowed or not
+        :param generator_parameters: keyword arguments for GeneratorOfAccompaniment
+        :return: status code, headers and body of the response
+        """
+        accepted = time.perf_counter()
+        deadline = accepted + self.job_timeout
+        if self.free_workers.locked():
+            if self.waiting >= self.queue_depth:
+                self.statistics.count('rejected')
+                return 429, {}, b'Too many jobs in the queue\n'
+            self.statistics.count('accepted')
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.free_workers.acquire(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                self.statistics.count('timed_out')
+                return 504, {}, b'The job was not started in time\n'
+            finally:
+                self.waiting -= 1
+        else:
+            self.statistics.count('accepted')
+            # the free worker is taken at once
+            await self.free_workers.acquire()
+        started = time.perf_counter()
+        # the evolution gets the share of the remaining time (kept out of the parameters of the result cache key)
+        time_limit = EVOLUTION_TIME_SHARE * (deadline - started)
+        self.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, process_job, payload, style, rests,
+                                                            generator_parameters, self.native_reader, self.renderer,
+                                                            time_limit)
+        future.add_done_callback(self.release_worker)
+        try:
+            record, output = await asyncio.wait_for(asyncio.shield(future), deadline - started)
+        except asyncio.TimeoutError:
+            self.statistics.count('timed_out')
+            return 504, {}, b'The job was not finished in time\n'
+        finished = time.perf_counter()
+        self.statistics.add(started - accepted, finished - started, finished - accepted)
+        if record['status'] != DONE:
+            self.statistics.count('failed')
+            return 422, {}, (record['error'] + '\n').encode()
+        self.statistics.count('done')
+        headers = {'Content-Type': 'audio/midi', 'X-Key': record['key'], 'X-Fitness': str(record['fitness']),
+                   'X-Seconds': json.dumps(record['seconds'])}
+        if record.get('cached'):
+            headers['X-Cached'] = '1'
+        return 200, headers, output
+
+    def release_worker(self, future):
+        """
+        Callback of the finished job making its worker free
+        :param future: future of the job
+        :return: None
+        """
+        self.running -= 1
+        self.free_workers.release()
+
+    async def respond(self, method: str, target: str, body: bytes):
+        """
+        Method to answer the request
+        :param method: HTTP method
+        :param target: path with the query
+        :param body: body of the request
+        :return: status code, headers and body of the response
+        """
+        url = urlsplit(target)
+        if url.path == '/health' and method == 'GET':
+            return 200, {'Content-Type': 'text/plain'}, b'ok\n'
+        if url.path == '/stats' and method == 'GET':
+            statistics = self.statistics.snapshot()
+            statistics.update({'workers': self.workers, 'running': self.running, 'waiting': self.waiting,
+                               'queue_depth': self.queue_depth})
+            return 200, {'Content-Type': 'application/json'}, json.dumps(statistics).encode()
+        if url.path == '/accompany' and method == 'POST':
+            try:
+                style, rests, generator_parameters = self.job_parameters(parse_qs(url.query))
+            except ValueError as error:
+                return 400, {}, (str(error) + '\n').encode()
+            if not body:
+                return 400, {}, b'The body must be the .mid file\n'
+            return await self.run_job(body, style, rests, generator_parameters)
+        return 404, {}, b'Not found\n'
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Method to serve one HTTP/1.1 request of the connection (the connection is closed after the response)
+        :param reader: stream of the request
+        :param writer: stream of the response
+        :return: None
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = dict()
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if len(request_line) != 3 or length < 0:
+                status, response_headers, body = 400, {}, b'Malformed request\n'
+            elif length > MAX_PAYLOAD_SIZE:
+                status, response_headers, body = 413, {}, b'The file is too large\n'
+            else:
+                status, response_headers, body = await self.respond(request_line[0], request_line[1],
+                                                                    await reader.readexactly(length))
+        except (ValueError, asyncio.IncompleteReadError):
+            status, response_headers, body = 400, {}, b'Malformed request\n'
+        except Exception as error:
+            status, response_headers, body = 500, {}, (type(error).__name__ + ': ' + str(error) + '\n').encode()
+        response_headers.setdefault('Content-Type', 'text/plain')
+        response_headers.update({'Content-Length': str(len(body)), 'Connection': 'close'})
+        head = 'HTTP/1.1 {} {}\r\n'.format(status, STATUS_TEXTS[status])
+        head += ''.join('{}: {}\r\n'.format(name, value) for name, value in response_headers.items())
+        try:
+            writer.write(head.encode('latin-1') + b'\r\n' + body)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
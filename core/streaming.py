@@ -0,0 +1,217 @@
+from core.fitness import *
+
+
+class StreamingAccompanist:
+    """
+    Accompaniment of the melody arriving in chunks (e.g. bar by bar from the live feed or the very long file).
+    The chord of the bar is chosen as soon as the bar and lookahead bars after it are complete: the best chords
+    for these bars are found by the dynamic programming (as in DynamicProgrammingSolver) continuing the chords
+    already chosen, and only the first of them is committed (receding horizon). With the default lookahead
+    the window covers the progressions of PROGRESSION_LENGTH chords starting at the bar and right after it
+    (and the repetition bonus of the last of them), that is enough to match the whole melody optimum in practice.
+    The key is determined again from all the notes seen so far before every commit, so only the counts and durations
+    of the pitches and the incomplete bars are stored, and the memory does not grow with the length of the melody
+    """
+    # at most that many tables of transitions are kept (one for every key and set of foreign chords)
+    max_tables = 64
+
+    def __init__(self, generate_rests: bool = False, lookahead: int = PROGRESSION_LENGTH, key_name: str = None):
+        """
+        Constructor of the accompanist
+        :param generate_rests: are rest (silent) chords allowed or not
+        :param lookahead: how many complete bars after the bar are needed to commit its chord
+        :param key_name: the key of the melody, None to determine it online from the notes
+        """
+        self.generate_rests = generate_rests
+        self.lookahead = lookahead
+        self.key = Key(key_name) if key_name is not None else None
+        self.fixed_key = key_name is not None
+        self.first_note = None
+        self.last_note = None
+        self.count_of_notes = dict()
+        self.duration_of_notes = dict()
+        self.latest_start = 0.0
+        self.ending_time = 0.0
+        # rows of the duration matrix (see Melody.calculate_duration_matrix) of the bars not committed yet
+        self.rows = dict()
+        self.next_bar = 0
+        # the last chosen chords (up to PROGRESSION_LENGTH - 1), they are the context of the next window
+        self.context = []
+        self.tables = dict()
+
+    def add_notes(self, notes: list):
+        """
+        Method to add the next notes of the melody, they must go in the order of their starting times
+        :param notes: list of Notes and Rests
+        :return: list of pairs (bar, Chord) committed after these notes
+        """
+        for note in notes:
+            self.latest_start = max(self.latest_start, note.starting_time)
+            self.ending_time = max(self.ending_time, note.starting_time + note.duration)
+            if type(note) == Rest:
+                column = REST_COLUMN
+            else:
+                column = NOTE_NAMES.index(note.pitch)
+                if self.first_note is None:
+                    self.first_note = note.pitch
+                self.last_note = note.pitch
+                self.count_of_notes[note.pitch] = self.count_of_notes.get(note.pitch, 0) + 1
+                self.duration_of_notes[note.pitch] = self.duration_of_notes.get(note.pitch, 0.0) + note.duration
+            for i, duration in Melody.note_durations(note, self.latest_start):
+                if i not in self.rows:
+                    self.rows[i] = np.zeros(REST_COLUMN + 1)
+                self.rows[i][column] += duration
+        # bar i can not get new durations when some note started after i + 1
+        complete_bars = math.ceil(self.latest_start) - 1
+        return self.commit(complete_bars - self.lookahead, complete_bars, False)
+
+    def finish(self, size_in_bars: int = None):
+        """
+        Method to commit the chords of all the remaining bars when the melody is over
+        :param size_in_bars: length of the melody (by default, the end of the last note)
+        :return: list of pairs (bar, Chord)
+        """
+        if size_in_bars is None:
+            size_in_bars = int(self.ending_time)
+        if self.key is None:
+            self.key = Key(NOTE_NAMES[0])
+        return self.commit(size_in_bars, size_in_bars, True)
+
+    def update_key(self):
+        """
+        Method to determine the key by the notes seen so far (see Melody.key_name)
+        :return: None
+        """
+        if self.fixed_key or self.first_note is None:
+            return
+        try:
+            key_name = Melody.key_name(self.first_note, self.last_note, self.count_of_notes,
+                                       self.duration_of_notes)
+        except ValueError:
+            # no key contains all the notes, the previous one is kept
+            return
+        if self.key is None or self.key.name != key_name:
+            self.key = Key(key_name)
+
+    def commit(self, until: int, complete_bars: int, melody_is_over: bool):
+        """
+        Method to choose the chords of the bars before until
+        :param until: the first bar not to commit
+        :param complete_bars: number of bars which can not change any more (the windows end before it)
+        :param melody_is_over: there are no bars after complete_bars
+        :return: list of pairs (bar, Chord)
+        """
+        committed = []
+        if until <= self.next_bar:
+            return committed
+        self.update_key()
+        if self.key is None:
+            return committed
+        while self.next_bar < until:
+            window_end = min(self.next_bar + self.lookahead + 1, complete_bars)
+            rows = np.array([self.rows.get(i, np.zeros(REST_COLUMN + 1)) for i in range(self.next_bar, window_end)])
+            chord = self.best_first_chord(rows, melody_is_over and window_end == complete_bars)
+            committed.append((self.next_bar, chord))
+            self.context = (self.context + [chord])[-(PROGRESSION_LENGTH - 1):]
+            self.rows.pop(self.next_bar, None)
+            self.next_bar += 1
+        return committed
+
+    def chord_properties(self, chords: list, triads: list, note_classes: dict):
+        """
+        Method to get the properties of the chords the fitness depends on, with respect to the current key
+        :param chords: list of Chords
+        :param triads: names of the triads of the key
+        :param note_classes: dictionary of the indices of the note names (new note names are added)
+        :return: list of triples (note class, scale step down from the tonic triad or 7, is rest)
+        """
+        return [(note_classes.setdefault(tuple(chord.note_names), len(note_classes)),
+                 (triads.index(self.key.name) - triads.index(chord.name)) % 7 if chord.name in triads else 7,
+                 chord.note_names[0] == REST) for chord in chords]
+
+    def transition_table(self, symbols: list):
+        """
+        Method to build (or take from the cache) the fitness bonus of the chord d after the chords a, b, c:
+        repetition bonus of c (between b and d) and progression bonus of the window (a, b, c, d)
+        :param symbols: properties of the symbols (see chord_properties), "no chord" is added as the last symbol
+        :return: transition[a, b, c, d] and repetition[a, b, c] arrays
+        """
+        table_key = tuple(symbols)
+        if table_key not in self.tables:
+            if len(self.tables) >= self.max_tables:
+                self.tables.clear()
+            classes, steps, is_rest = (np.array(properties) for properties in zip(*symbols))
+            repetition, progression = FitnessEvaluator.symbol_transitions(classes, steps, is_rest)
+            self.tables[table_key] = (repetition[None, :, :, :] + progression, repetition)
+        return self.tables[table_key]
+
+    def best_first_chord(self, rows: np.ndarray, closes_melody: bool):
+        """
+        Method to find the best chords of the window continuing the context and to get the first of them.
+        Interchangeable chords (equal note names, step and silence) form groups, as in DynamicProgrammingSolver,
+        context chords of the previous keys become separate symbols if they are not equal to any group
+        :param rows: rows of the duration matrix of the window bars
+        :param closes_melody: the window ends with the last bar of the melody
+        :return: the Chord for the first bar of the window
+        """
+        chords = self.key.get_chords(self.generate_rests)
+        triads = [chord.name for chord in chords[:7]]
+        note_classes = dict()
+        properties = self.chord_properties(chords, triads, note_classes)
+        groups = dict()
+        group_of_chord = np.array([groups.setdefault(chord_properties, len(groups))
+                                   for chord_properties in properties])
+        symbols = list(groups)
+        number_of_groups = len(groups)
+        context = []
+        for chord_properties in self.chord_properties(self.context, triads, note_classes):
+            if chord_properties not in groups:
+                groups[chord_properties] = len(groups)
+                symbols.append(chord_properties)
+            context.append(groups[chord_properties])
+        transition, repetition = self.transition_table(symbols)
+        none = len(symbols)
+        number_of_symbols = none + 1
+        context = [none] * (PROGRESSION_LENGTH - 1 - len(context)) + context
+        consonance = rows @ self.key.get_interval_weights(self.generate_rests).T
+        # the most consonant chord of every group in every bar and its consonance (foreign symbols are not allowed)
+        symbol_consonance = np.full((len(rows), number_of_symbols), -np.inf)
+        for group in range(number_of_groups):
+            members = np.flatnonzero(group_of_chord == group)
+            symbol_consonance[:, group] = consonance[:, members].max(axis=1)
+        value = np.full((number_of_symbols,) * 3, -np.inf)
+        value[tuple(context)] = 0.0
+        first = np.zeros((number_of_symbols,) * 3, dtype=int)
+        for bar in range(len(rows)):
+            alive = np.flatnonzero(np.isfinite(value).any(axis=(1, 2)))
+            candidates = value[alive][:, :, :, None] + transition[alive]
+            best = np.argmax(candidates, axis=0)
+            value = np.take_along_axis(candidates, best[None], axis=0)[0]
+            value += CONSONANCE_COEFFICIENT * symbol_consonance[bar][None, None, :]
+            if bar == 0:
+                first = np.broadcast_to(np.arange(number_of_symbols), value.shape).copy()
+            else:
+                first = first[alive[best], np.arange(number_of_symbols)[:, None, None],
+                              np.arange(number_of_symbols)[None, :, None]]
+        if closes_melody:
+            value = value + repetition[None, :, :, none]
+        group = first[np.unravel_index(np.argmax(value), value.shape)]
+        members = np.flatnonzero(group_of_chord == group)
+        return chords[members[np.argmax(consonance[0, members])]]
+
+
+def accompany_stream(chunks, generate_rests: bool = False, lookahead: int = PROGRESSION_LENGTH,
+                     key_name: str = None, size_in_bars: int = None):
+    """
+    Generator of the accompaniment for the melody arriving in chunks (see StreamingAccompanist)
+    :param chunks: iterable of lists of Notes and Rests in the order of their starting times
+    :param generate_rests: are rest (silent) chords allowed or not
+    :param lookahead: how many complete bars after the bar are needed to commit its chord
+    :param key_name: the key of the melody, None to determine it online
+    :param size_in_bars: length of the melody (by default, the end of the last note)
+    :return: yields pairs (bar, Chord) as soon as they are committed
+    """
+    accompanist = StreamingAccompanist(generate_rests, lookahead, key_name)
+    for chunk in chunks:
+        yield from accompanist.add_notes(chunk)
+    yield from accompanist.finish(size_in_bars)
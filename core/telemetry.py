@@ -0,0 +1,160 @@
+import json
+import os
+import time
+
+# Phases of one generation of the evolutionary algorithm measured by the PhaseTimer:
+SELECTION_PHASE = 'selection'
+VARIATION_PHASE = 'variation'
+EVALUATION_PHASE = 'evaluation'
+SURVIVAL_PHASE = 'survival'
+PHASES = [SELECTION_PHASE, VARIATION_PHASE, EVALUATION_PHASE, SURVIVAL_PHASE]
+
+
+class PhaseTimer:
+    """
+    Stopwatch of the generation phases: every lap adds the time since the previous lap (or the start) to the phase
+    """
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.last = None
+
+    def start(self):
+        """
+        Method to start measuring the new generation
+        :return: None
+        """
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        """
+        Method to finish the phase
+        :param phase: name of the phase (one of PHASES)
+        :return: None
+        """
+        now = time.perf_counter()
+        self.seconds[phase] += now - self.last
+        self.last = now
+
+
+class NullTimer:
+    """
+    Timer doing nothing, used when nobody observes the evolution
+    """
+    seconds = dict()
+
+    def start(self):
+        pass
+
+    def lap(self, phase: str):
+        pass
+
+
+class GenerationObserver:
+    """
+    Base class of the observers of the evolutionary algorithm: generation is called once per generation
+    (the zeroth one included) with the dictionary of statistics:
+    generation (number), best, mean and worst fitness of the generation, best_so_far (fitness of the best member
+    found), unique_fraction and bar_entropy (see diversity), evaluations and duplicates (rejected children)
+    of the generation, seconds (time of every phase, see PHASES) and elapsed (seconds since the start of evolution),
+    and the labels of the algorithm (e.g. file for the batch)
+    """
+    def generation(self, statistics: dict):
+        """
+        :param statistics: statistics of the finished generation
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class StatisticsRecorder(GenerationObserver):
+    """
+    Observer keeping the statistics of all the generations in memory, so the worker process can send them
+    to the observers of the parent process (see replay)
+    """
+    def __init__(self):
+        self.statistics = []
+
+    def generation(self, statistics: dict):
+        self.statistics.append(statistics)
+
+
+def replay(statistics: list, observers: list):
+    """
+    Function to pass the recorded statistics of generations to the observers
+    :param statistics: list of statistics (see StatisticsRecorder)
+    :param observers: list of GenerationObservers
+    :return: None
+    """
+    for generation_statistics in statistics:
+        for observer in observers:
+            observer.generation(generation_statistics)
+
+
+class JsonlTraceSink(GenerationObserver):
+    """
+    Observer appending the statistics of every generation as one JSON line to the trace file
+    (the file is opened for every line)
+    """
+    def __init__(self, file_name: str):
+        """
+        :param file_name: name of the trace file
+        """
+        self.file_name = file_name
+
+    def generation(self, statistics: dict):
+        with open(self.file_name, 'a') as trace:
+            trace.write(json.dumps(statistics) + '\n')
+
+
+class PrometheusTextSink(GenerationObserver):
+    """
+    Observer rewriting the file in the Prometheus text exposition format after every generation
+    (e.g. for the node exporter's textfile collector): gauges of the last generation
+    and counters accumulated by this sink (generations, evaluations and seconds of every phase).
+    The counters are kept by the sink object, so it must live in one process: the batch and the island model
+    record the statistics in the workers and pass them to the sinks of the parent process
+    """
+    gauges = [('generation', 'Number of the last finished generation'),
+              ('best', 'Best fitness of the last generation'),
+              ('mean', 'Mean fitness of the last generation'),
+              ('worst', 'Worst fitness of the last generation'),
+              ('best_so_far', 'Fitness of the best member found by the current evolution'),
+              ('unique_fraction', 'Fraction of distinct members of the last generation'),
+              ('bar_entropy', 'Average entropy of the chords in the bars of the last generation, in bits')]
+
+    def __init__(self, file_name: str, prefix: str = 'accompaniment_ea'):
+        """
+        :param file_name: name of the metrics file
+        :param prefix: prefix of the metric names
+        """
+        self.file_name = file_name
+        self.prefix = prefix
+        self.generations = 0
+        self.evaluations = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def generation(self, statistics: dict):
+        self.generations += 1
+        self.evaluations += statistics['evaluations']
+        for phase, seconds in statistics['seconds'].items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        lines = []
+        for name, description in self.gauges:
+            lines += ['# HELP {}_{} {}'.format(self.prefix, name, description),
+                      '# TYPE {}_{} gauge'.format(self.prefix, name),
+                      '{}_{} {}'.format(self.prefix, name, float(statistics[name]))]
+        lines += ['# HELP {}_generations_total Generations performed'.format(self.prefix),
+                  '# TYPE {}_generations_total counter'.format(self.prefix),
+                  '{}_generations_total {}'.format(self.prefix, self.generations),
+                  '# HELP {}_evaluations_total Fitness evaluations performed'.format(self.prefix),
+                  '# TYPE {}_evaluations_total counter'.format(self.prefix),
+                  '{}_evaluations_total {}'.format(self.prefix, self.evaluations),
+                  '# HELP {}_phase_seconds_total Time spent in the phases of the generations'.format(self.prefix),
+                  '# TYPE {}_phase_seconds_total counter'.format(self.prefix)]
+        lines += ['{}_phase_seconds_total{{phase="{}"}} {}'.format(self.prefix, phase, seconds)
+                  for phase, seconds in self.seconds.items()]
+        temporary_file_name = self.file_name + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_file_name, 'w') as metrics:
+            metrics.write('\n'.join(lines) + '\n')
+        os.replace(temporary_file_name, self.file_name)
@@ -1,5 +1,13 @@
-from core.interface import *
-
-
-if __name__ == '__main__':
-    start()
+from core.interface import *
+import sys
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        start_service(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'keys':
+        start_key_analysis(sys.argv[2:])
+    elif len(sys.argv) > 1:
+        start_batch(sys.argv[1:])
+    else:
+        start()